@@ -0,0 +1,219 @@
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, AsyncGenerator, Dict, Generator, List, Optional
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.base.response.schema import RESPONSE_TYPE, AsyncStreamingResponse, Response, StreamingResponse
+from llama_index.core.schema import NodeWithScore
+
+
+@dataclass
+class CachedAnswer:
+    """
+    An answer stored in the `SemanticAnswerCache`.
+
+    :param np.ndarray embedding: The normalized embedding of the question.
+    :param str filters_key: The canonical form of the retriever filters active for the question.
+    :param str response: The text of the answer.
+    :param list[NodeWithScore] source_nodes: The nodes the answer was synthesized from.
+    :param float created_at: The time at which the answer was stored.
+    """
+
+    embedding: np.ndarray
+    filters_key: str
+    response: str
+    source_nodes: List[NodeWithScore]
+    created_at: float
+
+
+class SemanticAnswerCache:
+    """
+    A cache of answers looked up by the embedding similarity of their questions.
+
+    A question is a hit when a stored question asked with the same retriever filters has a cosine
+    similarity of at least `similarity_threshold`. Entries expire after `ttl` seconds, and the least
+    recently used entries are evicted beyond `max_entries`.
+
+    :param BaseEmbedding embed_model: The model used to embed questions, normally the retriever's.
+    :param float similarity_threshold: The minimum cosine similarity for a hit.
+    :param float ttl: The time to live of an entry in seconds.
+    :param int max_entries: The maximum number of entries.
+    """
+
+    def __init__(
+        self,
+        embed_model: BaseEmbedding,
+        similarity_threshold: float = 0.95,
+        ttl: float = 24 * 3600,
+        max_entries: int = 1000,
+    ):
+        self._embed_model = embed_model
+        self._similarity_threshold = similarity_threshold
+        self._ttl = ttl
+        self._max_entries = max_entries
+        self._entries: "OrderedDict[int, CachedAnswer]" = OrderedDict()
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def _filters_key(filters: Optional[Dict[str, Any]]) -> str:
+        return json.dumps(filters or {}, sort_keys=True, default=str)
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    @property
+    def embed_model(self) -> BaseEmbedding:
+        """
+        The model used to embed questions.
+
+        :returns: The embedding model.
+        """
+        return self._embed_model
+
+    def embed(self, query_str: str) -> List[float]:
+        """
+        Embed a question with the cache's embedding model.
+
+        :param str query_str: The question.
+        :returns: The query embedding.
+        """
+        return self._embed_model.get_query_embedding(query_str)
+
+    async def aembed(self, query_str: str) -> List[float]:
+        """
+        Asynchronously embed a question with the cache's embedding model.
+
+        :param str query_str: The question.
+        :returns: The query embedding.
+        """
+        return await self._embed_model.aget_query_embedding(query_str)
+
+    def lookup(self, embedding: List[float], filters: Optional[Dict[str, Any]] = None) -> Optional[CachedAnswer]:
+        """
+        Find the most similar stored question asked with the same filters.
+
+        :param list[float] embedding: The embedding of the question.
+        :param dict filters: The retriever filters active for the question.
+        :returns: The cached answer on a hit, otherwise None.
+        """
+        query = self._normalize(embedding)
+        filters_key = self._filters_key(filters)
+        with self._lock:
+            self._expire()
+            best_id, best_score = None, self._similarity_threshold
+            for entry_id, entry in self._entries.items():
+                if entry.filters_key != filters_key:
+                    continue
+                score = float(entry.embedding @ query)
+                if score >= best_score:
+                    best_id, best_score = entry_id, score
+            if best_id is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(best_id)
+            return self._entries[best_id]
+
+    def _expire(self) -> None:
+        deadline = time.time() - self._ttl
+        expired = [entry_id for entry_id, entry in self._entries.items() if entry.created_at < deadline]
+        for entry_id in expired:
+            del self._entries[entry_id]
+        self.expirations += len(expired)
+
+    def _store(self, embedding: List[float], filters: Optional[Dict[str, Any]], text: str, source_nodes: List[NodeWithScore]) -> None:
+        entry = CachedAnswer(
+            embedding=self._normalize(embedding),
+            filters_key=self._filters_key(filters),
+            response=text,
+            source_nodes=source_nodes,
+            created_at=time.time(),
+        )
+        with self._lock:
+            self._entries[self._next_id] = entry
+            self._next_id += 1
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def record(self, embedding: List[float], filters: Optional[Dict[str, Any]], response: RESPONSE_TYPE) -> RESPONSE_TYPE:
+        """
+        Store the answer to a question. Streaming responses are stored once their stream is fully consumed.
+
+        :param list[float] embedding: The embedding of the question.
+        :param dict filters: The retriever filters active for the question.
+        :param response: The generated response.
+        :returns: The response, with its stream wrapped if it is a streaming response.
+        """
+        if isinstance(response, Response):
+            if response.response is not None:
+                self._store(embedding, filters, response.response, response.source_nodes)
+        elif isinstance(response, StreamingResponse) and response.response_gen is not None:
+            response.response_gen = self._tee(response.response_gen, embedding, filters, response.source_nodes)
+        elif isinstance(response, AsyncStreamingResponse) and response.response_gen is not None:
+            response.response_gen = self._atee(response.response_gen, embedding, filters, response.source_nodes)
+        return response
+
+    def _tee(self, tokens: Generator[str, None, None], embedding: List[float], filters: Optional[Dict[str, Any]], source_nodes: List[NodeWithScore]) -> Generator[str, None, None]:
+        parts = []
+        for token in tokens:
+            parts.append(token)
+            yield token
+        self._store(embedding, filters, "".join(parts), source_nodes)
+
+    async def _atee(self, tokens: AsyncGenerator[str, None], embedding: List[float], filters: Optional[Dict[str, Any]], source_nodes: List[NodeWithScore]) -> AsyncGenerator[str, None]:
+        parts = []
+        async for token in tokens:
+            parts.append(token)
+            yield token
+        self._store(embedding, filters, "".join(parts), source_nodes)
+
+    @staticmethod
+    async def _agenerate(tokens: List[str]) -> AsyncGenerator[str, None]:
+        for token in tokens:
+            yield token
+
+    @classmethod
+    def replay(cls, entry: CachedAnswer, streaming: bool, asynchronous: bool = False) -> RESPONSE_TYPE:
+        """
+        Build a response from a cached answer.
+
+        :param CachedAnswer entry: The cached answer.
+        :param bool streaming: Whether to replay the answer as a stream.
+        :param bool asynchronous: Whether a streamed answer is replayed as an async stream.
+        :returns: The response.
+        """
+        metadata = {"answer_cache": "hit"}
+        if streaming:
+            tokens = re.findall(r"\s*\S+", entry.response)
+            if asynchronous:
+                return AsyncStreamingResponse(response_gen=cls._agenerate(tokens), source_nodes=entry.source_nodes, metadata=metadata)
+            return StreamingResponse(response_gen=iter(tokens), source_nodes=entry.source_nodes, metadata=metadata)
+        return Response(response=entry.response, source_nodes=entry.source_nodes, metadata=metadata)
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Get the cache metrics.
+
+        :returns: The number of entries, hits, misses, evictions, expirations and the hit rate.
+        """
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,639 @@
+"""
+Offline latency and quality benchmark replaying `movies_qa_sample.csv` through the retriever and query engine.
+
+Every configuration in the grid of `similarity_top_k`, chunking, response mode, backend and query mode is indexed into a
+`LocalVectorStore` with deterministic `HashingEmbedding` embeddings and answered by a `StubLLM`, so the run
+needs no network access. For each configuration it reports retrieval recall@k of the movie named in the
+question, per-stage latency percentiles, the synthesizer setup time of the first and later questions, LLM
+calls and tokens per question, and QPS under concurrent clients.
+With `--metadata-filters on`, filters extracted by a `MovieMetadataIndex` are applied before retrieval, and the
+report adds the mean candidate-set size and the share of questions answered without a dense search;
+`--attribute-questions` adds generated questions such as "Which drama movies released in 2015 are rated above 7.0?".
+With `--chat-turns`, a long session is also replayed through the condense-question chat engine with its default
+memory and with `CompactingChatMemory`, reporting the prompt tokens of the condense step on every turn.
+With `--shortlist-dimensions`, two-stage retrieval is benchmarked: a truncated copy of the embeddings is searched
+first and the `--shortlist-k` best nodes are rescored with the full vectors. The report adds the overlap of the
+retrieved nodes with exact single-stage search and the memory of the full vectors and of the shortlist copy.
+With `--batch-concurrency`, the questions are also answered by `query_batch` and by a sequential `custom_query`
+loop, with the simulated `--embed-latency` and `--llm-latency`, reporting wall time, QPS and model calls of both.
+With `--normalise-rows`, the metadata of that many rows (the dataset repeated) is normalised column-wise by
+`DataLoader` and row by row by its previous per-row implementation, reporting the time of both.
+With `--ingest-workers`, the dataset is split into nodes with each number of worker processes, reporting the
+ingestion time and speedup over one process and checking that the nodes match the serial output. These two
+ingestion benchmarks run before the query grid, and `--skip-grid` runs them alone.
+
+Usage:
+    python -m src.benchmark --data data/data.csv --qa data/movies_qa_sample.csv --top-k 5 15 --response-mode compact tree_summarize
+"""
+import argparse
+import asyncio
+import csv
+import itertools
+import json
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+from llama_index.core import QueryBundle, Settings
+from llama_index.core.callbacks import CallbackManager
+from llama_index.core.chat_engine.types import ChatMode
+from src.chat_engine import get_chat_engine
+from src.chat_memory import CompactingChatMemory
+from src.bm25_index import BM25Index, BM25IndexBuilder
+from src.context_packer import MovieContextPacker
+from src.data_indexer import DataIndexer
+from src.data_loader import DATE_COLUMNS, DataLoader
+from src.instrumentation import metrics
+from src.local_vector_store import LocalVectorStore
+from src.metadata_index import MovieMetadataIndex
+from src.offline_models import HashingEmbedding, StubLLM, whitespace_tokenizer
+from src.pinecone_retriever import PineconeRetriever
+from src.query_engine import EnhancedQueryEngine
+
+
+METADATA_COLUMNS = [
+    'title', 'directors', 'averageRating', 'revenue', 'runtime', 'original_language', 'cast', 'genres',
+    'spoken_languages', 'production_companies', 'release_year', 'release_month', 'release_day',
+]
+QUESTION_PREFIX = "In the movie "
+
+
+@dataclass(frozen=True)
+class BenchmarkConfig:
+    """
+    One point of the benchmark grid.
+    """
+
+    similarity_top_k: int = 15
+    chunk_size: int = 1024
+    chunk_overlap: int = 64
+    response_mode: str = "tree_summarize"
+    backend: str = "local"
+    query_mode: str = "default"
+    metadata_filters: bool = False
+    shortlist_dimensions: int = 0
+
+
+def load_questions(qa_path: str, titles: List[str]) -> List[Tuple[str, str]]:
+    """
+    Load the QA sample and recover the movie each question is about.
+
+    Questions are built as "In the movie <title>, <question>"; since titles may contain commas, the
+    longest known title followed by a comma is taken.
+
+    :param str qa_path: The path of `movies_qa_sample.csv`.
+    :param list[str] titles: The titles of the indexed movies.
+    :returns: The (question, title) pairs whose title could be recovered.
+    """
+    known = sorted(set(titles), key=len, reverse=True)
+    questions = []
+    for question in pd.read_csv(qa_path)["question"]:
+        rest = question[len(QUESTION_PREFIX):] if question.startswith(QUESTION_PREFIX) else ""
+        title = next((title for title in known if rest.startswith(f"{title},")), None)
+        if title is not None:
+            questions.append((question, title))
+    return questions
+
+
+def load_attribute_questions(data_path: str, count: int, seed: int = 0) -> List[Tuple[str, str]]:
+    """
+    Generate attribute questions combining a genre, a release year and a rating threshold satisfied by a sampled movie.
+
+    :param str data_path: The path of the movie dataset.
+    :param int count: The number of questions.
+    :param int seed: The seed of the movie sample.
+    :returns: The (question, title) pairs.
+    """
+    if count <= 0:
+        return []
+    movies = pd.read_csv(data_path, usecols=["title", "genres", "release_year", "averageRating"]).dropna()
+    movies = movies.sample(n=min(count, len(movies)), random_state=seed)
+    return [
+        (
+            f"Which {str(genres).split(',')[0].strip().lower()} movies released in {int(year)} "
+            f"are rated above {rating - 0.5:.1f}?",
+            str(title),
+        )
+        for title, genres, year, rating in movies[["title", "genres", "release_year", "averageRating"]].itertuples(index=False)
+    ]
+
+
+def build_store(
+    args: argparse.Namespace,
+    config: BenchmarkConfig,
+    embed_model: HashingEmbedding,
+) -> Tuple[LocalVectorStore, BM25Index, MovieMetadataIndex]:
+    """
+    Ingest and index the dataset into a local vector store with the configuration's chunking and backend,
+    building the BM25 index of hybrid mode and the metadata index from the same nodes.
+
+    :param argparse.Namespace args: The command-line arguments.
+    :param BenchmarkConfig config: The configuration.
+    :param HashingEmbedding embed_model: The embedding model.
+    :returns: The populated vector store, BM25 index and metadata index.
+    """
+    loader = DataLoader(
+        args.data,
+        args.text_column,
+        METADATA_COLUMNS,
+        chunk_size=config.chunk_size,
+        chunk_overlap=config.chunk_overlap,
+        id_column="imdb_id",
+    )
+    store = LocalVectorStore()
+    indexer = DataIndexer(
+        dataset_name="movies",
+        embedding_dimension=embed_model.dimensions,
+        embed_model=embed_model,
+        vector_store=store,
+    )
+    bm25_builder = BM25IndexBuilder()
+    nodes = []
+
+    def batches():
+        for batch in loader.iter_nodes():
+            bm25_builder.add(batch)
+            nodes.extend(batch)
+            yield batch
+
+    indexer.add_to_vector_store(
+        indexer.embed_batches(batches(), batch_size=100, num_workers=4),
+        batch_size=500,
+    )
+    if config.backend == "local-ivf":
+        store.build_ivf(n_lists=args.ivf_lists)
+    return store, bm25_builder.build(), MovieMetadataIndex.from_nodes(nodes)
+
+
+def stage_percentiles() -> Dict[str, Dict[str, Optional[float]]]:
+    """
+    Collect the latency percentiles of every recorded stage.
+
+    :returns: The p50, p95 and p99 latency in seconds per stage.
+    """
+    return {
+        row["stage"]: {"p50": row["p50"], "p95": row["p95"], "p99": row["p99"]}
+        for row in metrics.snapshot()
+        if row["metric"] == "seconds"
+    }
+
+
+def llm_totals() -> Dict[str, float]:
+    """
+    Sum the LLM calls and tokens recorded across all stages.
+
+    :returns: The number of LLM calls, prompt tokens and completion tokens.
+    """
+    totals = {"llm_calls": 0, "prompt_tokens": 0.0, "completion_tokens": 0.0}
+    for row in metrics.snapshot():
+        if not row["stage"].endswith(".llm"):
+            continue
+        if row["metric"] == "seconds":
+            totals["llm_calls"] += row["count"]
+        elif row["metric"] in ("prompt_tokens", "completion_tokens"):
+            totals[row["metric"]] += row["sum"]
+    return totals
+
+
+async def measure_qps(engine: EnhancedQueryEngine, questions: List[str], clients: int) -> float:
+    """
+    Replay the questions through `acustom_query` from a number of concurrent clients.
+
+    :param EnhancedQueryEngine engine: The query engine.
+    :param list[str] questions: The questions to replay.
+    :param int clients: The number of concurrent clients.
+    :returns: The number of questions answered per second.
+    """
+    queue = list(questions)
+
+    async def client() -> None:
+        while queue:
+            await engine.acustom_query(queue.pop())
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(clients)))
+    return len(questions) / (time.perf_counter() - start)
+
+
+def shortlist_overlap(
+    store: LocalVectorStore,
+    embed_model: HashingEmbedding,
+    questions: List[Tuple[str, str]],
+    top_k: int,
+    shortlist_k: int,
+) -> float:
+    """
+    Measure how many of the nodes found by exact search two-stage search also finds.
+
+    :param LocalVectorStore store: The vector store, with a shortlist copy built.
+    :param HashingEmbedding embed_model: The embedding model.
+    :param list questions: The (question, title) pairs.
+    :param int top_k: The number of nodes retrieved.
+    :param int shortlist_k: The number of nodes kept by the first stage.
+    :returns: The mean share of the exact top-k nodes retrieved by two-stage search.
+    """
+    exact = PineconeRetriever(vector_store=store, embed_model=embed_model, similarity_top_k=top_k)
+    two_stage = PineconeRetriever(vector_store=store, embed_model=embed_model, similarity_top_k=top_k, shortlist_k=shortlist_k)
+    overlaps = []
+    for question, _ in questions:
+        query_bundle = QueryBundle(question, embedding=embed_model.get_query_embedding(question))
+        expected = {node.node.node_id for node in exact.retrieve(query_bundle)}
+        found = {node.node.node_id for node in two_stage.retrieve(query_bundle)}
+        overlaps.append(len(expected & found) / len(expected) if expected else 1.0)
+    return sum(overlaps) / len(overlaps) if overlaps else 1.0
+
+
+def run_config(
+    args: argparse.Namespace,
+    config: BenchmarkConfig,
+    store: LocalVectorStore,
+    bm25_index: BM25Index,
+    metadata_index: MovieMetadataIndex,
+    embed_model: HashingEmbedding,
+    questions: List[Tuple[str, str]],
+) -> Dict[str, Any]:
+    """
+    Benchmark one configuration.
+
+    :param argparse.Namespace args: The command-line arguments.
+    :param BenchmarkConfig config: The configuration.
+    :param LocalVectorStore store: The vector store indexed for the configuration.
+    :param BM25Index bm25_index: The BM25 index used in hybrid mode.
+    :param MovieMetadataIndex metadata_index: The metadata index used when filters are extracted.
+    :param HashingEmbedding embed_model: The embedding model.
+    :param list questions: The (question, title) pairs.
+    :returns: The report row of the configuration.
+    """
+    overlap = 1.0
+    if config.shortlist_dimensions:
+        store.build_shortlist(config.shortlist_dimensions, quantize=args.shortlist_int8)
+        overlap = shortlist_overlap(store, embed_model, questions, config.similarity_top_k, args.shortlist_k)
+
+    llm = StubLLM(
+        latency=args.llm_latency,
+        context_window=args.context_window,
+        callback_manager=CallbackManager([metrics.callback_handler(tokenizer=whitespace_tokenizer)]),
+    )
+    retriever = PineconeRetriever(
+        vector_store=store,
+        embed_model=embed_model,
+        query_mode=config.query_mode,
+        similarity_top_k=config.similarity_top_k,
+        bm25_index=bm25_index,
+        metadata_index=metadata_index if config.metadata_filters else None,
+        shortlist_k=args.shortlist_k if config.shortlist_dimensions else None,
+    )
+    engine = EnhancedQueryEngine(
+        retriever=retriever,
+        llm=llm,
+        streaming=False,
+        response_mode=config.response_mode,
+        node_postprocessors=[MovieContextPacker(token_budget=args.context_budget)] if args.context_budget else [],
+    )
+
+    metrics.reset()
+    hits = 0
+    setup = []
+    for question, title in questions:
+        with metrics.request("query"):
+            response = engine.custom_query(question)
+        hits += any(node.node.metadata.get("title") == title for node in response.source_nodes)
+        setup.append(engine.last_timings["synthesizer_setup"])
+    report = {
+        **asdict(config),
+        "questions": len(questions),
+        "recall@k": hits / len(questions) if questions else 0.0,
+        "overlap@k": overlap,
+        "vector_bytes": store.nbytes["vectors"],
+        "shortlist_bytes": store.nbytes["shortlist"] if config.shortlist_dimensions else 0,
+        "stages": stage_percentiles(),
+    }
+    analysis = {row["metric"]: row for row in metrics.snapshot() if row["stage"] == "query_analysis"}
+    direct = [row for row in metrics.snapshot() if row["stage"] == "direct_fetch" and row["metric"] == "seconds"]
+    report["candidates_per_question"] = (
+        analysis["candidates"]["sum"] / analysis["candidates"]["count"] if "candidates" in analysis else len(metadata_index)
+    )
+    report["direct_fetch_rate"] = direct[0]["count"] / len(questions) if direct and questions else 0.0
+    totals = llm_totals()
+    if questions and not (totals["llm_calls"] and totals["prompt_tokens"]):
+        raise RuntimeError("No LLM calls or tokens were recorded; is the instrumentation handler still attached to the LLM?")
+    report["synthesizer_setup_ms.first"] = setup[0] * 1000 if setup else 0.0
+    report["synthesizer_setup_ms.mean_after_first"] = sum(setup[1:]) * 1000 / max(1, len(setup) - 1)
+    report["llm_calls_per_question"] = totals["llm_calls"] / max(1, len(questions))
+    report["tokens_per_question"] = (totals["prompt_tokens"] + totals["completion_tokens"]) / max(1, len(questions))
+    for clients in args.clients:
+        report[f"qps@{clients}"] = asyncio.run(measure_qps(engine, [q for q, _ in questions], clients))
+    retriever.close()
+    return report
+
+
+def measure_chat_growth(
+    args: argparse.Namespace,
+    store: LocalVectorStore,
+    embed_model: HashingEmbedding,
+    questions: List[Tuple[str, str]],
+) -> Dict[str, Any]:
+    """
+    Replay one long chat session through the condense-question chat engine, with its default memory
+    and with `CompactingChatMemory`, and record the prompt tokens of the condense step of every turn.
+
+    :param argparse.Namespace args: The command-line arguments.
+    :param LocalVectorStore store: The vector store to query.
+    :param HashingEmbedding embed_model: The embedding model.
+    :param list questions: The (question, title) pairs asked in turn.
+    :returns: The report row of the session.
+    """
+    report: Dict[str, Any] = {"chat_turns": args.chat_turns, "memory_tokens": args.memory_tokens}
+    for name in ("default", "compacting"):
+        llm = StubLLM(
+            latency=args.llm_latency,
+            callback_manager=CallbackManager([metrics.callback_handler(tokenizer=whitespace_tokenizer)]),
+        )
+        engine = EnhancedQueryEngine(
+            retriever=PineconeRetriever(vector_store=store, embed_model=embed_model),
+            llm=llm,
+            streaming=False,
+        )
+        memory = CompactingChatMemory.from_defaults(llm=llm, token_limit=args.memory_tokens) if name == "compacting" else None
+        chat_engine = get_chat_engine(ChatMode.CONDENSE_QUESTION, llm=llm, query_engine=engine, memory=memory)
+
+        metrics.reset()
+        previous = 0.0
+        series = []
+        for turn in range(1, args.chat_turns + 1):
+            with metrics.request("chat"):
+                chat_engine.chat(questions[(turn - 1) % len(questions)][0])
+            total = next(
+                (row["sum"] for row in metrics.snapshot() if row["metric"] == "prompt_tokens" and row["stage"] == "chat.llm"),
+                0.0,
+            )
+            series.append(total - previous)
+            previous = total
+        if args.chat_turns > 1 and not any(series[1:]):
+            raise RuntimeError("No condense-step prompt tokens were recorded; is the instrumentation handler still attached to the LLM?")
+        report[f"{name}.prompt_tokens_per_turn"] = series
+        report[f"{name}.max_prompt_tokens"] = max(series, default=0.0)
+        if memory is not None:
+            report[f"{name}.compactions"] = memory.compactions
+    report["stages"] = stage_percentiles()
+    return report
+
+
+def measure_batch(
+    args: argparse.Namespace,
+    store: LocalVectorStore,
+    embed_model: HashingEmbedding,
+    questions: List[Tuple[str, str]],
+) -> Dict[str, Any]:
+    """
+    Answer the questions with a sequential `custom_query` loop and with `query_batch`, and compare wall time,
+    QPS and the number of embedding and LLM calls.
+
+    :param argparse.Namespace args: The command-line arguments.
+    :param LocalVectorStore store: The vector store to query.
+    :param HashingEmbedding embed_model: The embedding model.
+    :param list questions: The (question, title) pairs.
+    :returns: The report row of the comparison.
+    """
+    report: Dict[str, Any] = {"batch_concurrency": args.batch_concurrency, "questions": len(questions)}
+    texts = [question for question, _ in questions]
+    for name in ("sequential", "batch"):
+        llm = StubLLM(
+            latency=args.llm_latency,
+            callback_manager=CallbackManager([metrics.callback_handler(tokenizer=whitespace_tokenizer)]),
+        )
+        engine = EnhancedQueryEngine(
+            retriever=PineconeRetriever(vector_store=store, embed_model=embed_model),
+            llm=llm,
+            streaming=False,
+        )
+        metrics.reset()
+        embed_calls = embed_model.calls
+        start = time.perf_counter()
+        if name == "sequential":
+            for text in texts:
+                engine.custom_query(text)
+        else:
+            for _ in engine.query_batch(texts, concurrency=args.batch_concurrency):
+                pass
+        seconds = time.perf_counter() - start
+        report[f"{name}.seconds"] = seconds
+        report[f"{name}.qps"] = len(texts) / seconds if seconds else 0.0
+        report[f"{name}.embedding_calls"] = embed_model.calls - embed_calls
+        report[f"{name}.llm_calls"] = llm.calls
+    report["unique_questions"] = next(
+        (row["sum"] for row in metrics.snapshot() if row["stage"] == "batch_embedding" and row["metric"] == "unique_questions"),
+        len(texts),
+    )
+    report["stages"] = stage_percentiles()
+    return report
+
+
+def process_metadata_per_row(row: Dict[str, Any], columns: List[str]) -> Dict[str, Any]:
+    """
+    The per-row `DataLoader._process_metadata` that column-wise normalisation replaced, unchanged apart
+    from taking the metadata columns as an argument, as the baseline of `measure_normalisation`. It only
+    splits the list-valued columns and passes other values through.
+
+    :param dict row: The raw CSV row.
+    :param list[str] columns: The metadata columns.
+    :returns: The processed metadata.
+    """
+    metadata = {}
+    for col in columns:
+        if col == 'cast':
+            if pd.notnull(row[col]):
+                metadata[col] = row[col].split(',')[:15]
+            else:
+                metadata[col] = []
+        elif col in ['spoken_languages', 'directors', 'genres', 'production_companies']:
+            if pd.notnull(row[col]):
+                metadata[col] = row[col].split(',')
+            else:
+                metadata[col] = []
+        else:
+            metadata[col] = row[col]
+    return metadata
+
+
+def measure_normalisation(args: argparse.Namespace) -> Dict[str, Any]:
+    """
+    Process the metadata of `--normalise-rows` rows column-wise with `DataLoader` and row by row with the
+    previous implementation, `process_metadata_per_row`, and compare their wall time. The baseline does
+    less work (no trimming, numeric coercion or date encoding), so the speedup is a lower bound.
+
+    :param argparse.Namespace args: The command-line arguments.
+    :returns: The report row of the comparison.
+    """
+    columns = [col for col in pd.read_csv(args.data, nrows=0).columns if col in METADATA_COLUMNS or col in DATE_COLUMNS]
+    data = pd.read_csv(args.data, usecols=columns)
+    data = data.iloc[np.arange(args.normalise_rows) % len(data)].reset_index(drop=True)
+    loader = DataLoader(args.data, args.text_column, columns)
+    start = time.perf_counter()
+    column_wise = loader._process_metadata(data)
+    column_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    per_row = [process_metadata_per_row(row, columns) for row in data[columns].to_dict("records")]
+    row_seconds = time.perf_counter() - start
+    return {
+        "normalise_rows": len(data),
+        "normalise.per_row_seconds": row_seconds,
+        "normalise.column_wise_seconds": column_seconds,
+        "normalise.speedup": row_seconds / column_seconds if column_seconds else 0.0,
+        "normalise.rows_processed": min(len(column_wise), len(per_row)),
+        "stages": {},
+    }
+
+
+def measure_ingestion(args: argparse.Namespace) -> Dict[str, Any]:
+    """
+    Ingest the dataset with each `--ingest-workers` number of node-parsing processes, with the first chunking
+    of the grid, and compare the wall time and the nodes with single-process ingestion.
+
+    :param argparse.Namespace args: The command-line arguments.
+    :returns: The report row of the comparison.
+    """
+    chunk_size, chunk_overlap = (int(value) for value in args.chunking[0].split(":"))
+    report: Dict[str, Any] = {"ingest_workers": args.ingest_workers}
+    serial = None
+    for workers in sorted(set([1, *args.ingest_workers])):
+        loader = DataLoader(
+            args.data, args.text_column, METADATA_COLUMNS, chunk_size=chunk_size, chunk_overlap=chunk_overlap,
+            id_column="imdb_id", num_workers=workers,
+        )
+        start = time.perf_counter()
+        nodes = loader.ingest_data()
+        seconds = time.perf_counter() - start
+        summary = [(node.node_id, node.text, node.metadata, node.relationships) for node in nodes]
+        if serial is None:
+            serial, serial_seconds = summary, seconds
+        report[f"ingest.seconds@{workers}"] = seconds
+        report[f"ingest.speedup@{workers}"] = serial_seconds / seconds if seconds else 0.0
+        report[f"ingest.identical@{workers}"] = summary == serial
+    report["ingest.nodes"] = len(serial)
+    report["stages"] = {}
+    return report
+
+
+def write_report(reports: List[Dict[str, Any]], path: str) -> None:
+    """
+    Write the reports as JSON, or as CSV with flattened stage percentiles when the path ends in ".csv".
+
+    :param list reports: The report rows.
+    :param str path: The output path.
+    """
+    if not path.endswith(".csv"):
+        with open(path, "w") as f:
+            json.dump(reports, f, indent=2)
+        return
+    rows = []
+    for report in reports:
+        row = {key: value for key, value in report.items() if key != "stages"}
+        for stage, percentiles in report["stages"].items():
+            for name, value in percentiles.items():
+                row[f"{stage}.{name}"] = value
+        rows.append(row)
+    fieldnames = list(dict.fromkeys(key for row in rows for key in row))
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data", default="data/data.csv", help="Path of the movie dataset.")
+    parser.add_argument("--qa", default="data/movies_qa_sample.csv", help="Path of the QA sample.")
+    parser.add_argument("--text-column", default="plot_summary", help="Column holding the plot text.")
+    parser.add_argument("--top-k", type=int, nargs="+", default=[15], help="Values of similarity_top_k.")
+    parser.add_argument("--chunking", nargs="+", default=["1024:64"], help="chunk_size:chunk_overlap pairs.")
+    parser.add_argument("--response-mode", nargs="+", default=["tree_summarize"], help="Response modes.")
+    parser.add_argument("--backend", nargs="+", default=["local"], choices=["local", "local-ivf"], help="Vector store backends.")
+    parser.add_argument("--query-mode", nargs="+", default=["default"], choices=["default", "hybrid"], help="Retriever query modes.")
+    parser.add_argument("--metadata-filters", nargs="+", default=["off"], choices=["off", "on"], help="Extract metadata filters from questions.")
+    parser.add_argument("--attribute-questions", type=int, default=0, help="Number of generated attribute questions to add.")
+    parser.add_argument("--shortlist-dimensions", type=int, nargs="+", default=[0], help="Shortlist dimensions of two-stage retrieval (0 for single stage).")
+    parser.add_argument("--shortlist-k", type=int, default=200, help="Nodes kept by the first stage of two-stage retrieval.")
+    parser.add_argument("--shortlist-int8", action="store_true", help="Quantise the shortlist copy to int8.")
+    parser.add_argument("--context-budget", type=int, default=None, help="Pack context per movie into this many tokens.")
+    parser.add_argument("--chat-turns", type=int, default=0, help="Replay a chat session of this many turns.")
+    parser.add_argument("--memory-tokens", type=int, default=1500, help="Token limit of the compacting chat memory.")
+    parser.add_argument("--batch-concurrency", type=int, default=0, help="Compare query_batch with this concurrency to a sequential loop (0 to skip).")
+    parser.add_argument("--normalise-rows", type=int, default=0, help="Compare column-wise and row-wise metadata normalisation on this many rows (0 to skip).")
+    parser.add_argument("--ingest-workers", type=int, nargs="*", default=[], help="Compare ingestion with these numbers of node-parsing processes to one.")
+    parser.add_argument("--skip-grid", action="store_true", help="Skip the query benchmarks, e.g. to only run --normalise-rows and --ingest-workers.")
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 8], help="Concurrent clients for the QPS test.")
+    parser.add_argument("--limit", type=int, default=None, help="Maximum number of questions.")
+    parser.add_argument("--dimensions", type=int, default=1024, help="Embedding dimensions.")
+    parser.add_argument("--ivf-lists", type=int, default=64, help="Inverted lists for the local-ivf backend.")
+    parser.add_argument("--embed-latency", type=float, default=0.0, help="Simulated embedding latency in seconds.")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Simulated LLM latency in seconds.")
+    parser.add_argument("--context-window", type=int, default=128000, help="Context window of the simulated LLM, which decides how many calls a response mode makes.")
+    parser.add_argument("--whitespace-tokenizer", action="store_true", help="Count tokens by whitespace instead of tiktoken.")
+    parser.add_argument("--output", default=None, help="Write the report to this .json or .csv path.")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    args = parse_args(argv)
+    if args.whitespace_tokenizer:
+        Settings.tokenizer = whitespace_tokenizer
+    metrics.enable()
+    reports = []
+    if args.normalise_rows:
+        report = measure_normalisation(args)
+        reports.append(report)
+        print(json.dumps({k: v for k, v in report.items() if k != "stages"}))
+
+    if args.ingest_workers:
+        report = measure_ingestion(args)
+        reports.append(report)
+        print(json.dumps({k: v for k, v in report.items() if k != "stages"}))
+
+    if args.skip_grid:
+        if args.output:
+            write_report(reports, args.output)
+        return reports
+
+    embed_model = HashingEmbedding(dimensions=args.dimensions, latency=args.embed_latency)
+    titles = pd.read_csv(args.data, usecols=["title"])["title"].dropna().astype(str).tolist()
+    questions = load_questions(args.qa, titles)[:args.limit] + load_attribute_questions(args.data, args.attribute_questions)
+
+    stores: Dict[Tuple[int, int, str], Tuple[LocalVectorStore, BM25Index, MovieMetadataIndex]] = {}
+    chunkings = [tuple(int(value) for value in chunking.split(":")) for chunking in args.chunking]
+    for top_k, (chunk_size, chunk_overlap), response_mode, backend, query_mode, metadata_filters, shortlist_dimensions in itertools.product(
+        args.top_k, chunkings, args.response_mode, args.backend, args.query_mode, args.metadata_filters,
+        args.shortlist_dimensions,
+    ):
+        config = BenchmarkConfig(
+            top_k, chunk_size, chunk_overlap, response_mode, backend, query_mode, metadata_filters == "on",
+            shortlist_dimensions,
+        )
+        key = (chunk_size, chunk_overlap, backend)
+        if key not in stores:
+            stores[key] = build_store(args, config, embed_model)
+        store, bm25_index, metadata_index = stores[key]
+        report = run_config(args, config, store, bm25_index, metadata_index, embed_model, questions)
+        reports.append(report)
+        print(json.dumps({k: v for k, v in report.items() if k != "stages"}))
+
+    if args.chat_turns and questions:
+        store, _, _ = next(iter(stores.values()))
+        report = measure_chat_growth(args, store, embed_model, questions)
+        reports.append(report)
+        print(json.dumps({k: v for k, v in report.items() if k != "stages"}))
+
+    if args.batch_concurrency and questions:
+        store, _, _ = next(iter(stores.values()))
+        report = measure_batch(args, store, embed_model, questions)
+        reports.append(report)
+        print(json.dumps({k: v for k, v in report.items() if k != "stages"}))
+
+    if args.output:
+        write_report(reports, args.output)
+    return reports
+
+
+if __name__ == "__main__":
+    main()
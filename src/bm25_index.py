@@ -0,0 +1,238 @@
+import json
+import math
+import os
+import re
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from llama_index.core.schema import NodeWithScore, TextNode
+from llama_index.core.vector_stores.utils import metadata_dict_to_node, node_to_metadata_dict
+from src.local_vector_store import filter_mask, metadata_column
+
+
+INDEXED_METADATA = ['title', 'cast', 'directors']
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split text into lowercased word tokens.
+
+    :param str text: The text to tokenize.
+    :returns: The tokens.
+    """
+    return re.findall(r"\w+", text.lower())
+
+
+def _node_tokens(node: TextNode) -> List[str]:
+    """
+    Tokenize the plot text of a node together with its title, cast and directors.
+
+    :param TextNode node: The node.
+    :returns: The tokens.
+    """
+    tokens = tokenize(node.text)
+    for key in INDEXED_METADATA:
+        value = node.metadata.get(key)
+        if isinstance(value, list):
+            value = " ".join(value)
+        if value:
+            tokens.extend(tokenize(str(value)))
+    return tokens
+
+
+class BM25IndexBuilder:
+    """
+    Accumulates nodes, e.g. batch by batch during ingestion, into a `BM25Index`.
+    """
+
+    def __init__(self):
+        self._postings: Dict[str, List[Tuple[int, int]]] = {}
+        self._doc_lengths: List[int] = []
+        self._payloads: List[bytes] = []
+
+    def add(self, nodes: Iterable[TextNode]) -> None:
+        """
+        Add nodes to the index.
+
+        :param Iterable[TextNode] nodes: The nodes to add.
+        """
+        for node in nodes:
+            doc = len(self._doc_lengths)
+            tokens = _node_tokens(node)
+            for term, tf in Counter(tokens).items():
+                self._postings.setdefault(term, []).append((doc, tf))
+            self._doc_lengths.append(len(tokens))
+            payload = node_to_metadata_dict(node, remove_text=False, flat_metadata=False)
+            self._payloads.append(json.dumps(payload).encode("utf-8"))
+
+    def build(self, k1: float = 1.2, b: float = 0.75) -> "BM25Index":
+        """
+        Build the compact index from the accumulated nodes.
+
+        :param float k1: The BM25 term frequency saturation parameter.
+        :param float b: The BM25 length normalization parameter.
+        :returns: The index.
+        """
+        vocabulary = {term: term_id for term_id, term in enumerate(sorted(self._postings))}
+        offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        docs, tfs = [], []
+        for term, term_id in vocabulary.items():
+            postings = self._postings[term]
+            offsets[term_id + 1] = offsets[term_id] + len(postings)
+            docs.extend(doc for doc, _ in postings)
+            tfs.extend(tf for _, tf in postings)
+        payload_offsets = np.zeros(len(self._payloads) + 1, dtype=np.int64)
+        payload_offsets[1:] = np.cumsum([len(payload) for payload in self._payloads])
+        return BM25Index(
+            vocabulary=vocabulary,
+            offsets=offsets,
+            docs=np.asarray(docs, dtype=np.int32),
+            tfs=np.asarray(tfs, dtype=np.float32),
+            doc_lengths=np.asarray(self._doc_lengths, dtype=np.float32),
+            payloads=np.frombuffer(b"".join(self._payloads), dtype=np.uint8),
+            payload_offsets=payload_offsets,
+            k1=k1,
+            b=b,
+        )
+
+
+class BM25Index:
+    """
+    A compact BM25 inverted index over node text and the title, cast and directors metadata.
+
+    Postings are stored in CSR form: for term `t`, `docs[offsets[t]:offsets[t + 1]]` are the rows
+    containing it and `tfs` their term frequencies. The nodes themselves are stored as serialized
+    payloads, so search results can be returned without a vector store round-trip. All arrays are
+    memory-mapped when the index is loaded from disk.
+    """
+
+    _ARRAYS = ("offsets", "docs", "tfs", "doc_lengths", "payload_offsets")
+
+    def __init__(
+        self,
+        vocabulary: Dict[str, int],
+        offsets: np.ndarray,
+        docs: np.ndarray,
+        tfs: np.ndarray,
+        doc_lengths: np.ndarray,
+        payloads: np.ndarray,
+        payload_offsets: np.ndarray,
+        k1: float = 1.2,
+        b: float = 0.75,
+    ):
+        self._vocabulary = vocabulary
+        self._offsets = offsets
+        self._docs = docs
+        self._tfs = tfs
+        self._doc_lengths = doc_lengths
+        self._payloads = payloads
+        self._payload_offsets = payload_offsets
+        self._k1 = k1
+        self._b = b
+        self._avg_doc_length = float(doc_lengths.mean()) if len(doc_lengths) else 0.0
+        self._columns: Optional[Dict[str, np.ndarray]] = None
+
+    def __len__(self) -> int:
+        return len(self._doc_lengths)
+
+    @classmethod
+    def from_nodes(cls, nodes: Iterable[TextNode], **kwargs: Any) -> "BM25Index":
+        """
+        Build an index from nodes.
+
+        :param Iterable[TextNode] nodes: The nodes to index.
+        :param kwargs: The BM25 parameters passed to `BM25IndexBuilder.build`.
+        :returns: The index.
+        """
+        builder = BM25IndexBuilder()
+        builder.add(nodes)
+        return builder.build(**kwargs)
+
+    def persist(self, persist_dir: str) -> None:
+        """
+        Write the index to a directory.
+
+        :param str persist_dir: The directory.
+        """
+        os.makedirs(persist_dir, exist_ok=True)
+        for name in self._ARRAYS:
+            np.save(os.path.join(persist_dir, f"{name}.npy"), getattr(self, f"_{name}"))
+        np.asarray(self._payloads).tofile(os.path.join(persist_dir, "payloads.bin"))
+        with open(os.path.join(persist_dir, "index.json"), "w") as f:
+            json.dump({"vocabulary": self._vocabulary, "k1": self._k1, "b": self._b}, f)
+
+    @classmethod
+    def load(cls, persist_dir: str) -> "BM25Index":
+        """
+        Load an index from a directory, memory-mapping its arrays.
+
+        :param str persist_dir: The directory.
+        :returns: The index.
+        """
+        with open(os.path.join(persist_dir, "index.json"), "r") as f:
+            info = json.load(f)
+        arrays = {
+            name: np.load(os.path.join(persist_dir, f"{name}.npy"), mmap_mode="r")
+            for name in cls._ARRAYS
+        }
+        payloads = np.memmap(os.path.join(persist_dir, "payloads.bin"), dtype=np.uint8, mode="r")
+        return cls(vocabulary=info["vocabulary"], payloads=payloads, k1=info["k1"], b=info["b"], **arrays)
+
+    def _get_node(self, row: int) -> TextNode:
+        payload = self._payloads[self._payload_offsets[row]:self._payload_offsets[row + 1]]
+        return metadata_dict_to_node(json.loads(payload.tobytes()))
+
+    def _column(self, key: str) -> np.ndarray:
+        """
+        Get a metadata field as a column for filter evaluation. The payloads are decoded once, on the
+        first filtered search, into columns of every metadata field.
+
+        :param str key: The metadata field.
+        :returns: The column with one value per row.
+        """
+        if self._columns is None:
+            payloads = [
+                json.loads(self._payloads[self._payload_offsets[row]:self._payload_offsets[row + 1]].tobytes())
+                for row in range(len(self))
+            ]
+            keys = {key for payload in payloads for key in payload if not key.startswith("_")}
+            self._columns = {key: metadata_column(payload.get(key) for payload in payloads) for key in keys}
+        column = self._columns.get(key)
+        return column if column is not None else metadata_column([None] * len(self))
+
+    def scores(self, query: str) -> np.ndarray:
+        """
+        Compute the BM25 score of every indexed node for a query.
+
+        :param str query: The query text.
+        :returns: The scores, one per node.
+        """
+        scores = np.zeros(len(self), dtype=np.float32)
+        terms = {self._vocabulary[term] for term in tokenize(query) if term in self._vocabulary}
+        for term_id in terms:
+            start, end = self._offsets[term_id], self._offsets[term_id + 1]
+            docs, tfs = self._docs[start:end], self._tfs[start:end]
+            idf = math.log(1.0 + (len(self) - len(docs) + 0.5) / (len(docs) + 0.5))
+            norm = self._k1 * (1.0 - self._b + self._b * self._doc_lengths[docs] / self._avg_doc_length)
+            scores[docs] += idf * tfs * (self._k1 + 1.0) / (tfs + norm)
+        return scores
+
+    def search(self, query: str, top_k: int, filters: Optional[Dict[str, Any]] = None) -> List[NodeWithScore]:
+        """
+        Find the nodes with the highest BM25 score for a query.
+
+        :param str query: The query text.
+        :param int top_k: The number of nodes to return.
+        :param dict filters: Optional Pinecone-style metadata filters the nodes must satisfy.
+        :returns: The matching nodes with their scores, best first.
+        """
+        scores = self.scores(query)
+        eligible = scores > 0
+        if filters:
+            eligible &= filter_mask(filters, self._column, len(self))
+        candidates = np.flatnonzero(eligible)
+        k = min(top_k, len(candidates))
+        if k:
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        ranked = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [NodeWithScore(node=self._get_node(row), score=float(scores[row])) for row in ranked]
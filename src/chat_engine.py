@@ -2,7 +2,9 @@ from typing import Optional, List, Any
 from llama_index.core.chat_engine.types import ChatMode, BaseChatEngine
 from llama_index.core.base.base_query_engine import BaseQueryEngine
 from llama_index.core.llms.utils import LLMType
+from llama_index.core.memory.types import BaseMemory
 from llama_index.core.tools.query_engine import QueryEngineTool
+from llama_index.core.tools.types import BaseTool
 from llama_index.core import PromptTemplate
 
 
@@ -52,6 +54,8 @@ def get_chat_engine(
     chat_mode: ChatMode,
     llm: LLMType,
     query_engine: Optional[BaseQueryEngine] = None,
+    tools: Optional[List[BaseTool]] = None,
+    memory: Optional[BaseMemory] = None,
     **kwargs: Any
 ) -> BaseChatEngine:
     """
@@ -61,12 +65,18 @@ def get_chat_engine(
         chat_mode (ChatMode): The desired chat mode.
         llm (LLMType): The language model to use.
         query_engine (Optional[BaseQueryEngine]): The query engine to use.
+        tools (Optional[List[BaseTool]]): Additional tools for the agent modes, e.g. `MovieGraph.as_tool()`.
+        memory (Optional[BaseMemory]): The chat memory, e.g. a `CompactingChatMemory` bounding the history
+            sent on each turn. Defaults to the chat engine's own unbounded-by-turns buffer.
         **kwargs: Additional keyword arguments for specific chat engines.
 
     Returns:
         BaseChatEngine: The appropriate chat engine based on the specified mode.
     """
 
+    if memory is not None:
+        kwargs["memory"] = memory
+
     if chat_mode in [ChatMode.BEST, ChatMode.REACT, ChatMode.OPENAI]:
         from llama_index.core.agent import AgentRunner
 
@@ -76,7 +86,7 @@ def get_chat_engine(
         query_engine_tool = QueryEngineTool.from_defaults(query_engine=query_engine)
 
         return AgentRunner.from_llm(
-            tools=[query_engine_tool],
+            tools=[query_engine_tool, *(tools or [])],
             llm=llm,
             system_prompt=MOVIE_AGENT_PROMPT,
             **kwargs
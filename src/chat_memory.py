@@ -0,0 +1,264 @@
+import logging
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, List, Optional
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+from llama_index.core.llms import LLM, ChatMessage, MessageRole
+from llama_index.core.memory.types import BaseMemory
+from llama_index.core.utils import get_tokenizer
+from src.instrumentation import metrics
+
+
+logger = logging.getLogger(__name__)
+SUMMARY_PROMPT = """\
+Update the running summary of a conversation about movies with the new turns below. Keep every \
+preference, constraint and conclusion that later questions may refer to, drop small talk, and write \
+at most {max_words} words.
+
+<Current summary>
+{summary}
+
+<New turns>
+{turns}
+
+<Updated summary>
+"""
+_ENTITY = re.compile(r"\"([^\"]{2,80})\"|\b([A-Z][\w'’:-]*(?:\s+(?:of|the|and|in|on|a|de|la|von|van|[A-Z0-9][\w'’:-]*))*)")
+_STOPWORDS = {"I", "I'm", "I've", "I'd", "What", "Which", "Who", "Whom", "Where", "When", "Why", "How",
+              "Can", "Could", "Would", "Should", "Is", "Are", "Was", "Were", "Do", "Does", "Did", "Tell", "Give", "Please",
+              "Yes", "No", "Thanks", "Thank", "Hi", "Hello", "It", "In", "And", "But", "Also", "Any", "Some", "My"}
+
+
+def extract_entities(text: str) -> List[str]:
+    """
+    Extract quoted phrases and capitalized word sequences, such as movie titles and people's names.
+
+    :param str text: The message text.
+    :returns: The entities, in order of appearance.
+    """
+    entities = []
+    for quoted, capitalized in _ENTITY.findall(text):
+        entity = (quoted or capitalized).strip(" :-")
+        words = entity.split()
+        while words and words[0] in _STOPWORDS:
+            words = words[1:]
+        while words and words[-1].islower():
+            words = words[:-1]
+        entity = " ".join(words)
+        if words and (quoted or len(words) > 1 or text.find(entity) > 0) and entity not in _STOPWORDS:
+            entities.append(entity)
+    return entities
+
+
+class CompactingChatMemory(BaseMemory):
+    """
+    A token-budgeted chat memory for the condense-question and agent chat engines.
+
+    `get` returns a sliding window of the most recent whole turns (a turn starts at a user message, so
+    tool calls stay with their results), preceded by a system message holding a running summary of
+    older turns and the entities (titles, names) mentioned so far, verbatim. The result never exceeds
+    `token_limit` tokens, however long the session. When the stored turns outgrow the budget, the
+    turns that fell out of the window are summarized by the LLM on a background thread, off the
+    response path, and then dropped. If summarizing fails, the failure is logged and `get` returns
+    every stored turn, over the budget, until a later compaction succeeds, so no turn is lost.
+
+    :param LLM llm: The LLM used to summarize older turns.
+    :param int token_limit: The maximum number of tokens returned by `get`.
+    :param int summary_max_words: The target length of the running summary.
+    :param int max_entities: The number of most recently mentioned entities kept.
+    """
+
+    llm: LLM
+    token_limit: int = Field(default=3000, description="The maximum number of tokens returned by `get`.")
+    summary_max_words: int = Field(default=150, description="The target length of the running summary.")
+    max_entities: int = Field(default=30, description="The number of most recently mentioned entities kept.")
+    tokenizer_fn: Callable[[str], List] = Field(default_factory=get_tokenizer, exclude=True)
+    entity_extractor: Callable[[str], List[str]] = Field(default=extract_entities, exclude=True)
+
+    _messages: List[ChatMessage] = PrivateAttr(default_factory=list)
+    _summary: str = PrivateAttr(default="")
+    _entities: "OrderedDict[str, None]" = PrivateAttr(default_factory=OrderedDict)
+    _lock: Any = PrivateAttr(default_factory=threading.RLock)
+    _executor: Any = PrivateAttr(default=None)
+    _pending: Optional[Future] = PrivateAttr(default=None)
+    _compactions: int = PrivateAttr(default=0)
+    _compaction_failed: bool = PrivateAttr(default=False)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CompactingChatMemory"
+
+    @classmethod
+    def from_defaults(
+        cls,
+        chat_history: Optional[List[ChatMessage]] = None,
+        llm: Optional[LLM] = None,
+        **kwargs: Any,
+    ) -> "CompactingChatMemory":
+        if llm is None:
+            raise ValueError("An LLM must be provided to summarize older turns.")
+        memory = cls(llm=llm, **kwargs)
+        if chat_history:
+            memory.set(chat_history)
+        return memory
+
+    @property
+    def summary(self) -> str:
+        """
+        The running summary of the compacted turns.
+        """
+        return self._summary
+
+    @property
+    def entities(self) -> List[str]:
+        """
+        The entities mentioned so far, least recent first.
+        """
+        return list(self._entities)
+
+    @property
+    def compactions(self) -> int:
+        """
+        The number of times older turns were folded into the summary.
+        """
+        return self._compactions
+
+    def _count_tokens(self, message: ChatMessage) -> int:
+        return len(self.tokenizer_fn(f"{message.role.value}: {message.content or ''}"))
+
+    def _context_message(self) -> Optional[ChatMessage]:
+        parts = []
+        if self._summary:
+            parts.append(f"Summary of the earlier conversation:\n{self._summary}")
+        if self._entities:
+            parts.append(f"Mentioned so far: {'; '.join(self._entities)}")
+        return ChatMessage(role=MessageRole.SYSTEM, content="\n\n".join(parts)) if parts else None
+
+    def _window_start(self, messages: List[ChatMessage], budget: int) -> int:
+        """
+        Find the first message of the most recent whole turns fitting in a token budget. The latest
+        turn is always included.
+
+        :param list[ChatMessage] messages: The stored messages.
+        :param int budget: The token budget.
+        :returns: The index of the first message of the window.
+        """
+        start, used, turn_tokens = len(messages), 0, 0
+        for index in range(len(messages) - 1, -1, -1):
+            turn_tokens += self._count_tokens(messages[index])
+            if messages[index].role == MessageRole.USER or index == 0:
+                if used + turn_tokens > budget and start < len(messages):
+                    break
+                start, used, turn_tokens = index, used + turn_tokens, 0
+        return start
+
+    def get(self, input: Optional[str] = None, **kwargs: Any) -> List[ChatMessage]:
+        """
+        Get the chat history to send to the LLM: the running summary and entities, then the most
+        recent turns fitting in the remaining budget.
+        """
+        with metrics.span("chat_memory") as span, self._lock:
+            context = self._context_message()
+            context_tokens = self._count_tokens(context) if context else 0
+            if self._compaction_failed:
+                # The turns outside the window are not in the summary; keep them rather than lose them.
+                start = 0
+            else:
+                start = self._window_start(self._messages, max(0, self.token_limit - context_tokens))
+            window = self._messages[start:]
+            span.set(
+                history_tokens=context_tokens + sum(self._count_tokens(message) for message in window),
+                window_messages=len(window),
+                stored_messages=len(self._messages),
+            )
+        return ([context] if context else []) + window
+
+    def get_all(self) -> List[ChatMessage]:
+        """
+        Get the stored messages that have not been compacted yet.
+        """
+        with self._lock:
+            return list(self._messages)
+
+    def _track(self, messages: List[ChatMessage]) -> None:
+        for message in messages:
+            if message.role not in (MessageRole.USER, MessageRole.ASSISTANT) or not message.content:
+                continue
+            for entity in self.entity_extractor(message.content):
+                self._entities.pop(entity, None)
+                self._entities[entity] = None
+        while len(self._entities) > self.max_entities:
+            self._entities.popitem(last=False)
+
+    def put(self, message: ChatMessage) -> None:
+        with self._lock:
+            self._messages.append(message)
+            self._track([message])
+        self._maybe_compact()
+
+    def set(self, messages: List[ChatMessage]) -> None:
+        with self._lock:
+            known = len(self._messages)
+            self._messages = list(messages)
+            self._track(self._messages[known:])
+        self._maybe_compact()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._messages = []
+            self._summary = ""
+            self._entities.clear()
+            self._compaction_failed = False
+
+    def _maybe_compact(self) -> None:
+        """
+        Summarize the turns outside the window on the background thread once the stored turns
+        exceed the token budget.
+        """
+        with self._lock:
+            if self._pending is not None and not self._pending.done():
+                return
+            if sum(self._count_tokens(message) for message in self._messages) <= self.token_limit:
+                return
+            start = self._window_start(self._messages, self.token_limit // 2)
+            if start == 0:
+                return
+            turns = self._messages[:start]
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1)
+            self._pending = self._executor.submit(self._compact, turns, self._summary)
+
+    def _compact(self, turns: List[ChatMessage], summary: str) -> None:
+        """
+        Fold turns into the running summary and drop them, unless the history was reset meanwhile.
+        If the LLM call fails, the turns are kept and compaction is retried on the next `put` or `set`.
+
+        :param list[ChatMessage] turns: The oldest stored messages.
+        :param str summary: The running summary the turns follow.
+        """
+        try:
+            with metrics.span("memory_compaction") as span:
+                prompt = SUMMARY_PROMPT.format(
+                    max_words=self.summary_max_words,
+                    summary=summary or "(none)",
+                    turns="\n".join(f"{message.role.value}: {message.content}" for message in turns if message.content),
+                )
+                updated = self.llm.complete(prompt).text.strip()
+                span.set(messages=len(turns))
+        except Exception:
+            logger.exception("Summarizing %d chat messages failed; they are kept until a later compaction succeeds.", len(turns))
+            with self._lock:
+                self._compaction_failed = True
+                self._pending = None
+            return
+        with self._lock:
+            stored = self._messages[:len(turns)]
+            if len(stored) == len(turns) and all(a is b for a, b in zip(stored, turns)):
+                self._messages = self._messages[len(turns):]
+                self._summary = updated
+                self._compactions += 1
+                self._compaction_failed = False
+            self._pending = None
+        self._maybe_compact()
@@ -0,0 +1,118 @@
+from typing import Callable, Dict, List, Optional
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import MetadataMode, NodeWithScore, QueryBundle
+from llama_index.core.utils import get_tokenizer
+from src.instrumentation import metrics
+
+
+class MovieContextPacker(BaseNodePostprocessor):
+    """
+    Deduplicates retrieved chunks per movie and packs them into a token budget before synthesis.
+
+    Chunks are grouped by the movie (source document) they were split from, and at most
+    `max_chunks_per_movie` of the best-scoring chunks are kept per movie. The kept chunks of a movie
+    are merged, in plot order, into a single node, so the movie's metadata header is sent only once.
+    Movies are then added best first until `token_budget` is reached, dropping a movie's weaker
+    chunks when that lets it fit, so that synthesis fits in a single LLM call.
+
+    The tokens removed by deduplication and header merging are reported as saved, separately from
+    the tokens of chunks that were deduplicated but then dropped to fit the budget, reported as truncated.
+
+    :param int max_chunks_per_movie: The maximum number of chunks kept per movie.
+    :param int token_budget: The maximum number of context tokens passed to synthesis.
+    """
+
+    max_chunks_per_movie: int = Field(default=2, description="The maximum number of chunks kept per movie.")
+    token_budget: int = Field(default=6000, description="The maximum number of context tokens passed to synthesis.")
+
+    _tokenizer: Optional[Callable] = PrivateAttr(default=None)
+    _last_stats: Dict[str, int] = PrivateAttr(default_factory=dict)
+    _total_tokens_saved: int = PrivateAttr(default=0)
+    _total_tokens_truncated: int = PrivateAttr(default=0)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "MovieContextPacker"
+
+    @property
+    def last_stats(self) -> Dict[str, int]:
+        """
+        The raw, deduplicated and packed context tokens of the latest query, with the tokens saved by
+        deduplication and the tokens truncated to fit the budget.
+        """
+        return self._last_stats
+
+    @property
+    def total_tokens_saved(self) -> int:
+        """
+        The context tokens saved by deduplication across all queries.
+        """
+        return self._total_tokens_saved
+
+    @property
+    def total_tokens_truncated(self) -> int:
+        """
+        The context tokens dropped to fit the budget across all queries.
+        """
+        return self._total_tokens_truncated
+
+    def _count_tokens(self, node_with_score: NodeWithScore) -> int:
+        if self._tokenizer is None:
+            self._tokenizer = get_tokenizer()
+        return len(self._tokenizer(node_with_score.node.get_content(metadata_mode=MetadataMode.LLM)))
+
+    @staticmethod
+    def _movie_key(node_with_score: NodeWithScore) -> str:
+        node = node_with_score.node
+        return node.ref_doc_id or str(node.metadata.get("title", node.node_id))
+
+    @staticmethod
+    def _merge(chunks: List[NodeWithScore]) -> NodeWithScore:
+        """
+        Merge the chunks of one movie into a single node carrying the movie's metadata once.
+
+        :param list[NodeWithScore] chunks: The chunks, best first.
+        :returns: The merged node, scored with its best chunk.
+        """
+        ordered = sorted(chunks, key=lambda chunk: chunk.node.start_char_idx or 0)
+        text = "\n...\n".join(chunk.node.get_content(metadata_mode=MetadataMode.NONE) for chunk in ordered)
+        node = chunks[0].node.model_copy(update={"text": text})
+        return NodeWithScore(node=node, score=chunks[0].score)
+
+    def _postprocess_nodes(
+        self,
+        nodes: List[NodeWithScore],
+        query_bundle: Optional[QueryBundle] = None,
+    ) -> List[NodeWithScore]:
+        with metrics.span("context_packing") as span:
+            movies: Dict[str, List[NodeWithScore]] = {}
+            for node in sorted(nodes, key=lambda node: node.score or 0.0, reverse=True):
+                chunks = movies.setdefault(self._movie_key(node), [])
+                if len(chunks) < self.max_chunks_per_movie:
+                    chunks.append(node)
+
+            packed, used, deduplicated = [], 0, 0
+            for chunks in movies.values():
+                for kept in range(len(chunks), 0, -1):
+                    merged = self._merge(chunks[:kept])
+                    tokens = self._count_tokens(merged)
+                    if kept == len(chunks):
+                        deduplicated += tokens
+                    if used + tokens <= self.token_budget or (kept == 1 and not packed):
+                        packed.append(merged)
+                        used += tokens
+                        break
+
+            raw = sum(self._count_tokens(node) for node in nodes)
+            self._last_stats = {
+                "raw_tokens": raw,
+                "deduplicated_tokens": deduplicated,
+                "packed_tokens": used,
+                "tokens_saved": raw - deduplicated,
+                "tokens_truncated": deduplicated - used,
+            }
+            self._total_tokens_saved += raw - deduplicated
+            self._total_tokens_truncated += deduplicated - used
+            span.set(nodes=len(packed), **self._last_stats)
+        return packed
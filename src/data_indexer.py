@@ -1,9 +1,66 @@
 import os
-from typing import List
-from pinecone import Pinecone, Index, ServerlessSpec
-from llama_index.vector_stores.pinecone import PineconeVectorStore
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, Iterator, List, Optional, TypeVar
 from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.vector_stores.types import BasePydanticVectorStore
 from llama_index.core.schema import TextNode
+from src.index_manifest import IndexManifest
+
+if TYPE_CHECKING:
+    from pinecone import Index, Pinecone
+
+
+T = TypeVar("T")
+
+
+def _is_rate_limit_error(exc: Exception) -> bool:
+    """
+    Check whether an exception raised by an embedding or vector store client signals rate limiting.
+
+    :param Exception exc: The exception raised by the client.
+    :returns: True if the error is a rate-limit (HTTP 429) error.
+    """
+    status = getattr(exc, "status_code", None) or getattr(exc, "status", None)
+    return status == 429 or "RateLimit" in type(exc).__name__
+
+
+def _call_with_retry(fn: Callable[[], T], max_retries: int, backoff: float) -> T:
+    """
+    Call a function, retrying with exponential backoff when it fails on a rate-limit error.
+
+    :param Callable fn: The zero-argument function to call.
+    :param int max_retries: The maximum number of retries after the first attempt.
+    :param float backoff: The initial delay in seconds, doubled after each retry.
+    :returns: The return value of the function.
+    :raises Exception: The last error if retries are exhausted or the error is not retryable.
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            return fn()
+        except Exception as exc:
+            if attempt == max_retries or not _is_rate_limit_error(exc):
+                raise
+            time.sleep(backoff * (2 ** attempt))
+
+
+def _batched(items: Iterable[T], size: int) -> Iterator[List[T]]:
+    """
+    Group an iterable into lists of at most `size` items without materialising it.
+
+    :param Iterable items: The items to group.
+    :param int size: The maximum batch size.
+    :returns: An iterator over the batches.
+    """
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
 
 class DataIndexer:
     """
@@ -14,25 +71,86 @@ class DataIndexer:
     :param BaseEmbedding embed_model: The embedding model to use for generating embeddings.
     :param str pinecone_api_key: API key for accessing Pinecone's vector database services.
     :param str distance_metric: The distance metric to use for the Pinecone index (default: "euclidean").
+    :param BasePydanticVectorStore vector_store: An alternative vector store (e.g. a `LocalVectorStore`) to use instead of Pinecone.
+    :param bool manage_index: Whether to check that the Pinecone index exists and create it if not. Serving
+        processes attach to an existing index with `for_serving` instead, skipping these calls.
+    :param str index_host: The host of the Pinecone index, which saves the lookup of the host by name.
+    :param int shortlist_dimensions: If set, also store a copy of the embeddings truncated to this many leading
+        (Matryoshka) dimensions, for two-stage retrieval with `PineconeRetriever(shortlist_k=...)`. This needs a
+        vector store keeping such a copy, i.e. a `LocalVectorStore`.
+    :param bool quantize_shortlist: Whether to quantise the shortlist copy to int8.
+
+    The Pinecone client is imported when it is first needed, so processes using another vector store never load it.
     """
     
-    def __init__(self, dataset_name: str, embedding_dimension: int, embed_model: BaseEmbedding, pinecone_api_key: str, distance_metric: str = "dotproduct"):
+    def __init__(self, dataset_name: str, embedding_dimension: int, embed_model: BaseEmbedding, pinecone_api_key: Optional[str] = None, distance_metric: str = "dotproduct", vector_store: Optional[BasePydanticVectorStore] = None, manage_index: bool = True, index_host: Optional[str] = None, shortlist_dimensions: Optional[int] = None, quantize_shortlist: bool = False):
         self.dataset_name = dataset_name
         self.embedding_dimension = embedding_dimension
         self._embed_model = embed_model
         self._pinecone_api_key = pinecone_api_key
         self._distance_metric = distance_metric
-        self._pinecone_client = Pinecone(api_key=self._pinecone_api_key)
-        self._pinecone_index = self._setup_or_get_index(self._pinecone_client)
-        self._vector_store = PineconeVectorStore(pinecone_index=self._pinecone_index)
+        if vector_store is not None:
+            self._pinecone_client = None
+            self._pinecone_index = None
+            self._vector_store = vector_store
+        else:
+            if pinecone_api_key is None:
+                raise ValueError("A Pinecone API key is required when no vector store is provided.")
+            from pinecone import Pinecone
+            from llama_index.vector_stores.pinecone import PineconeVectorStore
+
+            self._pinecone_client = Pinecone(api_key=self._pinecone_api_key)
+            if manage_index:
+                self._pinecone_index = self._setup_or_get_index(self._pinecone_client)
+            else:
+                self._pinecone_index = self._pinecone_client.Index(self.dataset_name, host=index_host or "")
+            self._vector_store = PineconeVectorStore(pinecone_index=self._pinecone_index)
+        if shortlist_dimensions:
+            if not hasattr(self._vector_store, "build_shortlist"):
+                raise ValueError("A vector store keeping a shortlist copy, such as LocalVectorStore, is required for shortlist_dimensions.")
+            if self._vector_store.shortlist_dimensions != shortlist_dimensions:
+                self._vector_store.build_shortlist(shortlist_dimensions, quantize=quantize_shortlist)
 
-    def _setup_or_get_index(self, pc: Pinecone) -> Index:
+    @classmethod
+    def for_serving(
+        cls,
+        dataset_name: str,
+        embedding_dimension: int,
+        embed_model: BaseEmbedding,
+        pinecone_api_key: Optional[str] = None,
+        vector_store: Optional[BasePydanticVectorStore] = None,
+        index_host: Optional[str] = None,
+    ) -> "DataIndexer":
+        """
+        Attach to an existing index for querying, without listing or creating indexes.
+
+        :param str dataset_name: The name of the existing index.
+        :param int embedding_dimension: The dimensionality of the embedding space.
+        :param BaseEmbedding embed_model: The embedding model used for queries.
+        :param str pinecone_api_key: API key for accessing Pinecone's vector database services.
+        :param BasePydanticVectorStore vector_store: An alternative vector store to use instead of Pinecone.
+        :param str index_host: The host of the Pinecone index, which saves the lookup of the host by name.
+        :returns: The indexer.
+        """
+        return cls(
+            dataset_name=dataset_name,
+            embedding_dimension=embedding_dimension,
+            embed_model=embed_model,
+            pinecone_api_key=pinecone_api_key,
+            vector_store=vector_store,
+            manage_index=False,
+            index_host=index_host,
+        )
+
+    def _setup_or_get_index(self, pc: "Pinecone") -> "Index":
         """
         Check if an index exists and create one if not, using an existing Pinecone client.
         
         :param Pinecone pc: The initialized Pinecone client.
         :returns: A Pinecone Index connected to the newly created or existing index.
         """
+        from pinecone import ServerlessSpec
+
         if self.dataset_name not in pc.list_indexes().names():
             pc.create_index(
                 name=self.dataset_name,
@@ -42,34 +160,238 @@ class DataIndexer:
             )
         return pc.Index(self.dataset_name)
 
-    def embed_nodes(self, nodes: List[TextNode]) -> None:
+    def embed_nodes(
+        self,
+        nodes: List[TextNode],
+        batch_size: Optional[int] = None,
+        num_workers: int = 1,
+        max_retries: int = 5,
+        backoff: float = 1.0,
+        show_progress: bool = False,
+    ) -> List[TextNode]:
         """
         Embed nodes using the OpenAI model and set the embedding directly on each node.
 
+        Without a batch size, nodes are embedded one at a time. With a batch size, nodes are sent in
+        batches through `get_text_embedding_batch` on a pool of `num_workers` threads. Each batch is
+        retried with exponential backoff on rate-limit errors; a batch that still fails is skipped so
+        the rest of the run can finish.
+
         :param list[TextNode] nodes: A list of TextNode objects to be processed.
+        :param int batch_size: The number of nodes per embedding request, or None to embed nodes one by one.
+        :param int num_workers: The maximum number of batches embedded concurrently.
+        :param int max_retries: The maximum number of retries per batch on rate-limit errors.
+        :param float backoff: The initial retry delay in seconds, doubled after each retry.
+        :param bool show_progress: Whether to display a progress bar.
+        :returns: The nodes that could not be embedded (empty if all succeeded).
         """
-        for node in nodes:
-            embedding = self._embed_model.get_text_embedding(
-                node.get_content(metadata_mode="all")
+        if batch_size is None:
+            for node in nodes:
+                embedding = self._embed_model.get_text_embedding(
+                    node.get_content(metadata_mode="all")
+                )
+                node.embedding = embedding
+            return []
+
+        batches = [nodes[i:i + batch_size] for i in range(0, len(nodes), batch_size)]
+        failed = []
+        progress = None
+        if show_progress:
+            from tqdm.auto import tqdm
+            progress = tqdm(total=len(nodes), desc="Embedding nodes")
+
+        def embed_batch(batch: List[TextNode]) -> List[List[float]]:
+            texts = [node.get_content(metadata_mode="all") for node in batch]
+            return _call_with_retry(
+                lambda: self._embed_model.get_text_embedding_batch(texts),
+                max_retries=max_retries,
+                backoff=backoff,
             )
-            node.embedding = embedding
 
-    def add_to_vector_store(self, nodes: List[TextNode]) -> None:
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            futures = {executor.submit(embed_batch, batch): batch for batch in batches}
+            for future in as_completed(futures):
+                batch = futures[future]
+                try:
+                    embeddings = future.result()
+                except Exception:
+                    failed.extend(batch)
+                else:
+                    for node, embedding in zip(batch, embeddings):
+                        node.embedding = embedding
+                if progress is not None:
+                    progress.update(len(batch))
+
+        if progress is not None:
+            progress.close()
+        return failed
+
+    def embed_batches(self, batches: Iterable[List[TextNode]], **embed_kwargs: Any) -> Iterator[TextNode]:
+        """
+        Lazily embed batches of nodes, e.g. from `DataLoader.iter_nodes`, yielding each embedded node.
+
+        Passing the result to `add_to_vector_store` with a batch size pipelines the two stages: the next
+        batch is embedded while the previous ones are being upserted. Nodes that fail to embed are skipped.
+
+        :param Iterable[list[TextNode]] batches: The batches of nodes to embed.
+        :param embed_kwargs: Additional keyword arguments passed to `embed_nodes`.
+        :returns: An iterator over the embedded nodes.
+        """
+        for batch in batches:
+            failed_ids = {node.node_id for node in self.embed_nodes(batch, **embed_kwargs)}
+            for node in batch:
+                if node.node_id not in failed_ids:
+                    yield node
+
+    def add_to_vector_store(
+        self,
+        nodes: Iterable[TextNode],
+        batch_size: Optional[int] = None,
+        num_workers: int = 1,
+        max_retries: int = 5,
+        backoff: float = 1.0,
+        checkpoint_path: Optional[str] = None,
+        show_progress: bool = False,
+    ) -> List[TextNode]:
         """
         Add nodes, which include their embeddings, to the Pinecone vector store.
 
-        :param list[TextNode] nodes: A list of TextNode objects that include embeddings.
+        Without a batch size, all nodes are added in a single call. With a batch size, nodes are
+        consumed lazily (so a generator can be passed) and upserted in batches on a pool of
+        `num_workers` threads, with at most two batches per worker in flight. Each batch is retried
+        with exponential backoff on rate-limit errors; a batch that still fails is skipped. When a
+        checkpoint file is given, the IDs and content hashes of upserted nodes are appended to it and
+        nodes listed there with the same hash are skipped, so an interrupted load can be resumed. The
+        checkpoint is deleted once a run upserts every node.
+
+        :param Iterable[TextNode] nodes: The TextNode objects that include embeddings.
+        :param int batch_size: The number of nodes per upsert request, or None to add all nodes at once.
+        :param int num_workers: The maximum number of concurrent upserts.
+        :param int max_retries: The maximum number of retries per batch on rate-limit errors.
+        :param float backoff: The initial retry delay in seconds, doubled after each retry.
+        :param str checkpoint_path: The path of the file recording upserted node IDs and hashes, if any.
+        :param bool show_progress: Whether to display a progress bar with the upsert rate in vectors per second.
+        :returns: The nodes that could not be upserted (empty if all succeeded).
         :raises ValueError: If embeddings are not set before adding to the vector store.
         """
-        if any(node.embedding is None for node in nodes):
-            raise ValueError("Embedding not set for one or more nodes. Please call embed_nodes first.")
-        self._vector_store.add(nodes)
-    
-    def get_vector_store(self) -> PineconeVectorStore:
+        if batch_size is None:
+            nodes = list(nodes)
+            if any(node.embedding is None for node in nodes):
+                raise ValueError("Embedding not set for one or more nodes. Please call embed_nodes first.")
+            self._vector_store.add(nodes)
+            return []
+
+        done = set()
+        if checkpoint_path and os.path.exists(checkpoint_path):
+            with open(checkpoint_path, "r") as f:
+                done = {tuple(line.rstrip("\n").split("\t", 1)) for line in f}
+        failed = []
+        pending = {}
+        progress = None
+        if show_progress:
+            from tqdm.auto import tqdm
+            progress = tqdm(desc="Upserting nodes", unit=" vectors")
+        checkpoint = open(checkpoint_path, "a") if checkpoint_path else None
+
+        def collect(futures: Iterable) -> None:
+            for future in futures:
+                batch = pending.pop(future)
+                try:
+                    future.result()
+                except Exception:
+                    failed.extend(batch)
+                    continue
+                if checkpoint is not None:
+                    checkpoint.write("".join(f"{node.node_id}\t{node.hash}\n" for node in batch))
+                    checkpoint.flush()
+                if progress is not None:
+                    progress.update(len(batch))
+
+        try:
+            with ThreadPoolExecutor(max_workers=num_workers) as executor:
+                remaining = (node for node in nodes if (node.node_id, node.hash) not in done)
+                for batch in _batched(remaining, batch_size):
+                    if any(node.embedding is None for node in batch):
+                        raise ValueError("Embedding not set for one or more nodes. Please call embed_nodes first.")
+                    if len(pending) >= 2 * num_workers:
+                        completed, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        collect(completed)
+                    future = executor.submit(
+                        _call_with_retry,
+                        lambda batch=batch: self._vector_store.add(batch),
+                        max_retries,
+                        backoff,
+                    )
+                    pending[future] = batch
+                collect(list(pending))
+        finally:
+            if checkpoint is not None:
+                checkpoint.close()
+            if progress is not None:
+                progress.close()
+        if checkpoint_path and not failed:
+            os.remove(checkpoint_path)
+        return failed
+
+    def sync_nodes(
+        self,
+        nodes: List[TextNode],
+        manifest_path: str,
+        batch_size: Optional[int] = None,
+        num_workers: int = 1,
+        max_retries: int = 5,
+        backoff: float = 1.0,
+        show_progress: bool = False,
+    ) -> Dict[str, int]:
+        """
+        Incrementally bring the vector store in line with the given nodes.
+
+        Only nodes that are new or whose content hash changed since the last sync are embedded and
+        upserted, and nodes that no longer exist (e.g. removed movies, or trailing chunks of a
+        shortened plot) are deleted. Nodes need stable IDs for this to work, see `DataLoader`'s
+        `id_column`. The batching, concurrency and retry arguments apply to both `embed_nodes` and
+        `add_to_vector_store`. Nodes that fail to embed or upsert are left out of the manifest, so
+        the next sync retries them.
+
+        :param list[TextNode] nodes: The full, current set of nodes.
+        :param str manifest_path: The path of the manifest recording what is already indexed.
+        :param int batch_size: The number of nodes per embedding and upsert request, or None for unbatched calls.
+        :param int num_workers: The maximum number of concurrent requests.
+        :param int max_retries: The maximum number of retries per batch on rate-limit errors.
+        :param float backoff: The initial retry delay in seconds, doubled after each retry.
+        :param bool show_progress: Whether to display progress bars.
+        :returns: The number of nodes upserted, deleted, unchanged and failed.
+        """
+        batching = {
+            "batch_size": batch_size,
+            "num_workers": num_workers,
+            "max_retries": max_retries,
+            "backoff": backoff,
+            "show_progress": show_progress,
+        }
+        manifest = IndexManifest(manifest_path)
+        changes = manifest.diff(nodes)
+        failed = self.embed_nodes(changes["upsert"], **batching)
+        failed_ids = {node.node_id for node in failed}
+        embedded = [node for node in changes["upsert"] if node.node_id not in failed_ids]
+        if embedded:
+            failed_ids.update(node.node_id for node in self.add_to_vector_store(embedded, **batching))
+        upserted = [node for node in embedded if node.node_id not in failed_ids]
+        if changes["delete"]:
+            self._vector_store.delete_nodes(node_ids=changes["delete"])
+        manifest.update(upserted, changes["delete"])
+        return {
+            "upserted": len(upserted),
+            "deleted": len(changes["delete"]),
+            "unchanged": len(nodes) - len(changes["upsert"]),
+            "failed": len(failed_ids),
+        }
+
+    def get_vector_store(self) -> BasePydanticVectorStore:
         """
-        Get the Pinecone vector store.
+        Get the vector store, Pinecone unless another store was provided.
 
-        :returns: The Pinecone vector store.
+        :returns: The vector store.
         """
         return self._vector_store
 
@@ -1,11 +1,64 @@
 import pandas as pd
-from typing import List, Any, Dict
+from concurrent.futures import Executor, ProcessPoolExecutor
+from contextlib import nullcontext
+from functools import lru_cache
+from itertools import repeat
+from typing import List, Any, Dict, Iterator, Optional
 from llama_index.core import Document
 from llama_index.core.node_parser import SentenceSplitter
 from llama_index.core.schema import TextNode
 
+
+LIST_COLUMNS = ['cast', 'spoken_languages', 'directors', 'genres', 'production_companies']
+INTEGER_COLUMNS = ['revenue', 'runtime', 'release_year', 'release_month', 'release_day', 'numVotes']
+FLOAT_COLUMNS = ['averageRating']
+DATE_COLUMNS = ['release_date']
+CAST_LIMIT = 15
+
+
+def chunk_node_id(i: int, document: Document) -> str:
+    """
+    Builds a stable node ID from the document ID and the index of the chunk within the document.
+
+    :param i: int, the index of the chunk within the document.
+    :param document: Document, the document the chunk was split from.
+    :return: str, the node ID.
+    """
+    return f"{document.doc_id}#{i}"
+
+
+@lru_cache(maxsize=None)
+def _build_parser(chunk_size: int, chunk_overlap: int, stable_ids: bool) -> SentenceSplitter:
+    """
+    Builds a SentenceSplitter, cached so each worker process sets up its tokenizer only once.
+
+    :param chunk_size: int, the size of chunks for the node parser.
+    :param chunk_overlap: int, the overlap between chunks for the node parser.
+    :param stable_ids: bool, whether nodes get stable IDs from `chunk_node_id`.
+    :return: SentenceSplitter, the node parser.
+    """
+    return SentenceSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        id_func=chunk_node_id if stable_ids else None,
+    )
+
+
+def _split_documents(documents: List[Document], chunk_size: int, chunk_overlap: int, stable_ids: bool) -> List[TextNode]:
+    """
+    Parses a shard of documents into nodes, run in a worker process.
+
+    :param documents: list of Document objects.
+    :param chunk_size: int, the size of chunks for the node parser.
+    :param chunk_overlap: int, the overlap between chunks for the node parser.
+    :param stable_ids: bool, whether nodes get stable IDs from `chunk_node_id`.
+    :return: list of TextNode objects derived from the documents.
+    """
+    return _build_parser(chunk_size, chunk_overlap, stable_ids).get_nodes_from_documents(documents)
+
+
 class DataLoader:
-    def __init__(self, input_path: str, text_column: str, metadata_columns: List[str], chunk_size: int = 1024, chunk_overlap: int = 64):
+    def __init__(self, input_path: str, text_column: str, metadata_columns: List[str], chunk_size: int = 1024, chunk_overlap: int = 64, id_column: Optional[str] = None, num_workers: int = 1):
         """
         Initializes the DataLoader with path to the CSV, the name of the text column,
         and the list of metadata column names, all treated as private variables. It also initializes
@@ -16,12 +69,19 @@ class DataLoader:
         :param metadata_columns: list of str, a list of column names to be used as metadata.
         :param chunk_size: int, the size of chunks for the node parser.
         :param chunk_overlap: int, the overlap between chunks for the node parser.
+        :param id_column: str, optional column with a unique row key (e.g. imdb_id). When set, documents
+            use it as their ID and nodes get stable IDs of the form "<id>#<chunk index>".
+        :param num_workers: int, the number of processes used to split documents into nodes. With more
+            than one worker, documents are sharded across a process pool; the output is identical to
+            the serial output.
         """
         self._input_path = input_path
         self._text_column = text_column
         self._metadata_columns = metadata_columns
         self._chunk_size = chunk_size
         self._chunk_overlap = chunk_overlap
+        self._id_column = id_column
+        self._num_workers = num_workers
 
     def _load_data(self) -> pd.DataFrame:
         """
@@ -31,31 +91,55 @@ class DataLoader:
         """
         return pd.read_csv(self._input_path)
 
-    def _process_metadata(self, row: pd.Series) -> Dict[str, Any]:
-        """
-        Processes metadata for each row to ensure proper formatting and conversion.
-
-        :param row: pd.Series, the data row from which metadata is extracted and processed.
-        :return: Dict[str, Any], a dictionary containing processed metadata ready for use in creating Document objects.
-        """
-        metadata = {}
-        for col in self._metadata_columns:
-            if col == 'cast':
-                if pd.notnull(row[col]):
-                    metadata[col] = row[col].split(',')[:15]
-                else:
-                    metadata[col] = []
-            # TODO: date not JSON serializable
-            # elif col == 'release_date' and pd.notnull(row[col]):
-            #     metadata[col] = pd.to_datetime(row[col]).date()
-            elif col in ['spoken_languages', 'directors', 'genres', 'production_companies']:
-                if pd.notnull(row[col]):
-                    metadata[col] = row[col].split(',')
-                else:
-                    metadata[col] = []
-            else:
-                metadata[col] = row[col]
-        return metadata
+    def _get_columns(self) -> List[str]:
+        """
+        Returns the CSV columns needed to build documents, intended for internal use only.
+
+        :return: list of str, the text, metadata and ID column names without duplicates.
+        """
+        columns = [self._text_column, *self._metadata_columns]
+        if self._id_column:
+            columns.append(self._id_column)
+        return list(dict.fromkeys(columns))
+
+    def _normalise_column(self, column: pd.Series) -> List[Any]:
+        """
+        Normalises a whole metadata column at once: list-valued columns are split and trimmed,
+        numeric columns are coerced, and dates are encoded as sortable YYYYMMDD integers so they
+        can be range-filtered in the vector store. Missing scalar values become None.
+
+        :param column: pd.Series, the metadata column to normalise.
+        :return: list, the normalised value of each row.
+        """
+        name = column.name
+        if name in LIST_COLUMNS:
+            text = column.fillna("").astype(str).str.strip()
+            values = text.str.split(r"\s*,\s*", regex=True)
+            if name == 'cast':
+                values = values.str[:CAST_LIMIT]
+            return [items if items != [''] else [] for items in values.tolist()]
+        if name in DATE_COLUMNS:
+            dates = pd.to_datetime(column, errors="coerce")
+            column = (dates.dt.year * 10000 + dates.dt.month * 100 + dates.dt.day).astype("Int64")
+        elif name in INTEGER_COLUMNS:
+            column = pd.to_numeric(column, errors="coerce").round().astype("Int64")
+        elif name in FLOAT_COLUMNS:
+            column = pd.to_numeric(column, errors="coerce")
+        return column.astype(object).where(column.notna(), None).tolist()
+
+    def _process_metadata(self, data: pd.DataFrame) -> List[Dict[str, Any]]:
+        """
+        Processes the metadata of all rows column by column to ensure proper formatting and conversion.
+
+        :param data: DataFrame, the data from which metadata is extracted and processed.
+        :return: List[Dict[str, Any]], one plain dictionary of metadata per row, without missing values,
+            ready for use in creating Document objects.
+        """
+        columns = [self._normalise_column(data[col]) for col in self._metadata_columns]
+        return [
+            {col: value for col, value in zip(self._metadata_columns, values) if value is not None}
+            for values in zip(*columns)
+        ]
 
     def _create_documents(self, data: pd.DataFrame) -> List[Document]:
         """
@@ -64,29 +148,63 @@ class DataLoader:
         :param data: DataFrame, the data from which to create Documents.
         :return: list of Document objects.
         """
+        texts = data[self._text_column].tolist()
+        metadata_rows = self._process_metadata(data)
+        ids = data[self._id_column].astype(str).tolist() if self._id_column else [None] * len(texts)
         documents = []
-        for _, row in data.iterrows():
-            metadata = self._process_metadata(row)
+        for text, metadata, doc_id in zip(texts, metadata_rows, ids):
             document = Document(
-                text=row[self._text_column],
+                text=text,
                 metadata=metadata,
                 metadata_seperator=", ",
                 text_template="Movie Metadata:\n {metadata_str}\n Plot (or Plot Summary):\n {content}"
             )
+            if doc_id is not None:
+                document.id_ = doc_id
             documents.append(document)
         return documents
 
-    def _create_nodes(self, documents: List[Document]) -> List[TextNode]:
+    def _get_parser(self) -> SentenceSplitter:
+        """
+        Builds the SentenceSplitter with the specified chunk size and overlap, intended for internal use only.
+
+        :return: SentenceSplitter, the node parser.
+        """
+        return _build_parser(self._chunk_size, self._chunk_overlap, bool(self._id_column))
+
+    def _get_executor(self) -> Optional[ProcessPoolExecutor]:
+        """
+        Builds the process pool used to split documents, intended for internal use only.
+
+        :return: ProcessPoolExecutor, or None when splitting runs in this process.
+        """
+        if self._num_workers > 1:
+            return ProcessPoolExecutor(max_workers=self._num_workers)
+        return None
+
+    def _create_nodes(self, documents: List[Document], executor: Optional[Executor] = None) -> List[TextNode]:
         """
         Parses documents into nodes using SentenceSplitter with specified chunk size and overlap,
-        intended for internal use only.
+        intended for internal use only. With an executor, contiguous shards of documents are split in
+        parallel and concatenated in order; since previous/next relationships only link chunks of the
+        same document, the result matches the serial output.
 
         :param documents: list of Document objects.
+        :param executor: Executor, optional pool used to split shards of documents in parallel.
         :return: list of TextNode objects derived from the documents.
         """
-        parser = SentenceSplitter(chunk_size=self._chunk_size, chunk_overlap=self._chunk_overlap)
-        nodes = parser.get_nodes_from_documents(documents)
-        return nodes
+        if executor is None:
+            return self._get_parser().get_nodes_from_documents(documents)
+        shard_size = max(1, -(-len(documents) // (self._num_workers * 4)))
+        shards = [documents[i:i + shard_size] for i in range(0, len(documents), shard_size)]
+        results = executor.map(
+            _split_documents,
+            shards,
+            repeat(self._chunk_size),
+            repeat(self._chunk_overlap),
+            repeat(bool(self._id_column)),
+        )
+        return [node for nodes in results for node in nodes]
 
     def ingest_data(self) -> List[TextNode]:
         """
@@ -97,6 +215,23 @@ class DataLoader:
         """
         self._df = self._load_data()
         documents = self._create_documents(self._df)
-        nodes = self._create_nodes(documents)
+        with self._get_executor() or nullcontext() as executor:
+            nodes = self._create_nodes(documents, executor)
         return nodes
 
+    def iter_nodes(self, chunksize: int = 1000) -> Iterator[List[TextNode]]:
+        """
+        Streams the CSV data in chunks, yielding the nodes of each chunk as soon as it is parsed.
+        Only the text, metadata and ID columns are read, so peak memory is bounded by the chunk size
+        rather than the size of the dataset. Each batch can be passed straight to `DataIndexer.embed_nodes`
+        and `DataIndexer.add_to_vector_store`.
+
+        :param chunksize: int, the number of CSV rows read per batch.
+        :return: iterator of lists of TextNode objects, one list per chunk of rows.
+        """
+        reader = pd.read_csv(self._input_path, usecols=self._get_columns(), chunksize=chunksize)
+        with reader, self._get_executor() or nullcontext() as executor:
+            for chunk in reader:
+                documents = self._create_documents(chunk)
+                yield self._create_nodes(documents, executor)
+
@@ -0,0 +1,367 @@
+import asyncio
+import atexit
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding, Embedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.callbacks import CBEventType, EventPayload
+
+
+async def aget_query_embeddings(embed_model: BaseEmbedding, queries: List[str]) -> List[Embedding]:
+    """
+    Embed many queries, in batch calls when the model provides `aget_query_embedding_batch`.
+    Other models, whose query embeddings may differ from their text embeddings, are called
+    concurrently once per query.
+
+    :param BaseEmbedding embed_model: The embedding model.
+    :param list[str] queries: The queries.
+    :returns: The query embeddings, in order.
+    """
+    batch = getattr(embed_model, "aget_query_embedding_batch", None)
+    if batch is not None:
+        return await batch(queries)
+    return list(await asyncio.gather(*(embed_model.aget_query_embedding(query) for query in queries)))
+
+
+class EmbeddingCache:
+    """
+    A persistent, content-addressed store of embeddings backed by a memory-mapped float32 matrix.
+
+    Each entry is addressed by a SHA-256 digest of its key. The directory holds three files:
+    `vectors.f32` (the embedding matrix), `keys.npy` (the 32 digest bytes stored in each row) and
+    `ticks.npy` (the last access tick of each row, which persists the least-recently-used order;
+    0 marks an empty row). In memory, the rows are kept in an ordered dict in access order, so
+    finding the entry to evict does not scan the cache.
+
+    The width of the matrix is fixed by the first embedding stored, so a directory holds the
+    embeddings of a single model and dimension; `CachedEmbedding` uses one directory per model.
+
+    :param str cache_dir: The directory in which the cache files are stored.
+    :param int max_entries: The maximum number of embeddings kept before the least recently used are evicted.
+    :param int dimension: The expected embedding dimension, checked against an existing cache, if known.
+    :raises ValueError: If the cache on disk has another size or dimension.
+    """
+
+    def __init__(self, cache_dir: str, max_entries: int = 200_000, dimension: Optional[int] = None):
+        self._cache_dir = cache_dir
+        self._max_entries = max_entries
+        self._dimension = dimension
+        self._lock = threading.Lock()
+        self._vectors: Optional[np.memmap] = None
+        self._keys = np.zeros((max_entries, 32), dtype=np.uint8)
+        self._ticks = np.zeros(max_entries, dtype=np.int64)
+        self._rows: Dict[bytes, int] = {}
+        self._lru: "OrderedDict[int, None]" = OrderedDict()
+        self._tick = 0
+        self._unsaved = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load()
+
+    @staticmethod
+    def make_key(*parts: Any) -> bytes:
+        """
+        Build a content-addressed key from its parts.
+
+        :param parts: The values identifying an embedding, e.g. model name, dimensions and text.
+        :returns: The 32-byte SHA-256 digest of the parts.
+        """
+        hasher = hashlib.sha256()
+        for part in parts:
+            hasher.update(str(part).encode("utf-8"))
+            hasher.update(b"\0")
+        return hasher.digest()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self._cache_dir, name)
+
+    def _load(self) -> None:
+        """
+        Load an existing cache from disk, if present.
+        """
+        if not os.path.exists(self._path("keys.npy")):
+            return
+        keys = np.load(self._path("keys.npy"))
+        ticks = np.load(self._path("ticks.npy"))
+        if len(keys) != self._max_entries:
+            raise ValueError(
+                f"Cache at {self._cache_dir} holds {len(keys)} entries, expected {self._max_entries}."
+            )
+        if keys.dtype.kind == "S":
+            # Older caches stored digests as "S32" strings, whose raw buffer keeps any trailing NUL bytes.
+            keys = np.frombuffer(keys.astype("S32").tobytes(), dtype=np.uint8).reshape(len(keys), 32).copy()
+        self._keys, self._ticks = keys, ticks
+        size = os.path.getsize(self._path("vectors.f32"))
+        dimension = size // (4 * self._max_entries)
+        if self._dimension is not None and dimension != self._dimension:
+            raise ValueError(
+                f"Cache at {self._cache_dir} holds {dimension}-dimensional embeddings, expected {self._dimension}."
+            )
+        self._vectors = np.memmap(
+            self._path("vectors.f32"), dtype=np.float32, mode="r+", shape=(self._max_entries, dimension)
+        )
+        occupied = np.flatnonzero(ticks)
+        occupied = occupied[np.argsort(ticks[occupied], kind="stable")]
+        self._rows = {keys[row].tobytes(): int(row) for row in occupied}
+        self._lru = OrderedDict((int(row), None) for row in occupied)
+        self._tick = int(ticks.max()) if len(ticks) else 0
+
+    def _allocate(self, dimension: int) -> None:
+        """
+        Create the memory-mapped embedding matrix once the embedding dimension is known.
+
+        :param int dimension: The dimensionality of the stored embeddings.
+        """
+        self._vectors = np.memmap(
+            self._path("vectors.f32"), dtype=np.float32, mode="w+", shape=(self._max_entries, dimension)
+        )
+
+    def get(self, key: bytes) -> Optional[List[float]]:
+        """
+        Look up an embedding, counting the hit or miss.
+
+        :param bytes key: The key built with `make_key`.
+        :returns: The cached embedding, or None on a miss.
+        """
+        with self._lock:
+            row = self._rows.get(key)
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._touch(row)
+            return self._vectors[row].tolist()
+
+    def _touch(self, row: int) -> None:
+        """
+        Mark a row as the most recently used.
+
+        :param int row: The row.
+        """
+        self._tick += 1
+        self._ticks[row] = self._tick
+        self._lru[row] = None
+        self._lru.move_to_end(row)
+
+    def put(self, key: bytes, embedding: List[float]) -> None:
+        """
+        Store an embedding, evicting the least recently used entry if the cache is full.
+
+        :param bytes key: The key built with `make_key`.
+        :param list[float] embedding: The embedding to store.
+        :raises ValueError: If the embedding does not have the dimension of the stored embeddings.
+        """
+        with self._lock:
+            if self._vectors is None:
+                self._allocate(len(embedding))
+            if len(embedding) != self._vectors.shape[1]:
+                raise ValueError(
+                    f"Cannot store a {len(embedding)}-dimensional embedding in the cache at {self._cache_dir}, "
+                    f"which holds {self._vectors.shape[1]}-dimensional embeddings."
+                )
+            row = self._rows.get(key)
+            if row is None:
+                if len(self._rows) < self._max_entries:
+                    row = len(self._rows)
+                else:
+                    row, _ = self._lru.popitem(last=False)
+                    del self._rows[self._keys[row].tobytes()]
+                    self.evictions += 1
+                self._rows[key] = row
+                self._keys[row] = np.frombuffer(key, dtype=np.uint8)
+            self._touch(row)
+            self._vectors[row] = embedding
+            self._unsaved += 1
+
+    @property
+    def unsaved(self) -> int:
+        """
+        The number of embeddings stored since the cache was last persisted.
+        """
+        return self._unsaved
+
+    def persist(self) -> None:
+        """
+        Flush the embedding matrix and write the key index to disk.
+        """
+        with self._lock:
+            if self._vectors is None:
+                return
+            self._vectors.flush()
+            np.save(self._path("keys.npy"), self._keys)
+            np.save(self._path("ticks.npy"), self._ticks)
+            self._unsaved = 0
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Get the cache counters.
+
+        :returns: The number of entries, hits, misses and evictions.
+        """
+        return {
+            "entries": len(self._rows),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class CachedEmbedding(BaseEmbedding):
+    """
+    An embedding model wrapper that serves repeated texts from a persistent `EmbeddingCache`.
+
+    Embeddings are keyed by the wrapped model's name, its dimensions and the exact text, so it can be
+    used in place of the wrapped model both by `DataIndexer` and by `PineconeRetriever`. Each model and
+    dimension gets its own subdirectory of `cache_dir`, so models can share it.
+
+    :param BaseEmbedding embed_model: The embedding model used on cache misses.
+    :param str cache_dir: The directory in which the cache files are stored.
+    :param int max_entries: The maximum number of cached embeddings.
+    :param bool autosave: Whether to persist the cache once `autosave_every` new embeddings are stored,
+        and at interpreter exit. Persisting rewrites the key index, so it is not done on every miss.
+    :param int autosave_every: The number of new embeddings after which the cache is persisted.
+    """
+
+    _embed_model: BaseEmbedding = PrivateAttr()
+    _cache: EmbeddingCache = PrivateAttr()
+    _namespace: str = PrivateAttr()
+    _autosave: bool = PrivateAttr()
+    _autosave_every: int = PrivateAttr()
+
+    def __init__(
+        self,
+        embed_model: BaseEmbedding,
+        cache_dir: str,
+        max_entries: int = 200_000,
+        autosave: bool = True,
+        autosave_every: int = 1000,
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(
+            model_name=embed_model.model_name,
+            embed_batch_size=embed_model.embed_batch_size,
+            **kwargs,
+        )
+        self._embed_model = embed_model
+        dimensions = getattr(embed_model, 'dimensions', None)
+        self._namespace = f"{embed_model.model_name}:{dimensions}"
+        self._cache = EmbeddingCache(
+            os.path.join(cache_dir, re.sub(r"[^\w.-]+", "_", self._namespace)),
+            max_entries=max_entries,
+            dimension=dimensions,
+        )
+        self._autosave = autosave
+        self._autosave_every = autosave_every
+        if autosave:
+            atexit.register(self._cache.persist)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbedding"
+
+    @property
+    def cache(self) -> EmbeddingCache:
+        """
+        Get the underlying embedding cache.
+
+        :returns: The embedding cache.
+        """
+        return self._cache
+
+    def _key(self, kind: str, text: str) -> bytes:
+        return EmbeddingCache.make_key(self._namespace, kind, text)
+
+    @property
+    def embed_model(self) -> BaseEmbedding:
+        """
+        Get the wrapped embedding model, e.g. to make a call that bypasses the cache.
+
+        :returns: The embedding model used on cache misses.
+        """
+        return self._embed_model
+
+    def _store(self, keys: List[bytes], embeddings: List[Embedding]) -> bool:
+        """
+        Store new embeddings.
+
+        :returns: Whether the cache is due to be persisted.
+        """
+        for key, embedding in zip(keys, embeddings):
+            self._cache.put(key, embedding)
+        return self._autosave and self._cache.unsaved >= self._autosave_every
+
+    def _get_query_embedding(self, query: str) -> Embedding:
+        key = self._key("query", query)
+        embedding = self._cache.get(key)
+        if embedding is None:
+            embedding = self._embed_model.get_query_embedding(query)
+            if self._store([key], [embedding]):
+                self._cache.persist()
+        return embedding
+
+    async def _aget_query_embedding(self, query: str) -> Embedding:
+        key = self._key("query", query)
+        embedding = self._cache.get(key)
+        if embedding is None:
+            embedding = await self._embed_model.aget_query_embedding(query)
+            if self._store([key], [embedding]):
+                await asyncio.to_thread(self._cache.persist)
+        return embedding
+
+    async def aget_query_embedding_batch(self, queries: List[str]) -> List[Embedding]:
+        """
+        Embed many queries, serving repeated ones from the cache and embedding the others with
+        `aget_query_embeddings` on the wrapped model.
+
+        :param list[str] queries: The queries.
+        :returns: The query embeddings, in order.
+        """
+        with self.callback_manager.event(CBEventType.EMBEDDING, payload={EventPayload.SERIALIZED: self.to_dict()}) as event:
+            keys = [self._key("query", query) for query in queries]
+            embeddings = [self._cache.get(key) for key in keys]
+            missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+            if missing:
+                computed = await aget_query_embeddings(self._embed_model, [queries[i] for i in missing])
+                for i, embedding in zip(missing, computed):
+                    embeddings[i] = embedding
+                if self._store([keys[i] for i in missing], computed):
+                    await asyncio.to_thread(self._cache.persist)
+            event.on_end(payload={EventPayload.CHUNKS: queries, EventPayload.EMBEDDINGS: embeddings})
+        return embeddings
+
+    def _get_text_embedding(self, text: str) -> Embedding:
+        return self._get_text_embeddings([text])[0]
+
+    async def _aget_text_embedding(self, text: str) -> Embedding:
+        return (await self._aget_text_embeddings([text]))[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        keys = [self._key("text", text) for text in texts]
+        embeddings = [self._cache.get(key) for key in keys]
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            computed = self._embed_model.get_text_embedding_batch([texts[i] for i in missing])
+            for i, embedding in zip(missing, computed):
+                embeddings[i] = embedding
+            if self._store([keys[i] for i in missing], computed):
+                self._cache.persist()
+        return embeddings
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        keys = [self._key("text", text) for text in texts]
+        embeddings = [self._cache.get(key) for key in keys]
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            computed = await self._embed_model.aget_text_embedding_batch([texts[i] for i in missing])
+            for i, embedding in zip(missing, computed):
+                embeddings[i] = embedding
+            if self._store([keys[i] for i in missing], computed):
+                await asyncio.to_thread(self._cache.persist)
+        return embeddings
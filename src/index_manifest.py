@@ -0,0 +1,54 @@
+import json
+import os
+from typing import Dict, List
+from llama_index.core.schema import TextNode
+
+
+class IndexManifest:
+    """
+    A local record of the nodes stored in a vector index and the content hash each was indexed with.
+
+    The manifest is what makes incremental re-indexing possible: comparing it against a freshly
+    ingested set of nodes tells which nodes are new or changed and which were removed.
+
+    :param str path: The path of the JSON file in which the manifest is stored.
+    """
+
+    def __init__(self, path: str):
+        self._path = path
+        self._hashes: Dict[str, str] = {}
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                self._hashes = json.load(f)
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+    def diff(self, nodes: List[TextNode]) -> Dict[str, List]:
+        """
+        Compare the manifest with the current set of nodes.
+
+        :param list[TextNode] nodes: The nodes produced by the latest ingestion.
+        :returns: A dict with the nodes to upsert under "upsert" and the node IDs to delete under "delete".
+        """
+        current = {node.node_id for node in nodes}
+        return {
+            "upsert": [node for node in nodes if self._hashes.get(node.node_id) != node.hash],
+            "delete": [node_id for node_id in self._hashes if node_id not in current],
+        }
+
+    def update(self, upserted: List[TextNode], deleted: List[str]) -> None:
+        """
+        Record upserted and deleted nodes and write the manifest to disk.
+
+        :param list[TextNode] upserted: The nodes that were written to the vector index.
+        :param list[str] deleted: The IDs of the nodes that were removed from the vector index.
+        """
+        for node_id in deleted:
+            self._hashes.pop(node_id, None)
+        for node in upserted:
+            self._hashes[node.node_id] = node.hash
+        tmp_path = f"{self._path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._hashes, f)
+        os.replace(tmp_path, self._path)
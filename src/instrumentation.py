@@ -0,0 +1,437 @@
+import csv
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, AsyncGenerator, Callable, Dict, Generator, Iterator, List, Optional, Tuple
+from llama_index.core.callbacks import CBEventType, EventPayload
+from llama_index.core.callbacks.base_handler import BaseCallbackHandler
+from llama_index.core.callbacks.token_counting import get_llm_token_counts
+from llama_index.core.utilities.token_counting import TokenCounter
+
+
+_current_stage: ContextVar[Optional[str]] = ContextVar("moviemate_stage", default=None)
+_current_trace: ContextVar[Optional[List[Dict[str, Any]]]] = ContextVar("moviemate_trace", default=None)
+_open_calls: ContextVar[Tuple[CBEventType, ...]] = ContextVar("moviemate_open_calls", default=())
+
+
+class RollingHistogram:
+    """
+    A histogram over the most recent observations of a metric.
+
+    :param int window: The number of most recent observations used for percentiles.
+    """
+
+    def __init__(self, window: int = 1000):
+        self._values = deque(maxlen=window)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self._values.append(value)
+        self.count += 1
+        self.sum += value
+
+    def percentiles(self, quantiles: Tuple[float, ...] = (0.5, 0.95, 0.99)) -> Dict[float, float]:
+        """
+        Compute nearest-rank percentiles over the window.
+
+        :param tuple quantiles: The quantiles to compute, between 0 and 1.
+        :returns: The value of each quantile, or an empty dict if nothing was observed.
+        """
+        values = sorted(self._values)
+        if not values:
+            return {}
+        return {q: values[min(len(values) - 1, int(q * len(values)))] for q in quantiles}
+
+
+class Span:
+    """
+    A timed stage of a request, recorded when the `with` block exits.
+
+    :param Instrumentation instrumentation: The instrumentation the span is recorded in.
+    :param str name: The name of the stage.
+    """
+
+    __slots__ = ("_instrumentation", "name", "attributes", "_start", "_token")
+
+    def __init__(self, instrumentation: "Instrumentation", name: str):
+        self._instrumentation = instrumentation
+        self.name = name
+        self.attributes: Dict[str, Any] = {}
+
+    def set(self, **attributes: Any) -> None:
+        """
+        Attach attributes, such as the number of retrieved nodes, to the span.
+        """
+        self.attributes.update(attributes)
+
+    def __enter__(self) -> "Span":
+        self._token = _current_stage.set(self.name)
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        seconds = time.perf_counter() - self._start
+        _current_stage.reset(self._token)
+        self._instrumentation.record_span(self.name, seconds, **self.attributes)
+
+
+class _NullSpan:
+    """
+    The span returned while instrumentation is disabled; it records nothing.
+    """
+
+    __slots__ = ()
+
+    def set(self, **attributes: Any) -> None:
+        pass
+
+    def __enter__(self) -> "_NullSpan":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Instrumentation:
+    """
+    Per-stage latency, token and size metrics for the chat pipeline.
+
+    Stages are timed with `span`, and every numeric attribute set on a span is also tracked as a
+    metric of that stage. Metrics are kept as rolling histograms (p50/p95/p99) and can be exported
+    as JSON, CSV or Prometheus text. Spans recorded inside `request` are also collected into a
+    per-request trace passed to every registered sink. While disabled, `span` returns a shared
+    no-op object, so instrumented code pays only an attribute lookup.
+
+    :param bool enabled: Whether metrics are recorded.
+    :param int window: The number of most recent observations kept per metric.
+    """
+
+    def __init__(self, enabled: bool = False, window: int = 1000):
+        self.enabled = enabled
+        self._window = window
+        self._histograms: Dict[Tuple[str, str], RollingHistogram] = {}
+        self._sinks: List[Callable[[Dict[str, Any]], None]] = []
+        self._lock = threading.Lock()
+
+    def enable(self) -> None:
+        self.enabled = True
+
+    def disable(self) -> None:
+        self.enabled = False
+
+    def reset(self) -> None:
+        """
+        Discard all recorded metrics.
+        """
+        with self._lock:
+            self._histograms = {}
+
+    def add_sink(self, sink: Callable[[Dict[str, Any]], None]) -> None:
+        """
+        Register a function called with the trace of every finished request.
+
+        :param Callable sink: The function receiving each trace dict.
+        """
+        self._sinks.append(sink)
+
+    def span(self, name: str) -> Any:
+        """
+        Time a stage of the pipeline.
+
+        :param str name: The name of the stage.
+        :returns: A context manager recording the span on exit.
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        return Span(self, name)
+
+    def observe(self, metric: str, stage: str, value: float) -> None:
+        """
+        Record an observation of a metric for a stage.
+
+        :param str metric: The metric name, e.g. "seconds" or "prompt_tokens".
+        :param str stage: The stage the observation belongs to.
+        :param float value: The observed value.
+        """
+        key = (metric, stage)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = RollingHistogram(self._window)
+            histogram.observe(value)
+
+    def record_span(self, name: str, seconds: float, **attributes: Any) -> None:
+        """
+        Record a finished span, adding it to the current request trace if there is one.
+
+        :param str name: The name of the stage.
+        :param float seconds: The wall time of the stage.
+        :param attributes: Additional span attributes; numeric ones are tracked as metrics.
+        """
+        if not self.enabled:
+            return
+        self.observe("seconds", name, seconds)
+        for key, value in attributes.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                self.observe(key, name, value)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.append({"stage": name, "seconds": seconds, **attributes})
+
+    @contextmanager
+    def request(self, name: str = "chat") -> Iterator[None]:
+        """
+        Collect the spans recorded in the block into a request trace and pass it to the sinks.
+
+        :param str name: The name of the request type.
+        """
+        if not self.enabled:
+            yield
+            return
+        trace: List[Dict[str, Any]] = []
+        token = _current_trace.set(trace)
+        started_at = time.time()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            _current_trace.reset(token)
+            self.observe("seconds", name, seconds)
+            record = {"request": name, "started_at": started_at, "seconds": seconds, "spans": trace}
+            for sink in self._sinks:
+                sink(record)
+
+    def wrap_stream(self, tokens: Generator[str, None, None], stage: str) -> Generator[str, None, None]:
+        """
+        Wrap a token stream to record its time to first token and total streaming time.
+
+        :param Generator tokens: The token stream.
+        :param str stage: The stage the stream belongs to.
+        :returns: The wrapped token stream.
+        """
+        if not self.enabled:
+            return tokens
+
+        def generate() -> Generator[str, None, None]:
+            start = time.perf_counter()
+            first_token = None
+            for token in tokens:
+                if first_token is None:
+                    first_token = time.perf_counter() - start
+                yield token
+            self.record_span(f"{stage}.stream", time.perf_counter() - start, time_to_first_token=first_token or 0.0)
+
+        return generate()
+
+    def wrap_astream(self, tokens: AsyncGenerator[str, None], stage: str) -> AsyncGenerator[str, None]:
+        """
+        Wrap an async token stream to record its time to first token and total streaming time.
+
+        :param AsyncGenerator tokens: The async token stream.
+        :param str stage: The stage the stream belongs to.
+        :returns: The wrapped async token stream.
+        """
+        if not self.enabled:
+            return tokens
+
+        async def generate() -> AsyncGenerator[str, None]:
+            start = time.perf_counter()
+            first_token = None
+            async for token in tokens:
+                if first_token is None:
+                    first_token = time.perf_counter() - start
+                yield token
+            self.record_span(f"{stage}.stream", time.perf_counter() - start, time_to_first_token=first_token or 0.0)
+
+        return generate()
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """
+        Summarize every metric.
+
+        :returns: One row per metric and stage with its count, sum, p50, p95 and p99.
+        """
+        with self._lock:
+            items = list(self._histograms.items())
+        rows = []
+        for (metric, stage), histogram in sorted(items):
+            percentiles = histogram.percentiles()
+            rows.append({
+                "metric": metric,
+                "stage": stage,
+                "count": histogram.count,
+                "sum": histogram.sum,
+                "p50": percentiles.get(0.5),
+                "p95": percentiles.get(0.95),
+                "p99": percentiles.get(0.99),
+            })
+        return rows
+
+    def export_json(self, path: str) -> None:
+        with open(path, "w") as f:
+            json.dump(self.snapshot(), f, indent=2)
+
+    def export_csv(self, path: str) -> None:
+        rows = self.snapshot()
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=["metric", "stage", "count", "sum", "p50", "p95", "p99"])
+            writer.writeheader()
+            writer.writerows(rows)
+
+    def prometheus_text(self) -> str:
+        """
+        Render every metric in the Prometheus text exposition format, as summaries.
+
+        :returns: The exposition text.
+        """
+        lines = []
+        for row in self.snapshot():
+            name = f"moviemate_{row['metric']}"
+            labels = f'stage="{row["stage"]}"'
+            for quantile, column in (("0.5", "p50"), ("0.95", "p95"), ("0.99", "p99")):
+                value = row[column]
+                if value is not None:
+                    lines.append(f'{name}{{{labels},quantile="{quantile}"}} {value}')
+            lines.append(f"{name}_count{{{labels}}} {row['count']}")
+            lines.append(f"{name}_sum{{{labels}}} {row['sum']}")
+        return "\n".join(lines) + "\n"
+
+    def serve_prometheus(self, port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+        """
+        Serve `prometheus_text` over HTTP from a background thread.
+
+        :param int port: The port to listen on.
+        :param str host: The interface to bind.
+        :returns: The running server.
+        """
+        instrumentation = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                body = instrumentation.prometheus_text().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args: Any) -> None:
+                pass
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+    def callback_handler(self, tokenizer: Optional[Callable[[str], List]] = None) -> "InstrumentationHandler":
+        """
+        Build a llama_index callback handler that records LLM and embedding calls.
+
+        :param Callable tokenizer: The tokenizer used to count tokens, defaults to the global tokenizer.
+        :returns: The callback handler, to be added to a `CallbackManager`.
+        """
+        return InstrumentationHandler(self, tokenizer=tokenizer)
+
+
+class JsonLinesSink:
+    """
+    A request trace sink appending one JSON object per request to a file.
+
+    :param str path: The path of the file.
+    """
+
+    def __init__(self, path: str):
+        self._path = path
+        self._lock = threading.Lock()
+
+    def __call__(self, record: Dict[str, Any]) -> None:
+        line = json.dumps(record, default=str) + "\n"
+        with self._lock, open(self._path, "a") as f:
+            f.write(line)
+
+
+class InstrumentationHandler(BaseCallbackHandler):
+    """
+    A callback handler timing LLM and embedding calls and counting their tokens.
+
+    Calls are attributed to the pipeline stage active when they start, e.g. "synthesis.llm" for LLM
+    calls made while synthesizing, and "chat.llm" for the condense or agent step of the chat engine.
+    A call nested in an open call of the same type, such as the wrapped model of a `CachedEmbedding`
+    emitting its own events, is counted only once, as the outer call.
+
+    :param Instrumentation instrumentation: The instrumentation the calls are recorded in.
+    :param Callable tokenizer: The tokenizer used to count tokens.
+    """
+
+    def __init__(self, instrumentation: Instrumentation, tokenizer: Optional[Callable[[str], List]] = None):
+        super().__init__(event_starts_to_ignore=[], event_ends_to_ignore=[])
+        self._instrumentation = instrumentation
+        self._token_counter = TokenCounter(tokenizer=tokenizer)
+        self._starts: Dict[str, Tuple[float, str, Tuple[CBEventType, ...]]] = {}
+
+    def on_event_start(
+        self,
+        event_type: CBEventType,
+        payload: Optional[Dict[str, Any]] = None,
+        event_id: str = "",
+        parent_id: str = "",
+        **kwargs: Any,
+    ) -> str:
+        if not self._instrumentation.enabled or event_type not in (CBEventType.LLM, CBEventType.EMBEDDING):
+            return event_id
+        open_calls = _open_calls.get()
+        if event_type in open_calls:
+            # A wrapped model, e.g. the one behind a CachedEmbedding, reporting the same call again.
+            return event_id
+        _open_calls.set(open_calls + (event_type,))
+        self._starts[event_id] = (time.perf_counter(), _current_stage.get() or "chat", open_calls)
+        return event_id
+
+    def on_event_end(
+        self,
+        event_type: CBEventType,
+        payload: Optional[Dict[str, Any]] = None,
+        event_id: str = "",
+        **kwargs: Any,
+    ) -> None:
+        start = self._starts.pop(event_id, None)
+        if start is None:
+            return
+        started, stage, open_calls = start
+        _open_calls.set(open_calls)
+        if payload is None:
+            return
+        seconds = time.perf_counter() - started
+        if event_type == CBEventType.LLM:
+            counts = get_llm_token_counts(self._token_counter, payload)
+            self._instrumentation.record_span(
+                f"{stage}.llm",
+                seconds,
+                prompt_tokens=counts.prompt_token_count,
+                completion_tokens=counts.completion_token_count,
+            )
+        else:
+            chunks = payload.get(EventPayload.CHUNKS, [])
+            tokens = sum(self._token_counter.get_string_tokens(chunk) for chunk in chunks)
+            self._instrumentation.record_span(f"{stage}.embedding", seconds, embedding_tokens=tokens)
+
+    def start_trace(self, trace_id: Optional[str] = None) -> None:
+        pass
+
+    def end_trace(
+        self,
+        trace_id: Optional[str] = None,
+        trace_map: Optional[Dict[str, List[str]]] = None,
+    ) -> None:
+        pass
+
+
+metrics = Instrumentation()
@@ -0,0 +1,556 @@
+import json
+import os
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.schema import BaseNode, TextNode
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    VectorStoreQuery,
+    VectorStoreQueryResult,
+)
+from llama_index.core.vector_stores.utils import metadata_dict_to_node, node_to_metadata_dict
+
+
+def _matches_condition(value: Any, operator: str, target: Any) -> bool:
+    if operator in ("$eq", "$ne", "$in", "$nin"):
+        targets = set(target) if operator in ("$in", "$nin") else {target}
+        matched = bool(targets.intersection(value)) if isinstance(value, list) else value in targets
+        return not matched if operator in ("$ne", "$nin") else matched
+    if not isinstance(value, (int, float)) or isinstance(value, bool):
+        return False
+    if operator == "$gt":
+        return value > target
+    if operator == "$gte":
+        return value >= target
+    if operator == "$lt":
+        return value < target
+    if operator == "$lte":
+        return value <= target
+    raise ValueError(f"Unsupported filter operator: {operator}")
+
+
+def matches_filters(metadata: Dict[str, Any], filters: Dict[str, Any]) -> bool:
+    """
+    Evaluate Pinecone-style metadata filters on the metadata of a single node.
+
+    This is the row-wise counterpart of `filter_mask`, used to filter small candidate sets.
+
+    :param dict metadata: The node metadata.
+    :param dict filters: The metadata filters.
+    :returns: True if the metadata satisfies the filters.
+    """
+    for key, condition in filters.items():
+        if key == "$and":
+            if not all(matches_filters(metadata, sub_filters) for sub_filters in condition):
+                return False
+        elif key == "$or":
+            if not any(matches_filters(metadata, sub_filters) for sub_filters in condition):
+                return False
+        else:
+            if not isinstance(condition, dict):
+                condition = {"$eq": condition}
+            value = metadata.get(key)
+            if not all(_matches_condition(value, operator, target) for operator, target in condition.items()):
+                return False
+    return True
+
+
+def metadata_column(values: Iterable[Any]) -> np.ndarray:
+    """
+    Build a column from the values of a metadata field, float64 (NaN for missing) when numeric and
+    object otherwise.
+
+    :param Iterable values: The value of the field in each row.
+    :returns: The column with one value per row.
+    """
+    values = list(values)
+    numeric = all(
+        value is None or (isinstance(value, (int, float)) and not isinstance(value, bool))
+        for value in values
+    )
+    if numeric:
+        return np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+    column = np.empty(len(values), dtype=object)
+    column[:] = values
+    return column
+
+
+def _match_column(column: np.ndarray, condition: Any) -> np.ndarray:
+    """
+    Evaluate the condition on a single metadata column.
+
+    :param np.ndarray column: The column, see `metadata_column`.
+    :param condition: A value to match, or a dict of operators to values.
+    :returns: A boolean mask over the rows.
+    """
+    if not isinstance(condition, dict):
+        condition = {"$eq": condition}
+    mask = np.ones(len(column), dtype=bool)
+    for operator, value in condition.items():
+        if operator in ("$eq", "$ne", "$in", "$nin"):
+            values = set(value) if operator in ("$in", "$nin") else {value}
+            if column.dtype == object:
+                matched = np.fromiter(
+                    (
+                        bool(values.intersection(item)) if isinstance(item, list) else item in values
+                        for item in column
+                    ),
+                    dtype=bool,
+                    count=len(column),
+                )
+            else:
+                matched = np.isin(column, list(values))
+            mask &= ~matched if operator in ("$ne", "$nin") else matched
+        elif operator in ("$gt", "$gte", "$lt", "$lte"):
+            if column.dtype == object:
+                column = np.array(
+                    [item if isinstance(item, (int, float)) else np.nan for item in column], dtype=np.float64
+                )
+            with np.errstate(invalid="ignore"):
+                if operator == "$gt":
+                    mask &= column > value
+                elif operator == "$gte":
+                    mask &= column >= value
+                elif operator == "$lt":
+                    mask &= column < value
+                else:
+                    mask &= column <= value
+        else:
+            raise ValueError(f"Unsupported filter operator: {operator}")
+    return mask
+
+
+def filter_mask(filters: Dict[str, Any], column: Callable[[str], np.ndarray], size: int) -> np.ndarray:
+    """
+    Evaluate Pinecone-style metadata filters on metadata columns.
+
+    :param dict filters: The metadata filters.
+    :param Callable column: Returns the column of a metadata field, see `metadata_column`.
+    :param int size: The number of rows.
+    :returns: A boolean mask over the rows.
+    """
+    mask = np.ones(size, dtype=bool)
+    for key, condition in filters.items():
+        if key == "$and":
+            for sub_filters in condition:
+                mask &= filter_mask(sub_filters, column, size)
+        elif key == "$or":
+            any_mask = np.zeros(size, dtype=bool)
+            for sub_filters in condition:
+                any_mask |= filter_mask(sub_filters, column, size)
+            mask &= any_mask
+        else:
+            mask &= _match_column(column(key), condition)
+    return mask
+
+
+class LocalVectorStore(BasePydanticVectorStore):
+    """
+    A local, in-process vector store that can be used in place of the Pinecone vector store.
+
+    Vectors are kept in a float32 matrix, memory-mapped from `persist_dir` when loaded from disk, and
+    top-k queries are answered with a dot product and `argpartition`, matching the "dotproduct" metric
+    of the Pinecone index. Metadata filters follow the Pinecone filter syntax accepted by
+    `PineconeRetriever.set_filters` (equality, `$ne`, `$in`, `$nin`, `$gt`, `$gte`, `$lt`, `$lte`,
+    `$and`, `$or`) and are evaluated over columnar metadata arrays. After `build_ivf` is called, queries
+    only score the vectors in the `nprobe` closest inverted lists. After `build_shortlist` is called, a
+    truncated, renormalised (and optionally int8-quantised) copy of the Matryoshka embeddings is kept
+    alongside the full vectors, and queries given a `shortlist_k` score that copy first and rescore only
+    the `shortlist_k` best rows exactly with the full vectors.
+
+    Row-aligned arrays grow geometrically on `add`, so bulk loads take amortized linear time, and
+    writes and queries are serialized with a lock, so concurrent upserts (e.g. from
+    `DataIndexer.add_to_vector_store` with several workers) keep IDs, vectors and shortlist rows aligned.
+
+    :param str persist_dir: The directory the store is loaded from and persisted to, if any.
+    :param int nprobe: The number of inverted lists scanned per query in approximate mode.
+    """
+
+    stores_text: bool = True
+    persist_dir: Optional[str] = None
+    nprobe: int = 8
+
+    _vectors: np.ndarray = PrivateAttr()
+    _ids: List[str] = PrivateAttr()
+    _payloads: List[Dict[str, Any]] = PrivateAttr()
+    _metadata: List[Dict[str, Any]] = PrivateAttr()
+    _alive: np.ndarray = PrivateAttr()
+    _rows: Dict[str, int] = PrivateAttr()
+    _columns: Dict[str, np.ndarray] = PrivateAttr()
+    _centroids: Optional[np.ndarray] = PrivateAttr()
+    _assignments: Optional[np.ndarray] = PrivateAttr()
+    _shortlist: Optional[np.ndarray] = PrivateAttr()
+    _shortlist_scales: Optional[np.ndarray] = PrivateAttr()
+    _buffers: Dict[str, np.ndarray] = PrivateAttr()
+    _lock: Any = PrivateAttr()
+
+    def __init__(self, persist_dir: Optional[str] = None, nprobe: int = 8, **kwargs: Any) -> None:
+        super().__init__(persist_dir=persist_dir, nprobe=nprobe, **kwargs)
+        self._vectors = np.zeros((0, 0), dtype=np.float32)
+        self._ids = []
+        self._payloads = []
+        self._metadata = []
+        self._alive = np.zeros(0, dtype=bool)
+        self._rows = {}
+        self._columns = {}
+        self._centroids = None
+        self._assignments = None
+        self._shortlist = None
+        self._shortlist_scales = None
+        self._buffers = {}
+        self._lock = threading.RLock()
+        if persist_dir and os.path.exists(os.path.join(persist_dir, "store.json")):
+            self._load()
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "LocalVectorStore"
+
+    @property
+    def client(self) -> None:
+        return None
+
+    def __len__(self) -> int:
+        return int(self._alive.sum())
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.persist_dir, name)
+
+    def _load(self) -> None:
+        """
+        Load a persisted store, memory-mapping its vector matrix.
+        """
+        with open(self._path("store.json"), "r") as f:
+            info = json.load(f)
+        count, dimension = info["count"], info["dimension"]
+        if count:
+            self._vectors = np.memmap(self._path("vectors.f32"), dtype=np.float32, mode="r", shape=(count, dimension))
+        else:
+            self._vectors = np.zeros((0, 0), dtype=np.float32)
+        with open(self._path("nodes.jsonl"), "r") as f:
+            records = [json.loads(line) for line in f]
+        self._ids = [record["id"] for record in records]
+        self._metadata = [record["metadata"] for record in records]
+        self._payloads = [record["node"] for record in records]
+        self._columns = {}
+        self._alive = np.ones(count, dtype=bool)
+        self._rows = {node_id: row for row, node_id in enumerate(self._ids)}
+        if os.path.exists(self._path("centroids.npy")):
+            self._centroids = np.load(self._path("centroids.npy"))
+            self._assignments = np.load(self._path("assignments.npy"))
+        if os.path.exists(self._path("shortlist.npy")):
+            self._shortlist = np.load(self._path("shortlist.npy"))
+            scales = self._path("shortlist_scales.npy")
+            self._shortlist_scales = np.load(scales) if os.path.exists(scales) else None
+
+    def persist(self, persist_dir: Optional[str] = None) -> None:
+        """
+        Write the store to disk, dropping deleted rows.
+
+        :param str persist_dir: The directory to write to, defaults to the store's `persist_dir`.
+        """
+        with self._lock:
+            self.persist_dir = persist_dir or self.persist_dir
+            if self.persist_dir is None:
+                raise ValueError("A persist_dir is required to persist the vector store.")
+            os.makedirs(self.persist_dir, exist_ok=True)
+            rows = np.flatnonzero(self._alive)
+            vectors = np.ascontiguousarray(self._vectors[rows], dtype=np.float32)
+            vectors.tofile(self._path("vectors.f32.tmp"))
+            with open(self._path("nodes.jsonl"), "w") as f:
+                for row in rows:
+                    record = {"id": self._ids[row], "metadata": self._metadata[row], "node": self._payloads[row]}
+                    f.write(json.dumps(record) + "\n")
+            if self._centroids is not None:
+                np.save(self._path("centroids.npy"), self._centroids)
+                np.save(self._path("assignments.npy"), self._assignments[rows])
+            if self._shortlist is not None:
+                np.save(self._path("shortlist.npy"), self._shortlist[rows])
+                if self._shortlist_scales is not None:
+                    np.save(self._path("shortlist_scales.npy"), self._shortlist_scales[rows])
+                elif os.path.exists(self._path("shortlist_scales.npy")):
+                    os.remove(self._path("shortlist_scales.npy"))
+            with open(self._path("store.json"), "w") as f:
+                json.dump({"count": len(rows), "dimension": vectors.shape[1] if len(rows) else 0}, f)
+            os.replace(self._path("vectors.f32.tmp"), self._path("vectors.f32"))
+            self._load()
+
+    def add(self, nodes: List[BaseNode], **add_kwargs: Any) -> List[str]:
+        """
+        Add nodes with their embeddings, replacing any stored node with the same ID.
+
+        :param list[BaseNode] nodes: The nodes to add, with embeddings set.
+        :returns: The IDs of the added nodes.
+        """
+        if not nodes:
+            return []
+        vectors = np.asarray([node.get_embedding() for node in nodes], dtype=np.float32)
+        payloads = [node_to_metadata_dict(node, remove_text=False, flat_metadata=False) for node in nodes]
+        with self._lock:
+            self.delete_nodes(node_ids=[node.node_id for node in nodes])
+            start = len(self._ids)
+            self._append_rows("_vectors", vectors)
+            for row, (node, payload) in enumerate(zip(nodes, payloads), start):
+                self._ids.append(node.node_id)
+                self._metadata.append(dict(node.metadata))
+                self._payloads.append(payload)
+                self._rows[node.node_id] = row
+            self._append_rows("_alive", np.ones(len(nodes), dtype=bool))
+            if self._centroids is not None:
+                self._append_rows("_assignments", self._assign(vectors))
+            if self._shortlist is not None:
+                codes, scales = self._encode_shortlist(vectors, self._shortlist.shape[1], self._shortlist_scales is not None)
+                self._append_rows("_shortlist", codes)
+                if scales is not None:
+                    self._append_rows("_shortlist_scales", scales)
+            self._columns = {}
+        return [node.node_id for node in nodes]
+
+    def _append_rows(self, name: str, rows: np.ndarray) -> None:
+        """
+        Append rows to a row-aligned array attribute, e.g. "_vectors". The attribute is kept as a view of
+        a buffer that doubles when full, so appending a batch does not copy the rows already stored.
+
+        :param str name: The name of the attribute.
+        :param np.ndarray rows: The rows to append.
+        """
+        current = getattr(self, name)
+        size = len(current)
+        buffer = self._buffers.get(name)
+        if buffer is None or current.base is not buffer or len(buffer) < size + len(rows):
+            buffer = np.empty((max(size + len(rows), 2 * size, 1024), *rows.shape[1:]), dtype=rows.dtype)
+            if size:
+                buffer[:size] = current
+            self._buffers[name] = buffer
+        buffer[size:size + len(rows)] = rows
+        setattr(self, name, buffer[:size + len(rows)])
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        """
+        Delete all nodes parsed from a document.
+
+        :param str ref_doc_id: The ID of the source document.
+        """
+        with self._lock:
+            for row, payload in enumerate(self._payloads):
+                if payload.get("ref_doc_id") == ref_doc_id:
+                    self._alive[row] = False
+                    self._rows.pop(self._ids[row], None)
+
+    def delete_nodes(self, node_ids: Optional[List[str]] = None, filters: Any = None, **delete_kwargs: Any) -> None:
+        """
+        Delete nodes by ID.
+
+        :param list[str] node_ids: The IDs of the nodes to delete.
+        """
+        with self._lock:
+            for node_id in node_ids or []:
+                row = self._rows.pop(node_id, None)
+                if row is not None:
+                    self._alive[row] = False
+
+    def _column(self, key: str) -> np.ndarray:
+        """
+        Get a metadata field as a column, see `metadata_column`.
+
+        :param str key: The metadata field.
+        :returns: The column with one value per row.
+        """
+        if key not in self._columns:
+            self._columns[key] = metadata_column(metadata.get(key) for metadata in self._metadata)
+        return self._columns[key]
+
+    def _filter_mask(self, filters: Dict[str, Any]) -> np.ndarray:
+        """
+        Evaluate a Pinecone-style filter dict.
+
+        :param dict filters: The metadata filters.
+        :returns: A boolean mask over the rows.
+        """
+        return filter_mask(filters, self._column, len(self._ids))
+
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        return np.argmax(vectors @ self._centroids.T, axis=1).astype(np.int32)
+
+    def build_ivf(self, n_lists: int = 256, n_iter: int = 10, seed: int = 0) -> None:
+        """
+        Cluster the stored vectors into inverted lists with spherical k-means, enabling approximate search.
+
+        :param int n_lists: The number of inverted lists (clusters).
+        :param int n_iter: The number of k-means iterations.
+        :param int seed: The random seed for the initial centroids.
+        """
+        with self._lock:
+            rows = np.flatnonzero(self._alive)
+            n_lists = min(n_lists, len(rows))
+            rng = np.random.default_rng(seed)
+            vectors = np.asarray(self._vectors[rows])
+            centroids = vectors[rng.choice(len(rows), n_lists, replace=False)]
+            for _ in range(n_iter):
+                assignments = np.argmax(vectors @ centroids.T, axis=1)
+                for i in range(n_lists):
+                    members = vectors[assignments == i]
+                    if len(members):
+                        centroid = members.mean(axis=0)
+                        centroids[i] = centroid / (np.linalg.norm(centroid) or 1.0)
+            self._centroids = centroids.astype(np.float32)
+            self._assignments = self._assign(np.asarray(self._vectors))
+
+    @staticmethod
+    def _encode_shortlist(vectors: np.ndarray, dimensions: int, quantize: bool) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """
+        Truncate vectors to their first dimensions and renormalise them, optionally quantising them
+        to int8 with one scale per row.
+
+        :param np.ndarray vectors: The full vectors.
+        :param int dimensions: The number of leading dimensions kept.
+        :param bool quantize: Whether to quantise to int8.
+        :returns: The encoded vectors, and the row scales if quantised, else None.
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if len(vectors) == 0:
+            codes = np.zeros((0, dimensions), dtype=np.int8 if quantize else np.float32)
+            return codes, np.zeros(0, dtype=np.float32) if quantize else None
+        truncated = vectors[:, :dimensions]
+        norms = np.linalg.norm(truncated, axis=1, keepdims=True)
+        truncated = np.divide(truncated, norms, out=np.zeros_like(truncated), where=norms > 0)
+        if not quantize:
+            return truncated, None
+        scales = np.abs(truncated).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.rint(truncated / scales[:, None]).astype(np.int8)
+        return codes, scales.astype(np.float32)
+
+    def build_shortlist(self, dimensions: int = 256, quantize: bool = False) -> None:
+        """
+        Keep a low-dimensional copy of the stored vectors for two-stage queries. Nodes added later are
+        encoded as they are added.
+
+        :param int dimensions: The number of leading (Matryoshka) dimensions kept.
+        :param bool quantize: Whether to quantise the copy to int8, a quarter of the float32 size.
+        """
+        with self._lock:
+            self._shortlist, self._shortlist_scales = self._encode_shortlist(
+                np.asarray(self._vectors), dimensions, quantize
+            )
+
+    @property
+    def shortlist_dimensions(self) -> Optional[int]:
+        """
+        The number of dimensions of the shortlist copy, or None if there is none.
+        """
+        return self._shortlist.shape[1] if self._shortlist is not None else None
+
+    @property
+    def nbytes(self) -> Dict[str, int]:
+        """
+        The size in bytes of the full vectors and of the shortlist copy.
+        """
+        shortlist = 0
+        if self._shortlist is not None:
+            shortlist = self._shortlist.nbytes + (self._shortlist_scales.nbytes if self._shortlist_scales is not None else 0)
+        return {"vectors": int(self._vectors.nbytes), "shortlist": int(shortlist)}
+
+    def query(
+        self,
+        query: VectorStoreQuery,
+        pinecone_query_filters: Optional[Dict[str, Any]] = None,
+        **kwargs: Any,
+    ) -> VectorStoreQueryResult:
+        """
+        Find the stored nodes with the highest dot product with the query embedding.
+
+        :param VectorStoreQuery query: The query, with its embedding and `similarity_top_k`.
+        :param dict pinecone_query_filters: Optional Pinecone-style metadata filters.
+        :param kwargs: `nprobe` overrides the number of inverted lists scanned; `shortlist_k` enables
+            two-stage scoring with the shortlist copy when one was built.
+        :returns: The top nodes, their similarities and IDs.
+        """
+        with self._lock:
+            mask = self._alive.copy()
+            if pinecone_query_filters:
+                mask &= self._filter_mask(pinecone_query_filters)
+            query_embedding = np.asarray(query.query_embedding, dtype=np.float32)
+            if self._centroids is not None:
+                nprobe = min(kwargs.get("nprobe", self.nprobe), len(self._centroids))
+                probes = np.argpartition(-(self._centroids @ query_embedding), nprobe - 1)[:nprobe]
+                mask &= np.isin(self._assignments, probes)
+            rows = np.flatnonzero(mask)
+            # Gathering rows copies them, so only selective masks (filters, probed lists) gather; otherwise
+            # every row is scored in place and the scores of excluded rows are dropped.
+            gather = len(rows) < len(mask) // 2
+            shortlist_k = kwargs.get("shortlist_k")
+            if shortlist_k and self._shortlist is not None and len(rows) > shortlist_k:
+                low_query, _ = self._encode_shortlist(query_embedding[None, :], self._shortlist.shape[1], False)
+                low_scores = self._scores(self._shortlist, low_query[0], rows if gather else None)
+                if not gather:
+                    low_scores = low_scores[rows]
+                if self._shortlist_scales is not None:
+                    low_scores *= self._shortlist_scales[rows]
+                rows = rows[np.argpartition(-low_scores, shortlist_k - 1)[:shortlist_k]]
+                gather = True
+            k = min(query.similarity_top_k, len(rows))
+            if k == 0:
+                return VectorStoreQueryResult(nodes=[], similarities=[], ids=[])
+            scores = self._scores(self._vectors, query_embedding, rows if gather else None)
+            if not gather:
+                scores = scores[rows]
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            nodes = [self._get_node(rows[i]) for i in top]
+            return VectorStoreQueryResult(
+                nodes=nodes,
+                similarities=scores[top].tolist(),
+                ids=[node.node_id for node in nodes],
+            )
+
+    @staticmethod
+    def _scores(matrix: np.ndarray, query_embedding: np.ndarray, rows: Optional[np.ndarray] = None, block_size: int = 65536) -> np.ndarray:
+        """
+        Compute the dot product of the query with every row of a matrix, or with the given rows, one block
+        at a time, so that at most one block is copied (to gather rows, or to widen int8 codes to float32).
+
+        :param np.ndarray matrix: The stored vectors or shortlist codes.
+        :param np.ndarray query_embedding: The query vector.
+        :param np.ndarray rows: The rows to score, or None for all rows.
+        :param int block_size: The number of rows scored at once.
+        :returns: The float32 scores, one per scored row.
+        """
+        count = len(matrix) if rows is None else len(rows)
+        scores = np.empty(count, dtype=np.float32)
+        for start in range(0, count, block_size):
+            block = matrix[start:start + block_size] if rows is None else matrix[rows[start:start + block_size]]
+            scores[start:start + block_size] = block.astype(np.float32, copy=False) @ query_embedding
+        return scores
+
+    async def aquery(
+        self,
+        query: VectorStoreQuery,
+        pinecone_query_filters: Optional[Dict[str, Any]] = None,
+        **kwargs: Any,
+    ) -> VectorStoreQueryResult:
+        """
+        Async counterpart of `query`. Queries are answered in memory without I/O, so they run inline.
+        """
+        return self.query(query, pinecone_query_filters=pinecone_query_filters, **kwargs)
+
+    def get_nodes(self, node_ids: Optional[List[str]] = None, filters: Any = None, **kwargs: Any) -> List[BaseNode]:
+        """
+        Get stored nodes by ID with their embeddings, skipping IDs that are not stored.
+
+        :param list[str] node_ids: The IDs of the nodes.
+        :returns: The nodes.
+        """
+        nodes = []
+        for node_id in node_ids or []:
+            row = self._rows.get(node_id)
+            if row is not None:
+                node = self._get_node(row)
+                node.embedding = self._vectors[row].tolist()
+                nodes.append(node)
+        return nodes
+
+    def _get_node(self, row: int) -> TextNode:
+        return metadata_dict_to_node(self._payloads[row])
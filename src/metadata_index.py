@@ -0,0 +1,288 @@
+import json
+import os
+import re
+from typing import Any, Dict, Iterable, List, Optional
+import numpy as np
+from llama_index.core.schema import TextNode
+
+
+CATEGORICAL_FIELDS = ['genres', 'directors', 'cast', 'original_language', 'spoken_languages']
+NUMERIC_FIELDS = ['release_year', 'averageRating', 'runtime', 'revenue']
+LANGUAGES = {
+    'english': 'en', 'korean': 'ko', 'japanese': 'ja', 'chinese': 'zh', 'mandarin': 'zh', 'cantonese': 'cn',
+    'french': 'fr', 'spanish': 'es', 'german': 'de', 'italian': 'it', 'hindi': 'hi', 'russian': 'ru',
+    'portuguese': 'pt', 'swedish': 'sv', 'danish': 'da', 'norwegian': 'no', 'turkish': 'tr', 'persian': 'fa',
+    'iranian': 'fa', 'thai': 'th', 'polish': 'pl', 'dutch': 'nl', 'arabic': 'ar', 'tamil': 'ta', 'telugu': 'te',
+}
+COMPARATORS = {
+    'after': '$gt', 'since': '$gte', 'before': '$lt', 'until': '$lte',
+    'above': '$gt', 'over': '$gt', 'more than': '$gt', 'at least': '$gte',
+    'below': '$lt', 'under': '$lt', 'less than': '$lt', 'at most': '$lte',
+    'longer than': '$gt', 'shorter than': '$lt',
+}
+YEAR_COMPARATORS = {**COMPARATORS, 'from': '$eq', 'in': '$eq'}
+
+
+def _alternation(words: Iterable[str]) -> str:
+    return "|".join(sorted((re.escape(word) for word in words), key=len, reverse=True))
+
+
+_COMPARATOR = _alternation(COMPARATORS)
+_YEAR = re.compile(rf"\b(?:released |made |came out )?({_alternation(YEAR_COMPARATORS)})\s+((?:19|20)\d\d)\b")
+_DECADE = re.compile(r"\b(?:from |in )?the\s+((?:19|20)?\d0)'?s\b")
+_RATING = re.compile(rf"\b(?:rated|rating|scored?|score of)\s+({_COMPARATOR})\s+(\d+(?:\.\d+)?)\b")
+_RUNTIME = re.compile(rf"\b({_COMPARATOR})\s+(\d+(?:\.\d+)?)\s*(minutes?|mins?|hours?|hrs?)\b")
+_GENRE_CONTEXT = r"(?:s\b|\s+(?:movies?|films?)\b)"
+
+
+class MovieMetadataIndex:
+    """
+    A columnar index of movie-level metadata for fast structured lookups.
+
+    Each movie (source document) is a row. Categorical fields (genres, directors, cast, languages) are
+    stored as posting lists from value to rows, numeric fields (release year, rating, runtime, revenue)
+    as float arrays, and the node IDs of each movie are kept so that the chunks of a small candidate
+    set can be fetched directly from the vector store. `extract_filters` turns attribute constraints
+    found in a question (e.g. "Korean thrillers after 2015 rated above 7.5") into Pinecone-style filters.
+
+    :param list[str] movie_ids: The ID of the source document of each row.
+    :param list[list[str]] node_ids: The IDs of the nodes of each row.
+    :param dict postings: The rows having each value, per categorical field.
+    :param dict numeric: The value of each row, per numeric field.
+    """
+
+    def __init__(
+        self,
+        movie_ids: List[str],
+        node_ids: List[List[str]],
+        postings: Dict[str, Dict[str, np.ndarray]],
+        numeric: Dict[str, np.ndarray],
+    ):
+        self._movie_ids = movie_ids
+        self._node_ids = node_ids
+        self._postings = postings
+        self._numeric = numeric
+        self._names = {
+            field: {value.lower(): value for value in postings.get(field, {})}
+            for field in CATEGORICAL_FIELDS
+        }
+        self._max_name_words = max(
+            (len(name.split()) for field in ('directors', 'cast') for name in self._names[field]),
+            default=1,
+        )
+
+    def __len__(self) -> int:
+        return len(self._movie_ids)
+
+    @property
+    def movie_ids(self) -> List[str]:
+        """
+        The ID of the source document of each row.
+        """
+        return self._movie_ids
+
+    @classmethod
+    def from_nodes(cls, nodes: Iterable[TextNode]) -> "MovieMetadataIndex":
+        """
+        Build the index from ingested nodes, taking each movie's metadata from its first chunk.
+
+        :param Iterable[TextNode] nodes: The nodes produced by `DataLoader`.
+        :returns: The index.
+        """
+        rows: Dict[str, int] = {}
+        node_ids: List[List[str]] = []
+        postings: Dict[str, Dict[str, List[int]]] = {field: {} for field in CATEGORICAL_FIELDS}
+        numeric: Dict[str, List[float]] = {field: [] for field in NUMERIC_FIELDS}
+        for node in nodes:
+            movie_id = node.ref_doc_id or node.node_id
+            if movie_id in rows:
+                node_ids[rows[movie_id]].append(node.node_id)
+                continue
+            row = rows[movie_id] = len(rows)
+            node_ids.append([node.node_id])
+            for field in CATEGORICAL_FIELDS:
+                values = node.metadata.get(field)
+                for value in values if isinstance(values, list) else [values]:
+                    if value is not None and value != "":
+                        postings[field].setdefault(str(value), []).append(row)
+            for field in NUMERIC_FIELDS:
+                value = node.metadata.get(field)
+                numeric[field].append(value if isinstance(value, (int, float)) else np.nan)
+        return cls(
+            movie_ids=list(rows),
+            node_ids=node_ids,
+            postings={
+                field: {value: np.asarray(rows, dtype=np.int32) for value, rows in values.items()}
+                for field, values in postings.items()
+            },
+            numeric={field: np.asarray(values, dtype=np.float64) for field, values in numeric.items()},
+        )
+
+    def persist(self, persist_dir: str) -> None:
+        """
+        Write the index to a directory.
+
+        :param str persist_dir: The directory.
+        """
+        os.makedirs(persist_dir, exist_ok=True)
+        with open(os.path.join(persist_dir, "movies.json"), "w") as f:
+            json.dump({"movie_ids": self._movie_ids, "node_ids": self._node_ids}, f)
+        with open(os.path.join(persist_dir, "postings.json"), "w") as f:
+            json.dump({
+                field: {value: rows.tolist() for value, rows in values.items()}
+                for field, values in self._postings.items()
+            }, f)
+        np.savez(os.path.join(persist_dir, "numeric.npz"), **self._numeric)
+
+    @classmethod
+    def load(cls, persist_dir: str) -> "MovieMetadataIndex":
+        """
+        Load an index from a directory.
+
+        :param str persist_dir: The directory.
+        :returns: The index.
+        """
+        with open(os.path.join(persist_dir, "movies.json"), "r") as f:
+            movies = json.load(f)
+        with open(os.path.join(persist_dir, "postings.json"), "r") as f:
+            postings = {
+                field: {value: np.asarray(rows, dtype=np.int32) for value, rows in values.items()}
+                for field, values in json.load(f).items()
+            }
+        with np.load(os.path.join(persist_dir, "numeric.npz")) as arrays:
+            numeric = {field: arrays[field] for field in arrays.files}
+        return cls(movies["movie_ids"], movies["node_ids"], postings, numeric)
+
+    def _rows(self, field: str, values: Iterable[Any]) -> np.ndarray:
+        mask = np.zeros(len(self), dtype=bool)
+        for value in values:
+            rows = self._postings[field].get(str(value))
+            if rows is not None:
+                mask[rows] = True
+        return mask
+
+    def lookup(self, filters: Dict[str, Any]) -> Optional[np.ndarray]:
+        """
+        Evaluate Pinecone-style filters over the movies.
+
+        :param dict filters: The metadata filters.
+        :returns: A boolean mask over the movies, or None if a filter uses a field that is not indexed.
+        """
+        mask = np.ones(len(self), dtype=bool)
+        for key, condition in filters.items():
+            if key in ("$and", "$or"):
+                masks = [self.lookup(sub_filters) for sub_filters in condition]
+                if any(sub_mask is None for sub_mask in masks):
+                    return None
+                combined = np.logical_and.reduce(masks) if key == "$and" else np.logical_or.reduce(masks)
+                mask &= combined
+                continue
+            if not isinstance(condition, dict):
+                condition = {"$eq": condition}
+            for operator, value in condition.items():
+                if key in self._postings and operator in ("$eq", "$ne", "$in", "$nin"):
+                    matched = self._rows(key, value if operator in ("$in", "$nin") else [value])
+                    mask &= ~matched if operator in ("$ne", "$nin") else matched
+                elif key in self._numeric and operator in ("$eq", "$gt", "$gte", "$lt", "$lte"):
+                    column = self._numeric[key]
+                    with np.errstate(invalid="ignore"):
+                        mask &= {
+                            "$eq": column == value, "$gt": column > value, "$gte": column >= value,
+                            "$lt": column < value, "$lte": column <= value,
+                        }[operator]
+                else:
+                    return None
+        return mask
+
+    def node_ids(self, mask: np.ndarray) -> List[str]:
+        """
+        Get the node IDs of the selected movies.
+
+        :param np.ndarray mask: A boolean mask over the movies.
+        :returns: The IDs of all their nodes.
+        """
+        return [node_id for row in np.flatnonzero(mask) for node_id in self._node_ids[row]]
+
+    def canonical_value(self, field: str, value: str) -> Optional[str]:
+        """
+        Find the indexed spelling of a categorical value, ignoring case.
+
+        :param str field: The categorical field, e.g. "genres".
+        :param str value: The value, e.g. "science fiction".
+        :returns: The indexed value, e.g. "Science Fiction", or None if it is not indexed.
+        """
+        return self._names[field].get(value.lower())
+
+    def extract_filters(self, question: str) -> Dict[str, Any]:
+        """
+        Extract attribute constraints from a question as Pinecone-style filters.
+
+        Recognized constraints are release years and decades, ratings, runtimes, genres (when used as
+        "thrillers" or "thriller movies"), languages given as adjectives (e.g. "Korean"), and the full
+        names of directors and cast members. Every name found must match, and a name found among both
+        directors and cast matches either role. A year after "from" or "in" is matched exactly; these
+        two words are not read as comparators for ratings or runtimes.
+
+        :param str question: The standalone question.
+        :returns: The extracted filters, empty if none were found.
+        """
+        text = question.lower()
+        filters: Dict[str, Any] = {}
+
+        year = _YEAR.search(text)
+        decade = _DECADE.search(text)
+        if year:
+            filters['release_year'] = {YEAR_COMPARATORS[year.group(1)]: int(year.group(2))}
+        elif decade:
+            start = int(decade.group(1))
+            start = start + 1900 if start < 100 else start
+            filters['release_year'] = {"$gte": start, "$lte": start + 9}
+
+        rating = _RATING.search(text)
+        if rating:
+            filters['averageRating'] = {COMPARATORS[rating.group(1)]: float(rating.group(2))}
+
+        runtime = _RUNTIME.search(text)
+        if runtime:
+            minutes = float(runtime.group(2)) * (60 if runtime.group(3).startswith("h") else 1)
+            filters['runtime'] = {COMPARATORS[runtime.group(1)]: minutes}
+
+        genres = [
+            genre for lowered, genre in self._names['genres'].items()
+            if re.search(rf"\b{re.escape(lowered)}{_GENRE_CONTEXT}", text)
+        ]
+        if genres:
+            filters['genres'] = {"$in": genres}
+
+        languages = self._names['original_language']
+        for adjective, code in LANGUAGES.items():
+            if re.search(rf"\b{adjective}\b", text):
+                value = languages.get(code) or languages.get(adjective)
+                if value is not None:
+                    filters['original_language'] = value
+                    break
+
+        people: List[Dict[str, Any]] = []
+        words = re.findall(r"[\w.'-]+", question)
+        for size in range(min(self._max_name_words, len(words)), 1, -1):
+            for start in range(len(words) - size + 1):
+                name = " ".join(words[start:start + size]).strip(".'")
+                matches = {}
+                for field in ('directors', 'cast'):
+                    value = self.canonical_value(field, name)
+                    if value is not None:
+                        matches[field] = value
+                if len(matches) == 2:
+                    # The person both directs and acts; the question may mean either role.
+                    clause = {"$or": [{field: value} for field, value in matches.items()]}
+                elif matches:
+                    clause = dict([matches.popitem()])
+                else:
+                    continue
+                if clause not in people:
+                    people.append(clause)
+        if len(people) == 1:
+            filters.update(people[0])
+        elif people:
+            filters['$and'] = people
+        return filters
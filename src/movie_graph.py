@@ -0,0 +1,249 @@
+import json
+import os
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from llama_index.core.schema import TextNode
+from llama_index.core.tools import FunctionTool
+from src.instrumentation import metrics
+from src.metadata_index import MovieMetadataIndex
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Find the columns of the `k` highest scores of each row, best first.
+
+    :param np.ndarray scores: The scores, one row per query.
+    :param int k: The number of columns to keep.
+    :returns: The column indices.
+    """
+    top = np.argpartition(-scores, k - 1, axis=-1)[..., :k]
+    order = np.argsort(-np.take_along_axis(scores, top, axis=-1), axis=-1, kind="stable")
+    return np.take_along_axis(top, order, axis=-1)
+
+
+def compute_neighbors(vectors: np.ndarray, k: int, block_size: int = 1024) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Compute the `k` nearest neighbours of every vector by dot product, one block of rows at a time, so
+    that only a `block_size` x N score matrix is held in memory.
+
+    :param np.ndarray vectors: The normalised vectors, one per row.
+    :param int k: The number of neighbours per row.
+    :param int block_size: The number of rows scored per matrix multiplication.
+    :returns: The neighbour rows and their scores, each of shape (N, k), best first.
+    """
+    n = len(vectors)
+    k = min(k, n - 1)
+    neighbors = np.zeros((n, max(k, 0)), dtype=np.int32)
+    scores = np.zeros((n, max(k, 0)), dtype=np.float32)
+    if k <= 0:
+        return neighbors, scores
+    for start in range(0, n, block_size):
+        end = min(start + block_size, n)
+        block = vectors[start:end] @ vectors.T
+        block[np.arange(end - start), np.arange(start, end)] = -np.inf
+        top = _top_k(block, k)
+        neighbors[start:end] = top
+        scores[start:end] = np.take_along_axis(block, top, axis=1)
+    return neighbors, scores
+
+
+class MovieGraph:
+    """
+    A precomputed movie-to-movie similarity graph for "more like this" recommendations.
+
+    Each movie's chunk embeddings are averaged into one normalised vector, and the `k` nearest
+    neighbours of every movie are stored as fixed-width arrays, so a recommendation is a row lookup
+    without any vector store round-trip. Filters are evaluated with the movie metadata index; when
+    they leave fewer than the requested number of stored neighbours, the filtered movies are scored
+    exhaustively against the per-movie vectors, which are memory-mapped when loaded from disk.
+
+    :param list[str] titles: The title of each movie, aligned with the rows of `metadata_index`.
+    :param np.ndarray vectors: The per-movie vectors.
+    :param np.ndarray neighbors: The neighbour rows of each movie, best first.
+    :param np.ndarray scores: The similarity of each neighbour.
+    :param MovieMetadataIndex metadata_index: The metadata index used for filters and movie IDs.
+    """
+
+    _ARRAYS = ("vectors", "neighbors", "scores")
+
+    def __init__(
+        self,
+        titles: List[str],
+        vectors: np.ndarray,
+        neighbors: np.ndarray,
+        scores: np.ndarray,
+        metadata_index: MovieMetadataIndex,
+    ):
+        self._titles = titles
+        self._vectors = vectors
+        self._neighbors = neighbors
+        self._scores = scores
+        self._metadata_index = metadata_index
+        self._rows = {movie_id: row for row, movie_id in enumerate(metadata_index.movie_ids)}
+        self._title_rows: Dict[str, int] = {}
+        for row, title in enumerate(titles):
+            self._title_rows.setdefault(title.strip().lower(), row)
+
+    def __len__(self) -> int:
+        return len(self._titles)
+
+    @classmethod
+    def from_nodes(cls, nodes: Iterable[TextNode], k: int = 50, block_size: int = 1024) -> "MovieGraph":
+        """
+        Build the graph from embedded nodes, averaging the chunk embeddings of each movie.
+
+        :param Iterable[TextNode] nodes: The nodes produced by `DataLoader`, with embeddings set.
+        :param int k: The number of neighbours stored per movie.
+        :param int block_size: The number of movies scored per matrix multiplication.
+        :returns: The graph.
+        """
+        nodes = list(nodes)
+        metadata_index = MovieMetadataIndex.from_nodes(nodes)
+        rows = {movie_id: row for row, movie_id in enumerate(metadata_index.movie_ids)}
+        titles = [""] * len(rows)
+        vectors = None
+        for node in nodes:
+            row = rows[node.ref_doc_id or node.node_id]
+            titles[row] = titles[row] or str(node.metadata.get("title", ""))
+            if node.embedding is None:
+                continue
+            if vectors is None:
+                vectors = np.zeros((len(rows), len(node.embedding)), dtype=np.float32)
+            vectors[row] += np.asarray(node.embedding, dtype=np.float32)
+        if vectors is None:
+            raise ValueError("The nodes must be embedded before building the movie graph.")
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+        neighbors, scores = compute_neighbors(vectors, k, block_size)
+        return cls(titles, vectors, neighbors, scores, metadata_index)
+
+    def persist(self, persist_dir: str) -> None:
+        """
+        Write the graph to a directory.
+
+        :param str persist_dir: The directory.
+        """
+        os.makedirs(persist_dir, exist_ok=True)
+        for name in self._ARRAYS:
+            np.save(os.path.join(persist_dir, f"{name}.npy"), getattr(self, f"_{name}"))
+        with open(os.path.join(persist_dir, "titles.json"), "w") as f:
+            json.dump(self._titles, f)
+        self._metadata_index.persist(os.path.join(persist_dir, "metadata"))
+
+    @classmethod
+    def load(cls, persist_dir: str) -> "MovieGraph":
+        """
+        Load a graph from a directory, memory-mapping its arrays.
+
+        :param str persist_dir: The directory.
+        :returns: The graph.
+        """
+        with open(os.path.join(persist_dir, "titles.json"), "r") as f:
+            titles = json.load(f)
+        arrays = {
+            name: np.load(os.path.join(persist_dir, f"{name}.npy"), mmap_mode="r")
+            for name in cls._ARRAYS
+        }
+        return cls(titles, metadata_index=MovieMetadataIndex.load(os.path.join(persist_dir, "metadata")), **arrays)
+
+    @property
+    def metadata_index(self) -> MovieMetadataIndex:
+        """
+        The metadata index used for filters and movie IDs.
+        """
+        return self._metadata_index
+
+    def _resolve(self, title_or_imdb_id: str) -> int:
+        """
+        Find the row of a movie from its IMDb ID or, ignoring case, its title.
+
+        :param str title_or_imdb_id: The IMDb ID or title.
+        :returns: The row.
+        """
+        row = self._rows.get(title_or_imdb_id.strip())
+        if row is None:
+            row = self._title_rows.get(title_or_imdb_id.strip().lower())
+        if row is None:
+            raise KeyError(f"Unknown movie: {title_or_imdb_id}")
+        return row
+
+    def similar_movies(
+        self,
+        title_or_imdb_id: str,
+        k: int = 10,
+        filters: Optional[Dict[str, Any]] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Find the movies most similar to a movie.
+
+        :param str title_or_imdb_id: The IMDb ID or title of the movie.
+        :param int k: The number of movies to return.
+        :param dict filters: Optional Pinecone-style metadata filters the movies must satisfy.
+        :returns: The IMDb ID, title and similarity of each movie, most similar first.
+        :raises KeyError: If the movie is not in the graph.
+        :raises ValueError: If a filter uses a field that is not indexed.
+        """
+        with metrics.span("similar_movies") as span:
+            row = self._resolve(title_or_imdb_id)
+            mask = None
+            if filters:
+                mask = self._metadata_index.lookup(filters)
+                if mask is None:
+                    raise ValueError(f"Filters use fields that are not indexed: {filters}")
+            neighbors, scores = np.asarray(self._neighbors[row]), np.asarray(self._scores[row])
+            if mask is not None:
+                keep = mask[neighbors]
+                neighbors, scores = neighbors[keep], scores[keep]
+            if len(neighbors) < k:
+                candidates = np.flatnonzero(mask) if mask is not None else np.arange(len(self))
+                candidates = candidates[candidates != row]
+                candidate_scores = np.asarray(self._vectors[candidates]) @ np.asarray(self._vectors[row])
+                top = _top_k(candidate_scores, min(k, len(candidates))) if len(candidates) else candidates
+                neighbors, scores = candidates[top], candidate_scores[top]
+            span.set(movies=min(k, len(neighbors)))
+        return [
+            {"imdb_id": self._metadata_index.movie_ids[neighbor], "title": self._titles[neighbor], "score": float(score)}
+            for neighbor, score in zip(neighbors[:k], scores[:k])
+        ]
+
+    def as_tool(self, k: int = 5) -> FunctionTool:
+        """
+        Expose `similar_movies` as a tool for the chat agent.
+
+        :param int k: The default number of recommendations.
+        :returns: The tool.
+        """
+
+        def similar_movies(
+            title: str,
+            count: int = k,
+            genre: Optional[str] = None,
+            min_year: Optional[int] = None,
+            max_year: Optional[int] = None,
+            min_rating: Optional[float] = None,
+        ) -> str:
+            filters: Dict[str, Any] = {}
+            if genre:
+                filters['genres'] = self._metadata_index.canonical_value('genres', genre) or genre
+            years = {"$gte": min_year, "$lte": max_year}
+            if min_year is not None or max_year is not None:
+                filters['release_year'] = {op: year for op, year in years.items() if year is not None}
+            if min_rating is not None:
+                filters['averageRating'] = {"$gte": min_rating}
+            try:
+                movies = self.similar_movies(title, count, filters)
+            except KeyError:
+                return f"No movie titled '{title}' was found; use the query engine tool instead."
+            if not movies:
+                return f"No similar movies matching the criteria were found for '{title}'."
+            return "\n".join(f"{movie['title']} (similarity {movie['score']:.2f})" for movie in movies)
+
+        return FunctionTool.from_defaults(
+            fn=similar_movies,
+            name="similar_movies",
+            description=(
+                "Recommends movies similar to a given movie (\"something like Parasite\"). Takes the movie "
+                "title, the number of recommendations, and optionally a genre, a release year range and a "
+                "minimum rating. Use it for recommendation requests based on a known movie."
+            ),
+        )
@@ -0,0 +1,168 @@
+import asyncio
+import hashlib
+import re
+import threading
+import time
+from typing import Any, List, Sequence
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding, Embedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.llms import (
+    CompletionResponse,
+    CompletionResponseGen,
+    CustomLLM,
+    LLMMetadata,
+)
+from llama_index.core.llms.callbacks import llm_completion_callback
+
+
+def whitespace_tokenizer(text: str) -> List[str]:
+    """
+    A tokenizer splitting on whitespace, usable as `Settings.tokenizer` when tiktoken encodings cannot be downloaded.
+
+    :param str text: The text to tokenize.
+    :returns: The tokens.
+    """
+    return text.split()
+
+
+class HashingEmbedding(BaseEmbedding):
+    """
+    A deterministic, offline embedding model for benchmarks and local runs.
+
+    Texts are embedded by hashing their lowercased words into a fixed number of dimensions and
+    normalizing the result, so texts sharing words have a positive dot product. An optional delay
+    simulates the round-trip latency of a hosted model.
+
+    :param int dimensions: The dimensionality of the embeddings.
+    :param float latency: The simulated latency of each call in seconds.
+    """
+
+    dimensions: int = 1024
+    latency: float = 0.0
+
+    _calls: int = PrivateAttr(default=0)
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "HashingEmbedding"
+
+    @property
+    def calls(self) -> int:
+        """
+        The number of model calls made, counting a batch as one call.
+        """
+        return self._calls
+
+    def _count_call(self) -> None:
+        with self._lock:
+            self._calls += 1
+
+    def _embed(self, text: str) -> Embedding:
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for word in re.findall(r"\w+", text.lower()):
+            digest = hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest()
+            value = int.from_bytes(digest, "little")
+            vector[value % self.dimensions] += 1.0 if (value >> 63) else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def _get_query_embedding(self, query: str) -> Embedding:
+        return self._get_text_embedding(query)
+
+    async def _aget_query_embedding(self, query: str) -> Embedding:
+        return await self._aget_text_embedding(query)
+
+    def _get_text_embedding(self, text: str) -> Embedding:
+        return self._get_text_embeddings([text])[0]
+
+    async def _aget_text_embedding(self, text: str) -> Embedding:
+        return (await self._aget_text_embeddings([text]))[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        self._count_call()
+        if self.latency:
+            time.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+    async def aget_query_embedding_batch(self, queries: List[str]) -> List[Embedding]:
+        """
+        Embed many queries in batch calls; query and text embeddings are the same for this model.
+        """
+        return await self.aget_text_embedding_batch(queries)
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        self._count_call()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+
+class StubLLM(CustomLLM):
+    """
+    An offline LLM returning a fixed answer after a simulated latency, for benchmarks and local runs.
+
+    :param str answer: The text returned for every prompt.
+    :param float latency: The simulated latency of each call in seconds.
+    :param int context_window: The context window reported to prompt helpers.
+    :param int num_output: The number of output tokens reported to prompt helpers.
+    """
+
+    answer: str = "This is a stub answer."
+    latency: float = 0.0
+    context_window: int = 128000
+    num_output: int = 256
+
+    _calls: int = PrivateAttr(default=0)
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "StubLLM"
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(
+            context_window=self.context_window,
+            num_output=self.num_output,
+            model_name="stub",
+        )
+
+    @property
+    def calls(self) -> int:
+        """
+        The number of completions requested.
+        """
+        return self._calls
+
+    def _count_call(self) -> None:
+        with self._lock:
+            self._calls += 1
+
+    def _tokens(self) -> Sequence[str]:
+        return re.findall(r"\s*\S+", self.answer)
+
+    @llm_completion_callback()
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        self._count_call()
+        if self.latency:
+            time.sleep(self.latency)
+        return CompletionResponse(text=self.answer)
+
+    @llm_completion_callback()
+    async def acomplete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        self._count_call()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return CompletionResponse(text=self.answer)
+
+    @llm_completion_callback()
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponseGen:
+        self._count_call()
+        if self.latency:
+            time.sleep(self.latency)
+        text = ""
+        for token in self._tokens():
+            text += token
+            yield CompletionResponse(text=text, delta=token)
@@ -1,11 +1,19 @@
-from typing import Any, List, Optional, Dict, Union
+import asyncio
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List, Optional, Dict, Tuple, Union
+import numpy as np
 from llama_index.core import QueryBundle
 from llama_index.core.retrievers import BaseRetriever
-from llama_index.vector_stores.pinecone import PineconeVectorStore
+from llama_index.core.vector_stores.types import BasePydanticVectorStore
 from llama_index.core.schema import NodeWithScore
-from llama_index.core.vector_stores import VectorStoreQuery
+from llama_index.core.vector_stores import VectorStoreQuery, VectorStoreQueryResult
 from llama_index.core.vector_stores import MetadataFilters
 from llama_index.core.base.embeddings.base import BaseEmbedding
+from src.bm25_index import BM25Index
+from src.instrumentation import metrics
+from src.local_vector_store import LocalVectorStore
+from src.metadata_index import MovieMetadataIndex
 
 
 
@@ -17,18 +25,36 @@ class PineconeRetriever(BaseRetriever):
     A custom retriever that leverages a Pinecone vector store for querying vectors based on the similarity of their embeddings,
     incorporating metadata filters to refine search results according to specific criteria.
 
-    :param vector_store: The Pinecone vector store used for storing and retrieving vectors.
+    :param vector_store: The Pinecone vector store used for storing and retrieving vectors, or a `LocalVectorStore`
+        accepting the same filters.
     :param embed_model: The model used to generate embeddings.
-    :param query_mode: Mode of the query, defaults to "default".
+    :param query_mode: Mode of the query, defaults to "default". In "hybrid" mode, a BM25 search over the
+        `bm25_index` runs concurrently with the dense search and both rankings are fused with reciprocal rank fusion.
     :param similarity_top_k: Number of top similar items to retrieve, defaults to 10.
+    :param bm25_index: The sparse index used in "hybrid" mode.
+    :param rrf_k: The rank offset of reciprocal rank fusion, defaults to 60.
+    :param metadata_index: The movie metadata index. When given, filters extracted from each question are
+        applied before the search, and the chunks of up to `max_direct_movies` matching movies are fetched
+        directly and ranked against the query embedding instead of running the dense search. Vector stores
+        that cannot fetch nodes by ID, such as Pinecone, run the filtered dense search instead.
+    :param max_direct_movies: The largest candidate set fetched without a dense search, defaults to 3.
+    :param shortlist_k: If set, dense search runs in two stages: the vector store scores its low-dimensional
+        shortlist copy of the embeddings (see `LocalVectorStore.build_shortlist`) to keep the `shortlist_k` best
+        nodes, then rescores them exactly with the full vectors. Only a `LocalVectorStore` with a shortlist
+        supports it; other stores, such as Pinecone, would forward the argument to their query API.
     """
 
     def __init__(
         self,
-        vector_store: PineconeVectorStore,
+        vector_store: BasePydanticVectorStore,
         embed_model: Optional[BaseEmbedding] = None,
         query_mode: str = "default",
-        similarity_top_k: int = 10
+        similarity_top_k: int = 10,
+        bm25_index: Optional[BM25Index] = None,
+        rrf_k: int = 60,
+        metadata_index: Optional[MovieMetadataIndex] = None,
+        max_direct_movies: int = 3,
+        shortlist_k: Optional[int] = None
     ) -> None:
         """
         Initializes the PineconeRetriever with necessary components for executing a retrieval task.
@@ -37,14 +63,40 @@ class PineconeRetriever(BaseRetriever):
         :param embed_model: The model used to generate embeddings.
         :param query_mode: The querying mode, defaults to 'default'.
         :param similarity_top_k: The number of top results to return, defaults to 10.
+        :param bm25_index: The sparse index used in 'hybrid' mode.
+        :param rrf_k: The rank offset of reciprocal rank fusion, defaults to 60.
+        :param metadata_index: The movie metadata index used to extract and evaluate filters.
+        :param max_direct_movies: The largest candidate set fetched without a dense search, defaults to 3.
+        :param shortlist_k: The number of nodes kept by the low-dimensional first stage, or None for a single stage.
         """
+        if query_mode == "hybrid" and bm25_index is None:
+            raise ValueError("A BM25 index must be provided for hybrid mode.")
+        if shortlist_k and not (isinstance(vector_store, LocalVectorStore) and vector_store.shortlist_dimensions):
+            raise ValueError("shortlist_k requires a LocalVectorStore with a shortlist built by build_shortlist.")
         self._vector_store = vector_store
         self._embed_model = embed_model
         self._query_mode = query_mode
         self._similarity_top_k = similarity_top_k
+        self._bm25_index = bm25_index
+        self._rrf_k = rrf_k
+        self._metadata_index = metadata_index
+        self._max_direct_movies = max_direct_movies
+        self._query_kwargs = {"shortlist_k": shortlist_k} if shortlist_k else {}
+        self._sparse_executor = ThreadPoolExecutor(max_workers=4) if query_mode == "hybrid" else None
+        if self._sparse_executor is not None:
+            weakref.finalize(self, self._sparse_executor.shutdown, wait=False)
+        self._direct_fetch = True
         self._filters = {}
         super().__init__()
 
+    def close(self) -> None:
+        """
+        Shuts down the worker threads of the hybrid sparse search. They are otherwise shut down when the
+        retriever is garbage collected.
+        """
+        if self._sparse_executor is not None:
+            self._sparse_executor.shutdown()
+
     def set_filters(self, filters: Dict[str, FilterValueType]) -> None:
         """
         Sets the metadata filter for querying the vector store.
@@ -53,6 +105,24 @@ class PineconeRetriever(BaseRetriever):
         """
         self._filters = filters
 
+    @property
+    def embed_model(self) -> Optional[BaseEmbedding]:
+        """
+        The model used to embed queries.
+
+        :return: The embedding model, if any.
+        """
+        return self._embed_model
+
+    @property
+    def filters(self) -> Dict[str, FilterValueType]:
+        """
+        The metadata filters currently applied to queries.
+
+        :return: Metadata key-value pairs used to refine the search.
+        """
+        return self._filters
+
     def _retrieve(
         self, 
         query_bundle: QueryBundle, 
@@ -68,24 +138,221 @@ class PineconeRetriever(BaseRetriever):
         :return: A list of nodes with their associated scores based on the similarity of their vectors.
         """
 
+        filters, node_ids = self._analyze_query(query_bundle.query_str)
+        sparse_future = None
+        if self._query_mode == "hybrid" and node_ids is None:
+            sparse_future = self._sparse_executor.submit(self._sparse_search, query_bundle.query_str, filters)
+
         if query_bundle.embedding is None:
             if self._embed_model is None:
                 raise ValueError("Embedding model is not available to generate query embeddings.")
-            query_embedding = self._embed_model.get_query_embedding(query_bundle.query_str)
+            with metrics.span("query_embedding"):
+                query_embedding = self._embed_model.get_query_embedding(query_bundle.query_str)
         else:
             query_embedding = query_bundle.embedding
 
-        vector_store_query = VectorStoreQuery(
+        if node_ids is not None:
+            nodes_with_scores = self._fetch_nodes(node_ids, query_embedding)
+            if nodes_with_scores is not None:
+                return nodes_with_scores
+            if self._query_mode == "hybrid":
+                sparse_future = self._sparse_executor.submit(self._sparse_search, query_bundle.query_str, filters)
+
+        vector_store_query = self._build_vector_store_query(query_bundle, query_embedding)
+        with metrics.span("vector_query") as span:
+            query_result = self._vector_store.query(
+                query=vector_store_query, pinecone_query_filters=filters, **self._query_kwargs
+            )
+            span.set(nodes=len(query_result.nodes))
+        nodes_with_scores = self._to_nodes_with_scores(query_result)
+        if sparse_future is not None:
+            return self._fuse(nodes_with_scores, sparse_future.result())
+        return nodes_with_scores
+
+    async def _aretrieve(
+        self,
+        query_bundle: QueryBundle,
+    ) -> List[NodeWithScore]:
+        """
+        Private async counterpart of `_retrieve`, called by the public `aretrieve` method. The query embedding
+        and the vector store query are awaited, so a single event loop can serve many concurrent queries.
+
+        :param query_bundle: The query and potential embedding provided by the user.
+        :return: A list of nodes with their associated scores based on the similarity of their vectors.
+        """
+
+        filters, node_ids = self._analyze_query(query_bundle.query_str)
+        sparse_task = None
+        if self._query_mode == "hybrid" and node_ids is None:
+            sparse_task = asyncio.ensure_future(asyncio.to_thread(self._sparse_search, query_bundle.query_str, filters))
+
+        if query_bundle.embedding is None:
+            if self._embed_model is None:
+                raise ValueError("Embedding model is not available to generate query embeddings.")
+            with metrics.span("query_embedding"):
+                query_embedding = await self._embed_model.aget_query_embedding(query_bundle.query_str)
+        else:
+            query_embedding = query_bundle.embedding
+
+        if node_ids is not None:
+            nodes_with_scores = await asyncio.to_thread(self._fetch_nodes, node_ids, query_embedding)
+            if nodes_with_scores is not None:
+                return nodes_with_scores
+            if self._query_mode == "hybrid":
+                sparse_task = asyncio.ensure_future(asyncio.to_thread(self._sparse_search, query_bundle.query_str, filters))
+
+        vector_store_query = self._build_vector_store_query(query_bundle, query_embedding)
+        with metrics.span("vector_query") as span:
+            query_result = await self._aquery_vector_store(vector_store_query, filters)
+            span.set(nodes=len(query_result.nodes))
+        nodes_with_scores = self._to_nodes_with_scores(query_result)
+        if sparse_task is not None:
+            return self._fuse(nodes_with_scores, await sparse_task)
+        return nodes_with_scores
+
+    async def _aquery_vector_store(self, query: VectorStoreQuery, filters: Dict[str, Any]) -> VectorStoreQueryResult:
+        """
+        Queries the vector store without blocking the event loop. Vector stores without a native `aquery`,
+        such as Pinecone, inherit a fallback that runs the blocking `query` on the loop, so their `query`
+        runs in a worker thread instead.
+
+        :param query: The vector store query.
+        :param filters: The Pinecone-style metadata filters.
+        :return: The query result.
+        """
+        if type(self._vector_store).aquery is BasePydanticVectorStore.aquery:
+            return await asyncio.to_thread(
+                self._vector_store.query, query=query, pinecone_query_filters=filters, **self._query_kwargs
+            )
+        return await self._vector_store.aquery(query=query, pinecone_query_filters=filters, **self._query_kwargs)
+
+    def query_filters(self, query_str: str) -> Dict[str, Any]:
+        """
+        The filters a query is retrieved with: those extracted from the question by the metadata index,
+        if any, combined with the filters set with `set_filters`.
+
+        :param query_str: The standalone question.
+        :return: The effective metadata filters.
+        """
+        return self._resolve_filters(query_str)[0]
+
+    def _resolve_filters(self, query_str: str) -> Tuple[Dict[str, Any], Optional[np.ndarray]]:
+        """
+        Extracts filters from the query with the metadata index and evaluates them. Extracted filters that
+        no movie satisfies are dropped, keeping only the filters set with `set_filters`.
+
+        :param query_str: The standalone question.
+        :return: The filters to apply, and the mask of the movies satisfying them, or None if they
+            cannot be evaluated by the metadata index.
+        """
+        if self._metadata_index is None:
+            return self._filters, None
+        extracted = self._metadata_index.extract_filters(query_str)
+        filters = {**extracted, **self._filters}
+        mask = self._metadata_index.lookup(filters)
+        if mask is not None and not mask.any() and extracted:
+            filters = self._filters
+            mask = self._metadata_index.lookup(filters)
+        return filters, mask
+
+    def _analyze_query(self, query_str: str) -> Tuple[Dict[str, Any], Optional[List[str]]]:
+        """
+        Resolves the filters of the query (see `query_filters`) and decides whether to fetch its
+        candidates directly.
+
+        :param query_str: The standalone question.
+        :return: The filters to apply, and the IDs of the nodes to fetch directly when the candidate set
+            is small enough to skip the dense search, else None.
+        """
+        if self._metadata_index is None:
+            return self._filters, None
+        with metrics.span("query_analysis") as span:
+            filters, mask = self._resolve_filters(query_str)
+            candidates = int(mask.sum()) if mask is not None else len(self._metadata_index)
+            span.set(filters=len(filters), candidates=candidates)
+        if mask is not None and filters and 0 < candidates <= self._max_direct_movies:
+            return filters, self._metadata_index.node_ids(mask)
+        return filters, None
+
+    def _fetch_nodes(self, node_ids: List[str], query_embedding: List[float]) -> Optional[List[NodeWithScore]]:
+        """
+        Fetches the chunks of a small candidate set by ID, skipping the dense search, and ranks them
+        against the query embedding.
+
+        :param node_ids: The IDs of the nodes to fetch.
+        :param query_embedding: The embedding of the query.
+        :return: The `similarity_top_k` best nodes, or None if the vector store cannot fetch nodes by ID
+            with their embeddings, in which case the filtered dense search runs instead.
+        """
+        if not self._direct_fetch:
+            return None
+        with metrics.span("direct_fetch") as span:
+            try:
+                nodes = self._vector_store.get_nodes(node_ids=node_ids)
+            except (NotImplementedError, ValueError):
+                # Pinecone raises ValueError for fetches by ID; stop trying for later queries.
+                self._direct_fetch = False
+                return None
+            if not nodes or any(node.embedding is None for node in nodes):
+                return None
+            scores = np.asarray([node.embedding for node in nodes], dtype=np.float32) @ np.asarray(query_embedding, dtype=np.float32)
+            top = np.argsort(-scores, kind="stable")[:self._similarity_top_k]
+            span.set(nodes=len(top))
+        return [NodeWithScore(node=nodes[i], score=float(scores[i])) for i in top]
+
+    def _build_vector_store_query(self, query_bundle: QueryBundle, query_embedding: List[float]) -> VectorStoreQuery:
+        """
+        Builds the vector store query for a query bundle.
+
+        :param query_bundle: The query provided by the user.
+        :param query_embedding: The embedding of the query.
+        :return: The vector store query.
+        """
+        return VectorStoreQuery(
             query_str=query_bundle.query_str,
             query_embedding=query_embedding,
             similarity_top_k=self._similarity_top_k,
-            mode=self._query_mode,
+            mode="default" if self._query_mode == "hybrid" else self._query_mode,
         )
 
-        query_result = self._vector_store.query(query=vector_store_query, pinecone_query_filters=self._filters)
-        nodes_with_scores = [
+    def _sparse_search(self, query_str: str, filters: Dict[str, Any]) -> List[NodeWithScore]:
+        """
+        Runs the BM25 search of hybrid mode with the query's metadata filters.
+
+        :param query_str: The query text.
+        :param filters: The metadata filters of the query.
+        :return: The top nodes by BM25 score.
+        """
+        with metrics.span("sparse_query") as span:
+            nodes_with_scores = self._bm25_index.search(query_str, self._similarity_top_k, filters=filters)
+            span.set(nodes=len(nodes_with_scores))
+        return nodes_with_scores
+
+    def _fuse(self, dense: List[NodeWithScore], sparse: List[NodeWithScore]) -> List[NodeWithScore]:
+        """
+        Fuses the dense and sparse rankings with reciprocal rank fusion.
+
+        :param dense: The nodes returned by the vector store, best first.
+        :param sparse: The nodes returned by the BM25 index, best first.
+        :return: The top nodes by fused score.
+        """
+        scores, nodes = {}, {}
+        for ranking in (dense, sparse):
+            for rank, node_with_score in enumerate(ranking, start=1):
+                node_id = node_with_score.node.node_id
+                scores[node_id] = scores.get(node_id, 0.0) + 1.0 / (self._rrf_k + rank)
+                nodes.setdefault(node_id, node_with_score.node)
+        ranked = sorted(scores, key=scores.get, reverse=True)[:self._similarity_top_k]
+        return [NodeWithScore(node=nodes[node_id], score=scores[node_id]) for node_id in ranked]
+
+    def _to_nodes_with_scores(self, query_result: VectorStoreQueryResult) -> List[NodeWithScore]:
+        """
+        Converts a vector store query result to scored nodes.
+
+        :param query_result: The result returned by the vector store.
+        :return: A list of nodes with their associated scores.
+        """
+        return [
             NodeWithScore(node=node, score=query_result.similarities[i] if query_result.similarities else None)
             for i, node in enumerate(query_result.nodes)
         ]
-
-        return nodes_with_scores
@@ -1,10 +1,19 @@
-from typing import Optional
+import asyncio
+import time
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Sequence, Tuple, Union
 from llama_index.core.query_engine import CustomQueryEngine
 from llama_index.core.retrievers import BaseRetriever
 from llama_index.core.prompts import BasePromptTemplate
 from llama_index.core.llms import LLM
-from llama_index.core import Response
-from llama_index.core.response_synthesizers import get_response_synthesizer, BaseSynthesizer
+from llama_index.core import QueryBundle, Response
+from llama_index.core.base.response.schema import RESPONSE_TYPE, AsyncStreamingResponse
+from llama_index.core.schema import MetadataMode, NodeWithScore
+from llama_index.core.response_synthesizers import get_response_synthesizer, BaseSynthesizer, ResponseMode
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from src.answer_cache import SemanticAnswerCache
+from src.embedding_cache import aget_query_embeddings
+from src.instrumentation import metrics
 
 
 class EnhancedQueryEngine(CustomQueryEngine):
@@ -13,25 +22,126 @@ class EnhancedQueryEngine(CustomQueryEngine):
 
     This query engine extends the basic Retrieval-Augmented Generation (RAG) approach by 
     implementing a custom query method for enhanced control over the RAG process.
+
+    The response synthesizer is built on first use and reused for every query, with the
+    callback manager of the LLM so that handlers attached to the LLM keep receiving its calls. The
+    `response_mode` selects the synthesis strategy, e.g. "compact" packs the retrieved
+    nodes into as few LLM calls as possible instead of summarizing them as a tree.
+    The time spent in each stage of the latest query is available from `last_timings`
+    and in the response metadata under "timings"; for streaming responses, synthesis
+    covers the time until the stream is returned.
+
+    An optional `answer_cache` serves answers to questions similar to earlier ones,
+    asked with the same retriever filters (including those the retriever extracts from
+    the question), without retrieval or synthesis.
+
+    Retrieved nodes pass through `node_postprocessors` before synthesis, e.g. a
+    `MovieContextPacker` merging chunks per movie into a token budget.
+
+    Offline jobs answer many questions at once with `query_batch` (or `aquery_batch`), which
+    answers repeated questions once, embeds the unique ones up front, and runs retrieval and
+    synthesis on a bounded pool of concurrent workers.
     """
 
     retriever: BaseRetriever
     llm: LLM
     streaming: bool
+    response_mode: ResponseMode = ResponseMode.TREE_SUMMARIZE
+    answer_cache: Optional[SemanticAnswerCache] = None
+    node_postprocessors: List[BaseNodePostprocessor] = Field(default_factory=list)
+
+    _response_synthesizer: Optional[BaseSynthesizer] = PrivateAttr(default=None)
+    _last_timings: Dict[str, float] = PrivateAttr(default_factory=dict)
+    _batch_synthesizer: Optional[BaseSynthesizer] = PrivateAttr(default=None)
 
 
     def _get_response_synthesizer(self) -> BaseSynthesizer:
         """
-        Initialize and return the response synthesizer with provided prompts.
+        Return the response synthesizer, initializing it on first use.
 
         :return: The configured response synthesizer.
         :rtype: BaseSynthesizer
         """
-        return get_response_synthesizer(
-            llm=self.llm,
-            response_mode="tree_summarize",
-            streaming=self.streaming,
-        )
+        if self._response_synthesizer is None:
+            self._response_synthesizer = get_response_synthesizer(
+                llm=self.llm,
+                response_mode=self.response_mode,
+                streaming=self.streaming,
+                callback_manager=self.llm.callback_manager,
+            )
+        return self._response_synthesizer
+
+    @property
+    def last_timings(self) -> Dict[str, float]:
+        """
+        Time in seconds spent in retrieval, synthesizer setup and synthesis by the latest query.
+
+        :return: The timings of the latest query.
+        :rtype: Dict[str, float]
+        """
+        return self._last_timings
+
+    def _record_timings(self, response: RESPONSE_TYPE, timings: Dict[str, float]) -> RESPONSE_TYPE:
+        """
+        Store the stage timings of a query and attach them to the response metadata.
+
+        :param response: The generated response.
+        :param timings: The time in seconds spent in each stage.
+        :return: The response.
+        """
+        self._last_timings = timings
+        response.metadata = {**(response.metadata or {}), "timings": timings}
+        return response
+
+    @staticmethod
+    def _context_bytes(nodes: List[NodeWithScore]) -> int:
+        """
+        Compute the size of the context sent to the LLM for the given nodes.
+
+        :param nodes: The retrieved nodes.
+        :return: The number of UTF-8 bytes of node content.
+        :rtype: int
+        """
+        return sum(len(node.node.get_content(metadata_mode=MetadataMode.LLM).encode("utf-8")) for node in nodes)
+
+    def _postprocess_nodes(self, nodes: List[NodeWithScore], query: Union[str, QueryBundle]) -> List[NodeWithScore]:
+        """
+        Apply the node postprocessors to the retrieved nodes.
+
+        :param nodes: The retrieved nodes.
+        :param query: The query the nodes were retrieved for.
+        :return: The nodes passed to synthesis.
+        :rtype: List[NodeWithScore]
+        """
+        query_bundle = query if isinstance(query, QueryBundle) else QueryBundle(query_str=query)
+        for postprocessor in self.node_postprocessors:
+            nodes = postprocessor.postprocess_nodes(nodes, query_bundle=query_bundle)
+        return nodes
+
+    def _shares_embed_model(self) -> bool:
+        """
+        Whether the answer cache embeds questions with the retriever's embedding model, so that
+        one query embedding serves both the cache lookup and retrieval.
+
+        :return: True if the models are the same.
+        :rtype: bool
+        """
+        return self.answer_cache.embed_model is getattr(self.retriever, "embed_model", None)
+
+    def _get_filters(self, query_str: str) -> Dict:
+        """
+        Return the metadata filters the retriever applies to a query, including those it extracts
+        from the question, so that cached answers are only reused under the same filters.
+
+        :param query_str: The query string.
+        :type query_str: str
+        :return: The effective retriever filters.
+        :rtype: Dict
+        """
+        query_filters = getattr(self.retriever, "query_filters", None)
+        if query_filters is not None:
+            return query_filters(query_str)
+        return getattr(self.retriever, "filters", None) or {}
 
 
     def custom_query(self, query_str: str) -> Response:
@@ -43,14 +153,226 @@ class EnhancedQueryEngine(CustomQueryEngine):
         :return: The generated response to the query.
         :rtype: Response
         """
-        nodes = self.retriever.retrieve(str_or_query_bundle=query_str)
+        start = time.perf_counter()
+        query = query_str
+        if self.answer_cache is not None:
+            cache_embedding = self.answer_cache.embed(query_str)
+            filters = self._get_filters(query_str)
+            cached = self.answer_cache.lookup(cache_embedding, filters)
+            if cached is not None:
+                response = self.answer_cache.replay(cached, self.streaming)
+                return self._record_timings(response, {"cache_lookup": time.perf_counter() - start})
+            if self._shares_embed_model():
+                query = QueryBundle(query_str=query_str, embedding=cache_embedding)
+        with metrics.span("retrieval") as span:
+            nodes = self.retriever.retrieve(str_or_query_bundle=query)
+            span.set(nodes=len(nodes))
+        nodes = self._postprocess_nodes(nodes, query)
+        retrieved = time.perf_counter()
         response_synthesizer = self._get_response_synthesizer()
-        return response_synthesizer.synthesize(
-            query=query_str,
-            nodes=nodes,
-        )
-    
-    # TODO: Implement async version of custom_query method
-    # async def acustom_query(self, query_str: str) -> STR_OR_RESPONSE_TYPE:
-    #     pass
+        ready = time.perf_counter()
+        with metrics.span("synthesis") as span:
+            if metrics.enabled:
+                span.set(context_bytes=self._context_bytes(nodes))
+            response = response_synthesizer.synthesize(
+                query=query_str,
+                nodes=nodes,
+            )
+        if metrics.enabled and getattr(response, "response_gen", None) is not None:
+            response.response_gen = metrics.wrap_stream(response.response_gen, "synthesis")
+        if self.answer_cache is not None:
+            response = self.answer_cache.record(cache_embedding, filters, response)
+        return self._record_timings(response, {
+            "retrieval": retrieved - start,
+            "synthesizer_setup": ready - retrieved,
+            "synthesis": time.perf_counter() - ready,
+        })
+
+    async def acustom_query(self, query_str: str) -> RESPONSE_TYPE:
+        """
+        Execute a query asynchronously, awaiting retrieval and synthesis so that
+        a single event loop can serve many concurrent queries.
 
+        :param query_str: The query string to process.
+        :type query_str: str
+        :return: The generated response to the query.
+        :rtype: RESPONSE_TYPE
+        """
+        return await self._arun_query(query_str)
+
+    async def _arun_query(
+        self,
+        query_str: str,
+        embedding: Optional[List[float]] = None,
+        response_synthesizer: Optional[BaseSynthesizer] = None,
+    ) -> RESPONSE_TYPE:
+        """
+        Execute a query asynchronously, optionally with a precomputed query embedding and another synthesizer.
+
+        :param query_str: The query string to process.
+        :param embedding: The query embedding of the retriever's embedding model, if already computed.
+        :param response_synthesizer: The synthesizer to use instead of the engine's.
+        :return: The generated response to the query.
+        """
+        start = time.perf_counter()
+        query = query_str if embedding is None else QueryBundle(query_str=query_str, embedding=embedding)
+        if self.answer_cache is not None:
+            shared = self._shares_embed_model()
+            if embedding is not None and shared:
+                cache_embedding = embedding
+            else:
+                cache_embedding = await self.answer_cache.aembed(query_str)
+            filters = self._get_filters(query_str)
+            cached = self.answer_cache.lookup(cache_embedding, filters)
+            if cached is not None:
+                response = self.answer_cache.replay(cached, self.streaming and response_synthesizer is None, asynchronous=True)
+                return self._record_timings(response, {"cache_lookup": time.perf_counter() - start})
+            if shared:
+                query = QueryBundle(query_str=query_str, embedding=cache_embedding)
+        with metrics.span("retrieval") as span:
+            nodes = await self.retriever.aretrieve(str_or_query_bundle=query)
+            span.set(nodes=len(nodes))
+        nodes = self._postprocess_nodes(nodes, query)
+        retrieved = time.perf_counter()
+        response_synthesizer = response_synthesizer or self._get_response_synthesizer()
+        ready = time.perf_counter()
+        with metrics.span("synthesis") as span:
+            if metrics.enabled:
+                span.set(context_bytes=self._context_bytes(nodes))
+            response = await response_synthesizer.asynthesize(
+                query=query_str,
+                nodes=nodes,
+            )
+        if metrics.enabled and isinstance(response, AsyncStreamingResponse) and response.response_gen is not None:
+            response.response_gen = metrics.wrap_astream(response.response_gen, "synthesis")
+        elif metrics.enabled and getattr(response, "response_gen", None) is not None:
+            response.response_gen = metrics.wrap_stream(response.response_gen, "synthesis")
+        if self.answer_cache is not None:
+            response = self.answer_cache.record(cache_embedding, filters, response)
+        return self._record_timings(response, {
+            "retrieval": retrieved - start,
+            "synthesizer_setup": ready - retrieved,
+            "synthesis": time.perf_counter() - ready,
+        })
+
+    def _get_batch_synthesizer(self) -> BaseSynthesizer:
+        """
+        Return a non-streaming synthesizer for batch queries, reusing the engine's when it does not stream.
+
+        :return: The synthesizer used by `aquery_batch`.
+        :rtype: BaseSynthesizer
+        """
+        if not self.streaming:
+            return self._get_response_synthesizer()
+        if self._batch_synthesizer is None:
+            self._batch_synthesizer = get_response_synthesizer(
+                llm=self.llm,
+                response_mode=self.response_mode,
+                streaming=False,
+                callback_manager=self.llm.callback_manager,
+            )
+        return self._batch_synthesizer
+
+    @staticmethod
+    def _deduplicate(questions: Sequence[str]) -> List[int]:
+        """
+        Map each question to the first earlier question identical to it up to case and whitespace.
+        Questions that are merely similar are kept apart, since they may differ only in the movie
+        or year they ask about.
+
+        :param questions: The questions.
+        :return: The index of the question answered in place of each question.
+        :rtype: List[int]
+        """
+        seen: Dict[str, int] = {}
+        return [seen.setdefault(" ".join(question.lower().split()), i) for i, question in enumerate(questions)]
+
+    async def aquery_batch(
+        self,
+        questions: Sequence[str],
+        concurrency: int = 8,
+        ordered: bool = True,
+    ) -> AsyncIterator[Tuple[int, RESPONSE_TYPE]]:
+        """
+        Answer many questions, yielding each answer as soon as it is ready.
+
+        Questions identical up to case and whitespace are answered once. The unique questions are
+        embedded up front by the retriever's embedding model, in batch calls where it supports them
+        (see `aget_query_embeddings`), and retrieved and synthesized by at most `concurrency` concurrent
+        workers, sharing the retriever's vector store client and the LLM client. Answers are not streamed, even if the engine streams.
+
+        :param questions: The questions to answer.
+        :param concurrency: The maximum number of questions retrieved and synthesized at once.
+        :param ordered: Whether to yield answers in input order rather than as they complete.
+        :return: An async iterator of (question index, response) pairs.
+        :rtype: AsyncIterator[Tuple[int, RESPONSE_TYPE]]
+        """
+        questions = list(questions)
+        embed_model = getattr(self.retriever, "embed_model", None)
+        mapping = self._deduplicate(questions)
+        representatives = sorted(set(mapping))
+        embeddings: Dict[int, List[float]] = {}
+        with metrics.span("batch_embedding") as span:
+            if embed_model is not None:
+                vectors = await aget_query_embeddings(embed_model, [questions[i] for i in representatives])
+                embeddings = dict(zip(representatives, vectors))
+            span.set(questions=len(questions), unique_questions=len(representatives))
+
+        synthesizer = self._get_batch_synthesizer()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def answer(i: int) -> Tuple[int, RESPONSE_TYPE]:
+            async with semaphore:
+                return i, await self._arun_query(questions[i], embedding=embeddings.get(i), response_synthesizer=synthesizer)
+
+        duplicates: Dict[int, List[int]] = {}
+        for i, representative in enumerate(mapping):
+            duplicates.setdefault(representative, []).append(i)
+        tasks = [asyncio.ensure_future(answer(i)) for i in representatives]
+        try:
+            if not ordered:
+                for task in asyncio.as_completed(tasks):
+                    representative, response = await task
+                    for i in duplicates[representative]:
+                        yield i, response
+                return
+            responses: Dict[int, RESPONSE_TYPE] = {}
+            pending = set(tasks)
+            for i, representative in enumerate(mapping):
+                while representative not in responses:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        finished, response = task.result()
+                        responses[finished] = response
+                yield i, responses[representative]
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def query_batch(
+        self,
+        questions: Sequence[str],
+        concurrency: int = 8,
+        ordered: bool = True,
+    ) -> Iterator[Tuple[int, RESPONSE_TYPE]]:
+        """
+        Synchronous counterpart of `aquery_batch` for offline jobs, running the batch on a private event loop.
+        Work proceeds while the caller consumes the answers.
+
+        :param questions: The questions to answer.
+        :param concurrency: The maximum number of questions retrieved and synthesized at once.
+        :param ordered: Whether to yield answers in input order rather than as they complete.
+        :return: An iterator of (question index, response) pairs.
+        :rtype: Iterator[Tuple[int, RESPONSE_TYPE]]
+        """
+        loop = asyncio.new_event_loop()
+        results = self.aquery_batch(questions, concurrency, ordered)
+        try:
+            while True:
+                try:
+                    yield loop.run_until_complete(results.__anext__())
+                except StopAsyncIteration:
+                    return
+        finally:
+            loop.run_until_complete(results.aclose())
+            loop.close()
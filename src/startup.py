@@ -0,0 +1,195 @@
+"""
+Startup profiling and warm-up for the serving path.
+
+`startup_profile` records the wall time of startup phases (building the app model, warm-up tasks, the
+first response) relative to process start, and `warm_up` primes tokenizers, caches and connections on a
+background thread. Run as a module to profile the import time of the serving modules:
+
+Usage:
+    python -m src.startup --top 15
+"""
+import argparse
+import json
+import re
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from src.instrumentation import metrics
+
+
+SERVING_MODULES = [
+    'src.chat_engine', 'src.query_engine', 'src.pinecone_retriever', 'src.data_indexer', 'src.embedding_cache',
+    'src.context_packer', 'src.chat_memory', 'llama_index.embeddings.openai', 'llama_index.llms.openai',
+]
+_IMPORT_TIME = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\| (\s*)(\S+)$")
+
+
+class StartupProfile:
+    """
+    Wall-clock timings of startup phases, measured from the creation of the profile, normally at import.
+    Phases are also recorded as instrumentation spans when metrics are enabled.
+    """
+
+    def __init__(self):
+        self._started = time.perf_counter()
+        self._phases: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def elapsed(self) -> float:
+        """
+        The seconds since the profile was created.
+        """
+        return time.perf_counter() - self._started
+
+    def record(self, name: str, seconds: float, error: Optional[str] = None) -> None:
+        """
+        Record a finished phase.
+
+        :param str name: The name of the phase.
+        :param float seconds: The wall time of the phase.
+        :param str error: The error the phase failed with, if any.
+        """
+        phase = {"phase": name, "seconds": seconds, "finished_at": self.elapsed()}
+        if error is not None:
+            phase["error"] = error
+        with self._lock:
+            self._phases.append(phase)
+        metrics.record_span(name, seconds)
+
+    def mark(self, name: str) -> None:
+        """
+        Record a milestone, e.g. the first response, once, with its time since the profile was created.
+
+        :param str name: The name of the milestone.
+        """
+        with self._lock:
+            if any(phase["phase"] == name for phase in self._phases):
+                return
+        self.record(name, self.elapsed())
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """
+        Time a block as a startup phase.
+
+        :param str name: The name of the phase.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception as exc:
+            self.record(name, time.perf_counter() - start, error=repr(exc))
+            raise
+        self.record(name, time.perf_counter() - start)
+
+    def report(self) -> List[Dict[str, Any]]:
+        """
+        The recorded phases, in order of completion.
+        """
+        with self._lock:
+            return list(self._phases)
+
+    def export_json(self, path: str) -> None:
+        with open(path, "w") as f:
+            json.dump(self.report(), f, indent=2)
+
+
+startup_profile = StartupProfile()
+
+
+def warm_up(
+    embed_model: Any = None,
+    vector_store: Any = None,
+    tasks: Optional[Dict[str, Callable[[], Any]]] = None,
+    background: bool = True,
+    profile: StartupProfile = startup_profile,
+) -> Optional[threading.Thread]:
+    """
+    Prime the tokenizer, the embedding model's HTTP connection (bypassing an embedding cache), the
+    vector store connection and any extra tasks, so the first request does not pay for them. Each task is timed
+    as a "warmup.<name>" phase; a failing task is recorded and the others still run.
+
+    :param embed_model: The query embedding model, if any.
+    :param vector_store: The vector store; Pinecone stores are primed with an index stats call.
+    :param dict tasks: Extra named zero-argument callables, e.g. loading a persisted index.
+    :param bool background: Whether to run on a daemon thread instead of blocking.
+    :param StartupProfile profile: The profile the tasks are recorded in.
+    :returns: The warm-up thread when run in the background, else None.
+    """
+    from llama_index.core.utils import get_tokenizer
+
+    steps: Dict[str, Callable[[], Any]] = {"tokenizer": lambda: get_tokenizer()("warm up")}
+    if embed_model is not None:
+        # A `CachedEmbedding` would answer from its disk cache, so call the model it wraps.
+        uncached = getattr(embed_model, "embed_model", embed_model)
+        steps["embedding"] = lambda: uncached.get_query_embedding("warm up")
+    client = getattr(vector_store, "client", None)
+    if hasattr(client, "describe_index_stats"):
+        steps["vector_store"] = client.describe_index_stats
+    steps.update(tasks or {})
+
+    def run() -> None:
+        for name, step in steps.items():
+            try:
+                with profile.phase(f"warmup.{name}"):
+                    step()
+            except Exception:
+                continue
+
+    if not background:
+        run()
+        return None
+    thread = threading.Thread(target=run, name="warm-up", daemon=True)
+    thread.start()
+    return thread
+
+
+def import_profile(modules: List[str], top: int = 20) -> List[Dict[str, Any]]:
+    """
+    Measure the import time of modules in a fresh interpreter with `-X importtime`.
+
+    :param list[str] modules: The modules to import.
+    :param int top: The number of slowest modules to return.
+    :returns: The slowest imported modules by cumulative time, with their self and cumulative milliseconds.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "; ".join(f"import {module}" for module in modules)],
+        capture_output=True,
+        text=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        match = _IMPORT_TIME.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            rows.append({
+                "module": module,
+                "depth": len(indent) // 2,
+                "self_ms": int(self_us) / 1000,
+                "cumulative_ms": int(cumulative_us) / 1000,
+            })
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {modules} failed:\n{result.stderr[-2000:]}")
+    return sorted(rows, key=lambda row: row["cumulative_ms"], reverse=True)[:top]
+
+
+def main(argv: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modules", nargs="+", default=SERVING_MODULES, help="Modules to import.")
+    parser.add_argument("--top", type=int, default=20, help="Number of slowest modules to report.")
+    parser.add_argument("--output", default=None, help="Write the report to this JSON path.")
+    args = parser.parse_args(argv)
+    rows = import_profile(args.modules, args.top)
+    for row in rows:
+        print(f"{row['cumulative_ms']:10.1f} ms  {row['self_ms']:8.1f} ms  {'  ' * row['depth']}{row['module']}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(rows, f, indent=2)
+    return rows
+
+
+if __name__ == "__main__":
+    main()
@@ -1,54 +1,106 @@
 import streamlit as st
 import os
-from llama_index.embeddings.openai import OpenAIEmbedding 
-from llama_index.llms.openai import OpenAI
-from src.chat_engine import get_chat_engine
-from src.query_engine import EnhancedQueryEngine
-from src.pinecone_retriever import PineconeRetriever
-from src.data_indexer import DataIndexer
+
+
+MAX_SESSION_MESSAGES = 50
 
 
 @st.cache_resource(show_spinner=False)
 def get_app_model():
-    embed_model = OpenAIEmbedding(
-        model="text-embedding-3-large",
-        dimensions=1024,
-        api_key=os.environ['OPENAI_API_KEY']
-    )
-    indexer = DataIndexer(
-        dataset_name="movies",
-        embedding_dimension=1024,
-        embed_model=embed_model,
-        pinecone_api_key=os.environ['PINECONE_API_KEY']
-    )
-    vector_store = indexer.get_vector_store()
-    
-    retriever = PineconeRetriever(
-        vector_store=vector_store,
-        embed_model=embed_model,
-        query_mode="default",
-        similarity_top_k=15
-    )
-    
-    llm = OpenAI(
-        model="gpt-4o",
-        api_key=os.environ['OPENAI_API_KEY']
-    )
-    
-    query_engine = EnhancedQueryEngine(
-        retriever=retriever,
-        llm=llm,
-        streaming=True
-    )
-    
+    # Heavy modules are imported here rather than at the top, so the page renders before they load.
+    from src.startup import startup_profile, warm_up
+    from src.instrumentation import metrics, JsonLinesSink
+
+    with startup_profile.phase("import"):
+        from llama_index.embeddings.openai import OpenAIEmbedding
+        from llama_index.llms.openai import OpenAI
+        from llama_index.core import Settings
+        from src.query_engine import EnhancedQueryEngine
+        from src.pinecone_retriever import PineconeRetriever
+        from src.data_indexer import DataIndexer
+        from src.embedding_cache import CachedEmbedding
+        from src.context_packer import MovieContextPacker
+
+    if os.environ.get('METRICS_PORT'):
+        metrics.enable()
+        Settings.callback_manager.add_handler(metrics.callback_handler())
+        metrics.serve_prometheus(int(os.environ['METRICS_PORT']))
+        if os.environ.get('METRICS_TRACE_PATH'):
+            metrics.add_sink(JsonLinesSink(os.environ['METRICS_TRACE_PATH']))
+
+    with startup_profile.phase("get_app_model"):
+        embed_model = CachedEmbedding(
+            embed_model=OpenAIEmbedding(
+                model="text-embedding-3-large",
+                dimensions=1024,
+                api_key=os.environ['OPENAI_API_KEY']
+            ),
+            cache_dir=".cache/embeddings"
+        )
+        local_store_dir = os.environ.get('LOCAL_VECTOR_STORE_DIR')
+        if local_store_dir:
+            from src.local_vector_store import LocalVectorStore
+        indexer = DataIndexer.for_serving(
+            dataset_name="movies",
+            embedding_dimension=1024,
+            embed_model=embed_model,
+            pinecone_api_key=os.environ.get('PINECONE_API_KEY'),
+            vector_store=LocalVectorStore(persist_dir=local_store_dir) if local_store_dir else None,
+            index_host=os.environ.get('PINECONE_INDEX_HOST')
+        )
+        vector_store = indexer.get_vector_store()
+
+        bm25_index_dir = os.environ.get('BM25_INDEX_DIR')
+        metadata_index_dir = os.environ.get('METADATA_INDEX_DIR')
+        if bm25_index_dir:
+            from src.bm25_index import BM25Index
+        if metadata_index_dir:
+            from src.metadata_index import MovieMetadataIndex
+        retriever = PineconeRetriever(
+            vector_store=vector_store,
+            embed_model=embed_model,
+            query_mode="hybrid" if bm25_index_dir else "default",
+            similarity_top_k=15,
+            bm25_index=BM25Index.load(bm25_index_dir) if bm25_index_dir else None,
+            metadata_index=MovieMetadataIndex.load(metadata_index_dir) if metadata_index_dir else None
+        )
+
+        llm = OpenAI(
+            model="gpt-4o",
+            api_key=os.environ['OPENAI_API_KEY']
+        )
+
+        query_engine = EnhancedQueryEngine(
+            retriever=retriever,
+            llm=llm,
+            streaming=True,
+            node_postprocessors=[MovieContextPacker()]
+        )
+
+    warm_up(embed_model=embed_model, vector_store=vector_store, tasks={"movie_graph": get_movie_graph})
     return query_engine, llm
 
 
+@st.cache_resource(show_spinner=False)
+def get_movie_graph():
+    movie_graph_dir = os.environ.get('MOVIE_GRAPH_DIR')
+    if not movie_graph_dir:
+        return None
+    from src.movie_graph import MovieGraph
+    return MovieGraph.load(movie_graph_dir)
+
+
 def create_chat_engine(query_engine, llm):
+    from src.chat_engine import get_chat_engine
+    from src.chat_memory import CompactingChatMemory
+
+    movie_graph = get_movie_graph()
     return get_chat_engine(
         chat_mode="openai",
         query_engine=query_engine,
         llm=llm,
+        tools=[movie_graph.as_tool()] if movie_graph else None,
+        memory=CompactingChatMemory.from_defaults(llm=llm),
         streaming=True
     )
 
@@ -91,9 +143,13 @@ class ChatController:
             st.session_state.chat_engine = create_chat_engine(self.query_engine, self.llm)
 
     def run(self):
+        from src.instrumentation import metrics
+        from src.startup import startup_profile
+
         user_input = self.view.get_user_input()
         if user_input:
             st.session_state.messages.append({"role": "user", "content": user_input})
+            del st.session_state.messages[:-MAX_SESSION_MESSAGES]
 
         for message in st.session_state.messages:
             with st.chat_message(message["role"]):
@@ -101,10 +157,14 @@ class ChatController:
 
         if st.session_state.messages[-1]["role"] != "assistant":
             with st.chat_message("assistant"):
-                response_stream = st.session_state.chat_engine.stream_chat(user_input)
-                st.write_stream(response_stream.response_gen)
+                with metrics.request("chat"):
+                    response_stream = st.session_state.chat_engine.stream_chat(user_input)
+                    st.write_stream(metrics.wrap_stream(response_stream.response_gen, "chat"))
                 message = {"role": "assistant", "content": response_stream.response}
                 st.session_state.messages.append(message)
+            startup_profile.mark("first_response")
+            if os.environ.get('STARTUP_PROFILE_PATH'):
+                startup_profile.export_json(os.environ['STARTUP_PROFILE_PATH'])
 
 
 
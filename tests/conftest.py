@@ -0,0 +1,75 @@
+from typing import List
+import pandas as pd
+import pytest
+from llama_index.core.schema import NodeRelationship, RelatedNodeInfo, TextNode
+from src.instrumentation import metrics
+from src.offline_models import HashingEmbedding
+
+
+MOVIES = [
+    ("tt0000001", "Parasite", ["Thriller", "Drama"], ["Bong Joon Ho"], ["Song Kang-ho"], "ko", 2019, 8.5),
+    ("tt0000002", "Memories of Murder", ["Thriller", "Crime"], ["Bong Joon Ho"], ["Song Kang-ho"], "ko", 2003, 8.1),
+    ("tt0000003", "Heat", ["Crime", "Drama"], ["Michael Mann"], ["Al Pacino", "Robert De Niro"], "en", 1995, 8.3),
+    ("tt0000004", "Amelie", ["Comedy", "Romance"], ["Jean-Pierre Jeunet"], ["Audrey Tautou"], "fr", 2001, 8.3),
+    ("tt0000005", "Blade Runner", ["Science Fiction"], ["Ridley Scott"], ["Harrison Ford"], "en", 1982, 8.1),
+    ("tt0000006", "Alien", ["Science Fiction", "Horror"], ["Ridley Scott"], ["Sigourney Weaver"], "en", 1979, 8.5),
+]
+
+
+def make_nodes(embed_model: HashingEmbedding, chunks_per_movie: int = 3) -> List[TextNode]:
+    """
+    Build embedded chunk nodes for the test movies, with IDs of the form "<imdb_id>#<chunk index>".
+    """
+    nodes = []
+    for imdb_id, title, genres, directors, cast, language, year, rating in MOVIES:
+        for chunk in range(chunks_per_movie):
+            node = TextNode(
+                id_=f"{imdb_id}#{chunk}",
+                text=f"{title} part {chunk}: a {genres[0].lower()} story directed by {directors[0]}.",
+                metadata={
+                    "title": title, "genres": genres, "directors": directors, "cast": cast,
+                    "original_language": language, "release_year": year, "averageRating": rating,
+                },
+            )
+            node.relationships[NodeRelationship.SOURCE] = RelatedNodeInfo(node_id=imdb_id)
+            node.embedding = embed_model.get_text_embedding(node.text)
+            nodes.append(node)
+    return nodes
+
+
+def write_dataset(path: str, count: int, plot_sentences: int = 5) -> None:
+    """
+    Write a movie CSV of `count` rows cycling through the test movies, in the layout of `data/data.csv`.
+    """
+    rows = []
+    for i in range(count):
+        imdb_id, title, genres, directors, cast, language, year, rating = MOVIES[i % len(MOVIES)]
+        rows.append({
+            "imdb_id": f"tt{i:07d}", "title": f"{title} {i}",
+            "plot_summary": f"{title} {i} follows a detective. " * (plot_sentences + i % 7),
+            "directors": ", ".join(directors), "cast": ", ".join(cast), "genres": ", ".join(genres),
+            "averageRating": rating, "revenue": 1000 * i, "runtime": 90 + i % 60, "original_language": language,
+            "spoken_languages": language, "production_companies": "Studio", "release_year": year,
+            "release_month": 1 + i % 12, "release_day": 1 + i % 28, "release_date": f"{year}-{1 + i % 12:02d}-{1 + i % 28:02d}",
+        })
+    pd.DataFrame(rows).to_csv(path, index=False)
+
+
+@pytest.fixture
+def embed_model() -> HashingEmbedding:
+    return HashingEmbedding(dimensions=64)
+
+
+@pytest.fixture
+def nodes(embed_model: HashingEmbedding) -> List[TextNode]:
+    return make_nodes(embed_model)
+
+
+@pytest.fixture(autouse=True)
+def disabled_metrics():
+    """
+    Leave the global metrics disabled and empty after each test, since the benchmark enables them.
+    """
+    yield
+    metrics.disable()
+    metrics.reset()
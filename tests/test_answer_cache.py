@@ -0,0 +1,72 @@
+import asyncio
+from llama_index.core.base.response.schema import AsyncStreamingResponse, Response, StreamingResponse
+from src import answer_cache
+from src.answer_cache import SemanticAnswerCache
+
+
+def test_entries_expire_after_the_ttl(monkeypatch, embed_model):
+    now = [1000.0]
+    monkeypatch.setattr(answer_cache.time, "time", lambda: now[0])
+    cache = SemanticAnswerCache(embed_model, ttl=60)
+    embedding = cache.embed("Who directed Heat?")
+    cache.record(embedding, {}, Response(response="Michael Mann"))
+    now[0] += 59
+    assert cache.lookup(embedding).response == "Michael Mann"
+    now[0] += 2
+    assert cache.lookup(embedding) is None
+    assert cache.stats()["expirations"] == 1
+    assert cache.stats()["entries"] == 0
+
+
+def test_evicts_the_least_recently_used_entry(embed_model):
+    cache = SemanticAnswerCache(embed_model, max_entries=2)
+    questions = ["Who directed Heat?", "Who directed Alien?", "Who directed Amelie?"]
+    embeddings = [cache.embed(question) for question in questions]
+    cache.record(embeddings[0], {}, Response(response="Michael Mann"))
+    cache.record(embeddings[1], {}, Response(response="Ridley Scott"))
+    assert cache.lookup(embeddings[0]) is not None
+    cache.record(embeddings[2], {}, Response(response="Jean-Pierre Jeunet"))
+    assert cache.evictions == 1
+    assert cache.lookup(embeddings[1]) is None
+    assert cache.lookup(embeddings[0]).response == "Michael Mann"
+    assert cache.lookup(embeddings[2]).response == "Jean-Pierre Jeunet"
+
+
+def test_filters_are_part_of_the_key(embed_model):
+    cache = SemanticAnswerCache(embed_model)
+    embedding = cache.embed("Thrillers from 2019")
+    cache.record(embedding, {"release_year": 2019}, Response(response="Parasite"))
+    assert cache.lookup(embedding, {"release_year": 2003}) is None
+    assert cache.lookup(embedding, {"release_year": 2019}).response == "Parasite"
+
+
+def test_streams_are_stored_once_consumed_and_replayed(embed_model):
+    cache = SemanticAnswerCache(embed_model)
+    embedding = cache.embed("Who directed Heat?")
+    response = cache.record(embedding, {}, StreamingResponse(response_gen=iter(["Michael", " Mann"])))
+    assert cache.stats()["entries"] == 0
+    assert "".join(response.response_gen) == "Michael Mann"
+    entry = cache.lookup(embedding)
+    replayed = cache.replay(entry, streaming=True)
+    assert isinstance(replayed, StreamingResponse)
+    assert "".join(replayed.response_gen) == "Michael Mann"
+    assert isinstance(cache.replay(entry, streaming=False), Response)
+
+
+def test_async_streams_are_stored_once_consumed_and_replayed(embed_model):
+    cache = SemanticAnswerCache(embed_model)
+    embedding = cache.embed("Who directed Heat?")
+
+    async def tokens():
+        for token in ["Michael", " Mann"]:
+            yield token
+
+    async def consume(response):
+        return "".join([token async for token in response.async_response_gen()])
+
+    response = cache.record(embedding, {}, AsyncStreamingResponse(response_gen=tokens()))
+    assert cache.stats()["entries"] == 0
+    assert asyncio.run(consume(response)) == "Michael Mann"
+    replayed = cache.replay(cache.lookup(embedding), streaming=True, asynchronous=True)
+    assert isinstance(replayed, AsyncStreamingResponse)
+    assert asyncio.run(consume(replayed)) == "Michael Mann"
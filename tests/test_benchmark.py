@@ -0,0 +1,63 @@
+import pandas as pd
+import pytest
+from llama_index.core import Settings
+from src import benchmark
+from tests.conftest import write_dataset
+
+
+@pytest.fixture
+def dataset(tmp_path, monkeypatch):
+    """
+    Write a small movie dataset and QA sample, and count tokens by whitespace for the benchmark run.
+    """
+    monkeypatch.setattr(Settings, "_tokenizer", None)
+    write_dataset(tmp_path / "data.csv", 30)
+    titles = pd.read_csv(tmp_path / "data.csv")["title"][:8]
+    questions = [f"In the movie {title}, who is the detective?" for title in titles]
+    pd.DataFrame({"question": questions, "answer": "A detective."}).to_csv(tmp_path / "qa.csv", index=False)
+    return ["--data", str(tmp_path / "data.csv"), "--qa", str(tmp_path / "qa.csv"), "--whitespace-tokenizer"]
+
+
+def test_reports_llm_calls_and_tokens(dataset):
+    reports = benchmark.main([*dataset, "--top-k", "3", "--clients", "2"])
+    assert reports[0]["questions"] == 8
+    assert reports[0]["llm_calls_per_question"] > 0
+    assert reports[0]["tokens_per_question"] > 0
+
+
+def test_compacting_memory_bounds_prompt_tokens(dataset):
+    reports = benchmark.main([*dataset, "--top-k", "3", "--clients", "1", "--chat-turns", "24", "--memory-tokens", "120"])
+    chat = reports[-1]
+    default, compacting = chat["default.prompt_tokens_per_turn"], chat["compacting.prompt_tokens_per_turn"]
+    assert len(default) == len(compacting) == 24
+    assert all(tokens > 0 for tokens in default[1:] + compacting[1:])
+    assert default[-1] > default[1]
+    assert chat["compacting.max_prompt_tokens"] < default[-1]
+
+
+def test_normalisation_benchmark_runs_without_the_grid(dataset):
+    reports = benchmark.main([*dataset, "--skip-grid", "--normalise-rows", "2000"])
+    assert len(reports) == 1
+    normalise = reports[0]
+    assert normalise["normalise_rows"] == normalise["normalise.rows_processed"] == 2000
+    assert normalise["normalise.per_row_seconds"] > 0
+    assert normalise["normalise.column_wise_seconds"] > 0
+
+
+def test_parallel_ingestion_matches_serial(dataset):
+    reports = benchmark.main([*dataset, "--top-k", "3", "--clients", "1", "--chunking", "64:8", "--ingest-workers", "2"])
+    ingest = reports[0]
+    assert ingest["ingest.nodes"] > 30
+    assert ingest["ingest.identical@2"]
+
+
+def test_synthesizer_is_set_up_once_per_response_mode(dataset):
+    reports = benchmark.main([
+        *dataset, "--top-k", "10", "--chunking", "64:8", "--clients", "1", "--context-window", "1000",
+        "--response-mode", "compact", "tree_summarize",
+    ])
+    compact, tree = reports
+    assert (compact["response_mode"], tree["response_mode"]) == ("compact", "tree_summarize")
+    for report in (compact, tree):
+        assert report["synthesizer_setup_ms.mean_after_first"] < report["synthesizer_setup_ms.first"]
+    assert compact["llm_calls_per_question"] > 1
@@ -0,0 +1,66 @@
+import logging
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.llms import ChatMessage, MessageRole
+from src.chat_memory import CompactingChatMemory
+from src.offline_models import StubLLM, whitespace_tokenizer
+
+
+class FailingLLM(StubLLM):
+    """
+    A stub LLM whose first `failures` completions raise.
+    """
+
+    failures: int = 1000
+    _attempts: int = PrivateAttr(default=0)
+
+    def complete(self, prompt, formatted=False, **kwargs):
+        self._attempts += 1
+        if self._attempts <= self.failures:
+            raise RuntimeError("rate limited")
+        return super().complete(prompt, formatted=formatted, **kwargs)
+
+
+def wait_for_compaction(memory):
+    memory._executor.submit(lambda: None).result()
+
+
+def chat(memory, turns, start=0):
+    for i in range(start, start + turns):
+        memory.put(ChatMessage(role=MessageRole.USER, content=f"question {i} about a movie"))
+        memory.put(ChatMessage(role=MessageRole.ASSISTANT, content=f"answer {i} about a movie"))
+
+
+def contents(messages):
+    return [message.content for message in messages]
+
+
+def test_compaction_keeps_the_window_within_budget():
+    memory = CompactingChatMemory.from_defaults(llm=StubLLM(), token_limit=60, tokenizer_fn=whitespace_tokenizer)
+    chat(memory, 8)
+    wait_for_compaction(memory)
+    assert memory.compactions >= 1
+    assert memory.summary == StubLLM().answer
+    history = memory.get()
+    assert history[0].role == MessageRole.SYSTEM
+    assert sum(len(whitespace_tokenizer(f"{m.role.value}: {m.content}")) for m in history) <= 60
+    assert "question 0 about a movie" not in contents(history)
+
+
+def test_failed_compaction_is_logged_and_keeps_the_turns(caplog):
+    llm = FailingLLM(failures=1000)
+    memory = CompactingChatMemory.from_defaults(llm=llm, token_limit=60, tokenizer_fn=whitespace_tokenizer)
+    with caplog.at_level(logging.ERROR, logger="src.chat_memory"):
+        chat(memory, 8)
+        wait_for_compaction(memory)
+    assert "Summarizing" in caplog.text
+    assert memory.compactions == 0
+    assert contents(memory.get())[:2] == ["question 0 about a movie", "answer 0 about a movie"]
+    assert len(memory.get()) == 16
+
+    llm.failures = 0
+    chat(memory, 1, start=8)
+    wait_for_compaction(memory)
+    wait_for_compaction(memory)
+    assert memory.compactions >= 1
+    assert memory.summary == StubLLM().answer
+    assert "question 0 about a movie" not in contents(memory.get())
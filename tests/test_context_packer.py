@@ -0,0 +1,54 @@
+from llama_index.core.schema import MetadataMode, NodeWithScore
+from src.context_packer import MovieContextPacker
+
+
+def scored(nodes):
+    """
+    Score the nodes so that movies, and the chunks of each movie, rank in fixture order.
+    """
+    return [NodeWithScore(node=node, score=1.0 - i / 100) for i, node in enumerate(nodes)]
+
+
+def content(node_with_score):
+    return node_with_score.node.get_content(metadata_mode=MetadataMode.LLM)
+
+
+def test_keeps_the_best_chunks_per_movie_under_one_header(nodes):
+    packer = MovieContextPacker(max_chunks_per_movie=2, token_budget=100_000)
+    packed = packer.postprocess_nodes(scored(nodes))
+    assert [node.node.metadata["title"] for node in packed] == [
+        "Parasite", "Memories of Murder", "Heat", "Amelie", "Blade Runner", "Alien",
+    ]
+    heat = content(packed[2])
+    assert heat.count("title: Heat") == 1
+    assert "Heat part 0" in heat and "Heat part 1" in heat and "Heat part 2" not in heat
+
+    stats = packer.last_stats
+    assert stats["packed_tokens"] == stats["deduplicated_tokens"] == sum(packer._count_tokens(node) for node in packed)
+    assert stats["tokens_saved"] == stats["raw_tokens"] - stats["packed_tokens"] > 0
+    assert stats["tokens_truncated"] == 0
+
+
+def test_budget_drops_weaker_chunks_then_movies(nodes):
+    unbounded = MovieContextPacker(max_chunks_per_movie=2, token_budget=100_000)
+    full = unbounded.postprocess_nodes(scored(nodes))
+    first_chunk = unbounded._merge(scored(nodes)[3:4])
+    budget = unbounded._count_tokens(full[0]) + unbounded._count_tokens(first_chunk)
+
+    packer = MovieContextPacker(max_chunks_per_movie=2, token_budget=budget)
+    packed = packer.postprocess_nodes(scored(nodes))
+    assert [node.node.metadata["title"] for node in packed] == ["Parasite", "Memories of Murder"]
+    assert "Memories of Murder part 1" not in content(packed[1])
+
+    stats = packer.last_stats
+    assert stats["packed_tokens"] == budget
+    assert stats["tokens_saved"] == unbounded.last_stats["tokens_saved"]
+    assert stats["tokens_truncated"] == stats["deduplicated_tokens"] - budget > 0
+    assert (packer.total_tokens_saved, packer.total_tokens_truncated) == (stats["tokens_saved"], stats["tokens_truncated"])
+
+
+def test_first_movie_is_kept_even_over_budget(nodes):
+    packer = MovieContextPacker(max_chunks_per_movie=2, token_budget=1)
+    packed = packer.postprocess_nodes(scored(nodes))
+    assert len(packed) == 1
+    assert "Parasite part 1" not in content(packed[0])
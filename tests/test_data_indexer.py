@@ -0,0 +1,87 @@
+import time
+from llama_index.core.bridge.pydantic import PrivateAttr
+from src.data_indexer import DataIndexer
+from src.local_vector_store import LocalVectorStore
+from src.offline_models import HashingEmbedding
+from tests.conftest import make_nodes
+
+
+class RateLimitError(Exception):
+    pass
+
+
+class FlakyVectorStore(LocalVectorStore):
+    """
+    A local store rejecting its first upserts with rate-limit errors and recording batch sizes.
+    """
+
+    _failures: int = PrivateAttr(default=0)
+    _batches: list = PrivateAttr(default_factory=list)
+
+    def add(self, nodes, **add_kwargs):
+        if self._failures:
+            self._failures -= 1
+            raise RateLimitError()
+        self._batches.append(len(nodes))
+        return super().add(nodes, **add_kwargs)
+
+
+def test_sync_nodes_upserts_in_batches_with_retries(tmp_path, embed_model):
+    store = FlakyVectorStore()
+    store._failures = 2
+    indexer = DataIndexer("movies", 64, embed_model, vector_store=store)
+    manifest_path = str(tmp_path / "manifest.json")
+    nodes = make_nodes(embed_model, chunks_per_movie=4)
+
+    stats = indexer.sync_nodes(nodes, manifest_path, batch_size=5, num_workers=2, max_retries=3, backoff=0.0)
+    assert stats == {"upserted": 24, "deleted": 0, "unchanged": 0, "failed": 0}
+    assert sorted(store._batches) == [4] + [5] * 4
+    assert len(store.get_nodes(node_ids=[node.node_id for node in nodes])) == 24
+
+    nodes[0].text += " Extended cut."
+    store._failures = 1
+    stats = indexer.sync_nodes(nodes[:-1], manifest_path, batch_size=5, max_retries=0)
+    assert stats == {"upserted": 0, "deleted": 1, "unchanged": 22, "failed": 1}
+    stats = indexer.sync_nodes(nodes[:-1], manifest_path, batch_size=5)
+    assert stats == {"upserted": 1, "deleted": 0, "unchanged": 22, "failed": 0}
+
+
+def test_batched_embedding_is_faster_and_identical(embed_model):
+    model = HashingEmbedding(dimensions=64, latency=0.02)
+    indexer = DataIndexer("movies", 64, model, vector_store=LocalVectorStore())
+    serial, batched = make_nodes(embed_model, chunks_per_movie=8), make_nodes(embed_model, chunks_per_movie=8)
+    for node in serial + batched:
+        node.embedding = None
+
+    start = time.perf_counter()
+    assert indexer.embed_nodes(serial) == []
+    serial_seconds = time.perf_counter() - start
+    assert model.calls == 48
+    start = time.perf_counter()
+    assert indexer.embed_nodes(batched, batch_size=8, num_workers=6) == []
+    batched_seconds = time.perf_counter() - start
+    assert model.calls == 48 + 6
+
+    assert [node.embedding for node in batched] == [node.embedding for node in serial]
+    assert serial_seconds > 5 * batched_seconds
+
+
+def test_checkpoint_skips_only_unchanged_nodes(tmp_path, embed_model):
+    store = FlakyVectorStore()
+    indexer = DataIndexer("movies", 64, embed_model, vector_store=store)
+    checkpoint_path = str(tmp_path / "checkpoint.txt")
+    nodes = make_nodes(embed_model, chunks_per_movie=2)
+
+    store._failures = 1
+    failed = indexer.add_to_vector_store(nodes, batch_size=4, max_retries=0, checkpoint_path=checkpoint_path)
+    assert failed == nodes[:4]
+    assert store._batches == [4, 4]
+
+    edited = nodes[4]
+    edited.text += " Director's cut."
+    edited.embedding = embed_model.get_text_embedding(edited.text)
+    store._batches.clear()
+    assert indexer.add_to_vector_store(nodes, batch_size=4, checkpoint_path=checkpoint_path) == []
+    assert sum(store._batches) == 5
+    assert store.get_nodes(node_ids=[edited.node_id])[0].text == edited.text
+    assert not (tmp_path / "checkpoint.txt").exists()
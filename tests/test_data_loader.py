@@ -0,0 +1,55 @@
+import tracemalloc
+import pandas as pd
+from src.data_loader import DataLoader
+from tests.conftest import write_dataset
+
+
+METADATA_COLUMNS = ['title', 'directors', 'cast', 'genres', 'averageRating', 'runtime', 'release_date']
+
+
+def make_loader(path, **kwargs):
+    return DataLoader(str(path), "plot_summary", METADATA_COLUMNS, chunk_size=128, chunk_overlap=16, id_column="imdb_id", **kwargs)
+
+
+def summary(nodes):
+    return [(node.node_id, node.text, node.metadata, sorted((str(k), v.node_id) for k, v in node.relationships.items())) for node in nodes]
+
+
+def peak_memory(fn):
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def test_streaming_matches_whole_file_ingestion_in_bounded_memory(tmp_path):
+    path = tmp_path / "data.csv"
+    write_dataset(path, 600)
+    data = pd.read_csv(path)
+    data["reviews"] = "An unused, wide column of user reviews. " * 50
+    data.to_csv(path, index=False)
+
+    loader = make_loader(path)
+    nodes = loader.ingest_data()
+    assert summary([node for batch in loader.iter_nodes(chunksize=50) for node in batch]) == summary(nodes)
+    del nodes, loader
+
+    def consume():
+        for _ in make_loader(path).iter_nodes(chunksize=50):
+            pass
+
+    whole_file = peak_memory(lambda: make_loader(path).ingest_data())
+    streaming = peak_memory(consume)
+    assert streaming < whole_file / 2
+
+
+def test_parallel_node_parsing_matches_serial(tmp_path):
+    path = tmp_path / "data.csv"
+    write_dataset(path, 120, plot_sentences=40)
+    serial = make_loader(path).ingest_data()
+    assert len(serial) > 120
+    assert summary(make_loader(path, num_workers=3).ingest_data()) == summary(serial)
+    streamed = [node for batch in make_loader(path, num_workers=2).iter_nodes(chunksize=25) for node in batch]
+    assert summary(streamed) == summary(serial)
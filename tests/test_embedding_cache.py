@@ -0,0 +1,95 @@
+import asyncio
+import os
+import numpy as np
+import pytest
+from src.embedding_cache import CachedEmbedding, EmbeddingCache, aget_query_embeddings
+from src.offline_models import HashingEmbedding
+
+
+def test_keys_ending_in_nul_bytes(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), max_entries=2)
+    keys = [b"\x01" * 31 + b"\x00", b"\x02" * 30 + b"\x00\x00", b"\x03" * 32]
+    cache.put(keys[0], [1.0, 0.0])
+    cache.put(keys[1], [0.0, 1.0])
+    cache.persist()
+
+    loaded = EmbeddingCache(str(tmp_path), max_entries=2)
+    assert loaded.get(keys[0]) == [1.0, 0.0]
+    assert loaded.get(keys[1]) == [0.0, 1.0]
+    loaded.put(keys[2], [1.0, 1.0])
+    assert loaded.stats()["evictions"] == 1
+    assert loaded.get(keys[0]) is None
+    assert loaded.get(keys[2]) == [1.0, 1.0]
+
+
+def test_loads_caches_with_string_keys(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), max_entries=2)
+    key = b"\x05" * 31 + b"\x00"
+    cache.put(key, [0.5, 0.5])
+    cache.persist()
+    keys = np.zeros(2, dtype="S32")
+    keys[0] = key
+    np.save(os.path.join(str(tmp_path), "keys.npy"), keys)
+    assert EmbeddingCache(str(tmp_path), max_entries=2).get(key) == [0.5, 0.5]
+
+
+def test_autosave_persists_in_batches(tmp_path):
+    embed_model = CachedEmbedding(HashingEmbedding(dimensions=8), str(tmp_path), max_entries=10, autosave_every=3)
+    keys_path = os.path.join(str(tmp_path), os.listdir(str(tmp_path))[0], "keys.npy")
+    embed_model.get_query_embedding("first")
+    embed_model.get_query_embedding("second")
+    assert not os.path.exists(keys_path)
+    embed_model.get_text_embedding_batch(["third", "fourth"])
+    assert os.path.exists(keys_path)
+    assert embed_model.cache.unsaved == 0
+
+    reloaded = CachedEmbedding(HashingEmbedding(dimensions=8), str(tmp_path), max_entries=10)
+    assert reloaded.get_query_embedding("first") == embed_model.get_query_embedding("first")
+    assert reloaded.cache.stats()["hits"] == 1
+
+
+def test_evicts_least_recently_used_across_reloads(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), max_entries=3)
+    keys = [EmbeddingCache.make_key(i) for i in range(5)]
+    for i in range(3):
+        cache.put(keys[i], [float(i), 0.0])
+    cache.get(keys[0])
+    cache.put(keys[3], [3.0, 0.0])
+    assert cache.get(keys[1]) is None
+    cache.persist()
+
+    loaded = EmbeddingCache(str(tmp_path), max_entries=3)
+    loaded.put(keys[4], [4.0, 0.0])
+    assert loaded.get(keys[2]) is None
+    assert [loaded.get(key) for key in (keys[0], keys[3], keys[4])] == [[0.0, 0.0], [3.0, 0.0], [4.0, 0.0]]
+    assert loaded.stats()["evictions"] == 1
+
+
+def test_models_of_different_dimensions_share_a_directory(tmp_path):
+    small = CachedEmbedding(HashingEmbedding(dimensions=8), str(tmp_path), max_entries=4)
+    large = CachedEmbedding(HashingEmbedding(dimensions=16), str(tmp_path), max_entries=4)
+    assert len(small.get_query_embedding("heat")) == 8
+    assert len(large.get_query_embedding("heat")) == 16
+    small.cache.persist()
+
+    assert len(os.listdir(str(tmp_path))) == 2
+    cache_dir = next(
+        os.path.join(str(tmp_path), name) for name in os.listdir(str(tmp_path))
+        if os.path.exists(os.path.join(str(tmp_path), name, "keys.npy"))
+    )
+    cache = EmbeddingCache(cache_dir, max_entries=4)
+    with pytest.raises(ValueError):
+        cache.put(EmbeddingCache.make_key("other"), [1.0] * 3)
+    with pytest.raises(ValueError):
+        EmbeddingCache(cache_dir, max_entries=4, dimension=3)
+
+
+def test_query_batches_embed_only_uncached_queries(tmp_path):
+    model = HashingEmbedding(dimensions=16)
+    cached = CachedEmbedding(model, cache_dir=str(tmp_path), autosave=False)
+    first = asyncio.run(cached.aget_query_embedding_batch(["heat", "alien"]))
+    assert model.calls == 1
+    second = asyncio.run(aget_query_embeddings(cached, ["alien", "amelie", "heat"]))
+    assert model.calls == 2
+    assert second[0] == first[1] and second[2] == first[0]
+    assert second[1] == model.get_query_embedding("amelie")
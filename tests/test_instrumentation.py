@@ -0,0 +1,57 @@
+import csv
+import tempfile
+from llama_index.core.callbacks import CallbackManager
+from src.embedding_cache import CachedEmbedding
+from src.instrumentation import Instrumentation, RollingHistogram
+from src.offline_models import HashingEmbedding, whitespace_tokenizer
+
+
+def test_histogram_percentiles_use_the_rolling_window():
+    histogram = RollingHistogram(window=100)
+    assert histogram.percentiles() == {}
+    for value in range(1, 201):
+        histogram.observe(value)
+    assert histogram.count == 200
+    assert histogram.sum == sum(range(1, 201))
+    assert histogram.percentiles() == {0.5: 151, 0.95: 196, 0.99: 200}
+
+
+def test_disabled_spans_record_nothing():
+    instrumentation = Instrumentation()
+    with instrumentation.span("retrieval") as span:
+        span.set(nodes=3)
+    assert span is instrumentation.span("synthesis")
+    assert instrumentation.snapshot() == []
+
+
+def test_exports_prometheus_text_and_csv(tmp_path):
+    instrumentation = Instrumentation(enabled=True)
+    for nodes in (1, 2, 3):
+        instrumentation.record_span("retrieval", 0.5, nodes=nodes)
+    text = instrumentation.prometheus_text()
+    assert 'moviemate_nodes{stage="retrieval",quantile="0.5"} 2' in text
+    assert 'moviemate_nodes_count{stage="retrieval"} 3' in text
+    assert 'moviemate_seconds_sum{stage="retrieval"} 1.5' in text
+
+    path = tmp_path / "metrics.csv"
+    instrumentation.export_csv(str(path))
+    with open(path, newline="") as f:
+        rows = {row["metric"]: row for row in csv.DictReader(f)}
+    assert set(rows) == {"nodes", "seconds"}
+    assert (rows["nodes"]["stage"], rows["nodes"]["count"], rows["nodes"]["p99"]) == ("retrieval", "3", "3")
+
+
+def test_embedding_tokens_of_a_wrapped_model_are_counted_once():
+    instrumentation = Instrumentation(enabled=True)
+    callback_manager = CallbackManager([instrumentation.callback_handler(tokenizer=whitespace_tokenizer)])
+    embed_model = CachedEmbedding(
+        HashingEmbedding(dimensions=8, callback_manager=callback_manager),
+        cache_dir=tempfile.mkdtemp(),
+        autosave=False,
+        callback_manager=callback_manager,
+    )
+    embed_model.get_text_embedding_batch(["a detective story", "a heist"])
+    embed_model.get_query_embedding("who directed heat")
+    rows = {row["metric"]: row for row in instrumentation.snapshot()}
+    assert rows["embedding_tokens"]["count"] == 2
+    assert rows["embedding_tokens"]["sum"] == 8
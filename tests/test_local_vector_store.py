@@ -0,0 +1,109 @@
+import tracemalloc
+
+import numpy as np
+import pytest
+from llama_index.core.schema import TextNode
+from llama_index.core.vector_stores.types import VectorStoreQuery
+from src.data_indexer import DataIndexer
+from src.local_vector_store import LocalVectorStore
+from tests.conftest import make_nodes
+
+
+def query(store, embed_model, text, top_k=5, **kwargs):
+    return store.query(
+        VectorStoreQuery(query_embedding=embed_model.get_query_embedding(text), similarity_top_k=top_k), **kwargs
+    )
+
+
+@pytest.mark.parametrize("quantize", [False, True])
+def test_shortlist_on_fresh_index(embed_model, nodes, quantize):
+    store = LocalVectorStore()
+    indexer = DataIndexer(
+        dataset_name="movies", embedding_dimension=64, embed_model=embed_model, vector_store=store,
+        shortlist_dimensions=16, quantize_shortlist=quantize,
+    )
+    assert store.shortlist_dimensions == 16
+    indexer.add_to_vector_store(nodes[:9], batch_size=4)
+    indexer.add_to_vector_store(nodes[9:])
+    assert store.shortlist_dimensions == 16
+    assert store.nbytes["shortlist"] > 0
+
+    exact = query(store, embed_model, "a science fiction story directed by Ridley Scott")
+    two_stage = query(store, embed_model, "a science fiction story directed by Ridley Scott", shortlist_k=len(nodes) - 1)
+    assert len(two_stage.nodes) == 5
+    assert set(two_stage.ids) & set(exact.ids)
+
+
+def test_persisted_shortlist_round_trip(tmp_path, embed_model, nodes):
+    store = LocalVectorStore()
+    store.build_shortlist(16, quantize=True)
+    store.add(nodes)
+    store.persist(str(tmp_path))
+    loaded = LocalVectorStore(persist_dir=str(tmp_path))
+    assert loaded.shortlist_dimensions == 16
+    text = "a thriller story directed by Bong Joon Ho"
+    assert query(loaded, embed_model, text, shortlist_k=10).ids == query(store, embed_model, text, shortlist_k=10).ids
+    np.testing.assert_array_equal(np.asarray(loaded._vectors), np.asarray(store._vectors))
+
+
+def test_concurrent_upserts_keep_rows_aligned(embed_model):
+    nodes = make_nodes(embed_model, chunks_per_movie=40)
+    store = LocalVectorStore()
+    store.build_shortlist(16)
+    indexer = DataIndexer(dataset_name="movies", embedding_dimension=64, embed_model=embed_model, vector_store=store)
+    assert indexer.add_to_vector_store(nodes, batch_size=3, num_workers=8) == []
+    assert len(store) == len(nodes)
+    for node, stored in zip(nodes, store.get_nodes([node.node_id for node in nodes])):
+        assert stored.node_id == node.node_id
+        np.testing.assert_allclose(stored.embedding, node.embedding, rtol=1e-6)
+    low, _ = LocalVectorStore._encode_shortlist(np.asarray([node.embedding for node in nodes]), 16, False)
+    np.testing.assert_allclose(store._shortlist[[store._rows[node.node_id] for node in nodes]], low, rtol=1e-5)
+
+
+def test_add_after_load_and_delete(tmp_path, embed_model, nodes):
+    store = LocalVectorStore()
+    store.add(nodes[:6])
+    store.persist(str(tmp_path))
+    loaded = LocalVectorStore(persist_dir=str(tmp_path))
+    loaded.add(nodes[6:])
+    loaded.delete_nodes([nodes[0].node_id])
+    assert len(loaded) == len(nodes) - 1
+    assert nodes[0].node_id not in query(loaded, embed_model, nodes[0].text, top_k=len(nodes)).ids
+    loaded.delete_nodes([node.node_id for node in nodes])
+    loaded.persist()
+    assert len(LocalVectorStore(persist_dir=str(tmp_path))) == 0
+
+
+def random_store(count=20000, dimensions=128, shortlist=None):
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((count, dimensions)).astype(np.float32)
+    store = LocalVectorStore()
+    if shortlist:
+        store.build_shortlist(shortlist, quantize=True)
+    store.add([
+        TextNode(id_=str(i), text="", metadata={"parity": i % 2, "rare": i % 1000 == 0}, embedding=vector.tolist())
+        for i, vector in enumerate(vectors)
+    ])
+    return store, vectors
+
+
+def test_queries_match_brute_force_without_copying_the_matrix():
+    store, vectors = random_store(shortlist=32)
+    store.delete_nodes(["3", "5"])
+    query_embedding = vectors[3] + vectors[7]
+    expected = [str(i) for i in np.argsort(-(vectors @ query_embedding)) if i not in (3, 5)][:5]
+    request = VectorStoreQuery(query_embedding=query_embedding.tolist(), similarity_top_k=5)
+
+    tracemalloc.start()
+    result = store.query(request)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    assert result.ids == expected
+    assert peak < vectors.nbytes / 4
+
+    assert store.query(request, shortlist_k=2000).ids[0] == expected[0]
+    ranking = np.argsort(-(vectors @ query_embedding))
+    odd = store.query(request, pinecone_query_filters={"parity": 1})
+    assert odd.ids == [str(i) for i in ranking if i % 2 and i not in (3, 5)][:5]
+    rare = store.query(request, pinecone_query_filters={"rare": True})
+    assert rare.ids == [str(i) for i in ranking if i % 1000 == 0][:5]
@@ -0,0 +1,49 @@
+from src.metadata_index import MovieMetadataIndex
+
+
+def titles(index, nodes, filters):
+    node_ids = set(index.node_ids(index.lookup(filters)))
+    return {node.metadata["title"] for node in nodes if node.node_id in node_ids}
+
+
+def test_name_in_cast_and_directors_matches_either_role(nodes):
+    for node in nodes:
+        if node.metadata["title"] == "Heat":
+            node.metadata["cast"] = ["Al Pacino", "Ridley Scott"]
+    index = MovieMetadataIndex.from_nodes(nodes)
+    filters = index.extract_filters("Which movies feature Ridley Scott?")
+    assert filters == {"$or": [{"directors": "Ridley Scott"}, {"cast": "Ridley Scott"}]}
+    assert titles(index, nodes, filters) == {"Heat", "Blade Runner", "Alien"}
+
+    filters = index.extract_filters("Movies with Ridley Scott and Al Pacino")
+    assert titles(index, nodes, filters) == {"Heat"}
+
+
+def test_from_year_matches_the_year(nodes):
+    index = MovieMetadataIndex.from_nodes(nodes)
+    filters = index.extract_filters("Which science fiction movies are from 1982?")
+    assert filters["release_year"] == {"$eq": 1982}
+    assert titles(index, nodes, filters) == {"Blade Runner"}
+    assert index.extract_filters("Movies released since 1995")["release_year"] == {"$gte": 1995}
+
+
+def test_in_and_from_compare_only_years(nodes):
+    for node in nodes:
+        node.metadata["runtime"] = 90 if node.metadata["title"] == "Heat" else 120
+    index = MovieMetadataIndex.from_nodes(nodes)
+    assert "runtime" not in index.extract_filters("Can I watch a thriller in 90 minutes?")
+    assert index.extract_filters("Korean movies in 2003")["release_year"] == {"$eq": 2003}
+    assert index.extract_filters("Movies under 100 minutes")["runtime"] == {"$lt": 100}
+
+
+def test_every_named_person_must_match(nodes):
+    for node in nodes:
+        if node.metadata["title"] == "Memories of Murder":
+            node.metadata["cast"] = ["Song Kang-ho", "Al Pacino"]
+    index = MovieMetadataIndex.from_nodes(nodes)
+    filters = index.extract_filters("Al Pacino and Robert De Niro movies")
+    assert filters == {"$and": [{"cast": "Robert De Niro"}, {"cast": "Al Pacino"}]}
+    assert titles(index, nodes, filters) == {"Heat"}
+
+    filters = index.extract_filters("Movies directed by Bong Joon Ho with Al Pacino")
+    assert titles(index, nodes, filters) == {"Memories of Murder"}
@@ -0,0 +1,80 @@
+import numpy as np
+from src.movie_graph import MovieGraph, compute_neighbors
+
+
+def brute_force_neighbors(vectors, k):
+    scores = vectors @ vectors.T
+    np.fill_diagonal(scores, -np.inf)
+    neighbors = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+    return neighbors, np.take_along_axis(scores, neighbors, axis=1)
+
+
+def movie_vectors(nodes):
+    """
+    Average and normalise the chunk embeddings of each movie, keyed by title.
+    """
+    vectors = {}
+    for node in nodes:
+        vectors.setdefault(node.metadata["title"], []).append(node.embedding)
+    vectors = {title: np.mean(embeddings, axis=0) for title, embeddings in vectors.items()}
+    return {title: vector / np.linalg.norm(vector) for title, vector in vectors.items()}
+
+
+def expected_scores(nodes, title, keep=lambda title: True):
+    vectors = movie_vectors(nodes)
+    return {other: float(vectors[other] @ vectors[title]) for other in vectors if other != title and keep(other)}
+
+
+def assert_top_k(movies, expected, k):
+    """
+    Check that the movies are the `k` best of the expected scores, allowing ties to come in any order.
+    """
+    best = sorted(expected.values(), reverse=True)[:k]
+    np.testing.assert_allclose([movie["score"] for movie in movies], best, rtol=1e-5)
+    for movie in movies:
+        assert np.isclose(movie["score"], expected[movie["title"]], rtol=1e-5)
+
+
+def test_blocked_neighbors_match_brute_force():
+    vectors = np.random.default_rng(0).normal(size=(37, 16)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    neighbors, scores = compute_neighbors(vectors, k=5, block_size=8)
+    expected_neighbors, expected_scores = brute_force_neighbors(vectors, 5)
+    np.testing.assert_array_equal(neighbors, expected_neighbors)
+    np.testing.assert_allclose(scores, expected_scores, rtol=1e-6)
+
+
+def test_similar_movies_match_brute_force(nodes, tmp_path):
+    graph = MovieGraph.from_nodes(nodes, k=3, block_size=2)
+    for title in ("Parasite", "Heat", "Alien"):
+        assert_top_k(graph.similar_movies(title, k=3), expected_scores(nodes, title), 3)
+    assert graph.similar_movies("tt0000003", k=1)[0]["imdb_id"] == graph.similar_movies("heat", k=1)[0]["imdb_id"]
+
+    graph.persist(str(tmp_path))
+    loaded = MovieGraph.load(str(tmp_path))
+    assert loaded.similar_movies("Parasite", k=3) == graph.similar_movies("Parasite", k=3)
+
+
+def test_filters_beyond_the_stored_neighbors_are_scored_exhaustively(nodes):
+    graph = MovieGraph.from_nodes(nodes, k=1)
+    genres = {node.metadata["title"]: node.metadata["genres"] for node in nodes}
+    movies = graph.similar_movies("Alien", k=2, filters={"genres": "Thriller"})
+    assert_top_k(movies, expected_scores(nodes, "Alien", keep=lambda title: "Thriller" in genres[title]), 2)
+
+
+def test_tool_output(nodes):
+    graph = MovieGraph.from_nodes(nodes, k=3)
+    tool = graph.as_tool(k=2)
+    lines = tool.call(title="Parasite").content.splitlines()
+    assert lines == [
+        f"{movie['title']} (similarity {movie['score']:.2f})" for movie in graph.similar_movies("Parasite", k=2)
+    ]
+    assert_top_k(graph.similar_movies("Parasite", k=2), expected_scores(nodes, "Parasite"), 2)
+
+    output = tool.call(title="Alien", count=5, genre="science fiction").content
+    assert output.splitlines()[0].startswith("Blade Runner (similarity ")
+    assert len(output.splitlines()) == 1
+
+    assert tool.call(title="Heat", min_year=2000, max_year=2001).content.startswith("Amelie (similarity ")
+    assert tool.call(title="Heat", min_rating=9.0).content == "No similar movies matching the criteria were found for 'Heat'."
+    assert tool.call(title="Vertigo").content == "No movie titled 'Vertigo' was found; use the query engine tool instead."
@@ -0,0 +1,108 @@
+import asyncio
+import gc
+import time
+from types import SimpleNamespace
+from llama_index.core import QueryBundle
+from llama_index.core.vector_stores.utils import node_to_metadata_dict
+from llama_index.vector_stores.pinecone import PineconeVectorStore
+import numpy as np
+import pytest
+from src.bm25_index import BM25Index
+from src.local_vector_store import LocalVectorStore, matches_filters
+from src.metadata_index import MovieMetadataIndex
+from src.pinecone_retriever import PineconeRetriever
+
+
+class FakePineconeIndex:
+    """
+    An in-memory stand-in for a Pinecone index, answering `query` like the Pinecone client.
+    """
+
+    def __init__(self, nodes, latency=0.0):
+        self.queries = 0
+        self._latency = latency
+        self._records = [
+            (node.node_id, np.asarray(node.embedding), node_to_metadata_dict(node, remove_text=False, flat_metadata=False))
+            for node in nodes
+        ]
+
+    def query(self, vector, top_k, filter=None, **kwargs):
+        self.queries += 1
+        time.sleep(self._latency)
+        matches = [
+            SimpleNamespace(id=node_id, score=float(values @ np.asarray(vector)), values=values.tolist(), metadata=metadata)
+            for node_id, values, metadata in self._records
+            if matches_filters(metadata, filter or {})
+        ]
+        return SimpleNamespace(matches=sorted(matches, key=lambda match: -match.score)[:top_k])
+
+
+def test_direct_fetch_ranks_and_caps_nodes(embed_model, nodes):
+    store = LocalVectorStore()
+    store.add(nodes)
+    retriever = PineconeRetriever(
+        vector_store=store, embed_model=embed_model, similarity_top_k=2,
+        metadata_index=MovieMetadataIndex.from_nodes(nodes),
+    )
+    question = "Which thriller movies did Bong Joon Ho direct in 2019?"
+    results = retriever.retrieve(question)
+    assert len(results) == 2
+    assert {result.node.metadata["title"] for result in results} == {"Parasite"}
+    query_embedding = np.asarray(embed_model.get_query_embedding(question))
+    expected = sorted((float(np.asarray(node.embedding) @ query_embedding) for node in nodes[:3]), reverse=True)[:2]
+    assert [result.score for result in results] == pytest.approx(expected)
+
+
+def test_pinecone_falls_back_to_filtered_search(embed_model, nodes):
+    index = FakePineconeIndex(nodes)
+    retriever = PineconeRetriever(
+        vector_store=PineconeVectorStore(pinecone_index=index), embed_model=embed_model, similarity_top_k=2,
+        metadata_index=MovieMetadataIndex.from_nodes(nodes),
+    )
+    question = "Which thriller movies did Bong Joon Ho direct in 2019?"
+    results = retriever.retrieve(question)
+    assert [result.node.metadata["title"] for result in results] == ["Parasite", "Parasite"]
+    assert index.queries == 1
+    results = asyncio.run(retriever.aretrieve(QueryBundle(question)))
+    assert [result.node.metadata["title"] for result in results] == ["Parasite", "Parasite"]
+    assert index.queries == 2
+
+
+def test_concurrent_pinecone_queries_do_not_block_the_event_loop(embed_model, nodes):
+    index = FakePineconeIndex(nodes, latency=0.2)
+    retriever = PineconeRetriever(vector_store=PineconeVectorStore(pinecone_index=index), embed_model=embed_model, similarity_top_k=4)
+
+    async def load():
+        start = time.perf_counter()
+        results = await asyncio.gather(*(retriever.aretrieve(QueryBundle(f"movie {i}")) for i in range(8)))
+        return results, time.perf_counter() - start
+
+    results, elapsed = asyncio.run(load())
+    assert index.queries == 8
+    assert all(len(result) == 4 for result in results)
+    assert elapsed < 8 * 0.2 / 2
+
+
+def test_hybrid_search_applies_filters_before_ranking(embed_model, nodes):
+    bm25_index = BM25Index.from_nodes(nodes)
+    results = bm25_index.search("story directed", top_k=2, filters={"directors": "Ridley Scott", "release_year": {"$lt": 1980}})
+    assert [result.node.metadata["title"] for result in results] == ["Alien", "Alien"]
+    assert bm25_index.search("story directed", top_k=2, filters={"original_language": "de"}) == []
+
+    retriever = PineconeRetriever(vector_store=LocalVectorStore(), embed_model=embed_model, query_mode="hybrid", bm25_index=bm25_index)
+    executor = retriever._sparse_executor
+    del retriever
+    gc.collect()
+    assert executor._shutdown
+
+
+def test_shortlist_k_requires_a_local_shortlist(embed_model, nodes):
+    with pytest.raises(ValueError):
+        PineconeRetriever(vector_store=PineconeVectorStore(pinecone_index=FakePineconeIndex(nodes)), shortlist_k=10)
+    store = LocalVectorStore()
+    store.add(nodes)
+    with pytest.raises(ValueError):
+        PineconeRetriever(vector_store=store, shortlist_k=10)
+    store.build_shortlist(16)
+    retriever = PineconeRetriever(vector_store=store, embed_model=embed_model, similarity_top_k=2, shortlist_k=10)
+    assert len(retriever.retrieve("a science fiction story directed by Ridley Scott")) == 2
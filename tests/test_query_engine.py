@@ -0,0 +1,124 @@
+import asyncio
+from llama_index.core import QueryBundle
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.base.response.schema import AsyncStreamingResponse
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.response_synthesizers import ResponseMode
+from src.answer_cache import SemanticAnswerCache
+from src.instrumentation import metrics
+from src.local_vector_store import LocalVectorStore
+from src.metadata_index import MovieMetadataIndex
+from src.offline_models import HashingEmbedding, StubLLM
+from src.pinecone_retriever import PineconeRetriever
+from src.query_engine import EnhancedQueryEngine
+
+
+class QueryRecordingEmbedding(BaseEmbedding):
+    """
+    A hashing embedding without a query batch API, recording the questions embedded as queries.
+    """
+
+    _hashing: HashingEmbedding = PrivateAttr(default_factory=lambda: HashingEmbedding(dimensions=64))
+    _queries: list = PrivateAttr(default_factory=list)
+
+    def _get_query_embedding(self, query):
+        return self._hashing.get_query_embedding(query)
+
+    async def _aget_query_embedding(self, query):
+        self._queries.append(query)
+        return await self._hashing.aget_query_embedding(query)
+
+    def _get_text_embedding(self, text):
+        return self._hashing.get_text_embedding(text)
+
+
+def make_engine(nodes, embed_model, answer_cache=None, metadata_index=None, streaming=False):
+    store = LocalVectorStore()
+    store.add(nodes)
+    return EnhancedQueryEngine(
+        retriever=PineconeRetriever(
+            vector_store=store, embed_model=embed_model, similarity_top_k=3, metadata_index=metadata_index,
+        ),
+        llm=StubLLM(),
+        streaming=streaming,
+        response_mode=ResponseMode.COMPACT,
+        answer_cache=answer_cache,
+    )
+
+
+def test_query_batch_answers_only_repeated_questions_once(nodes):
+    embed_model = HashingEmbedding(dimensions=64)
+    engine = make_engine(nodes, embed_model)
+    questions = [
+        "In the movie Heat, who plays the detective?",
+        "in the movie  heat, who plays the detective?",
+        "In the movie Alien, who plays the detective?",
+    ]
+    answers = dict(engine.query_batch(questions))
+    assert sorted(answers) == [0, 1, 2]
+    assert answers[0] is answers[1]
+    assert answers[2] is not answers[0]
+    assert embed_model.calls == 1
+
+
+def test_query_batch_embeds_one_query_at_a_time_without_a_batch_api(nodes):
+    embed_model = QueryRecordingEmbedding()
+    engine = make_engine(nodes, embed_model)
+    questions = ["Who directed Heat?", "who directed heat?", "Who directed Alien?"]
+    assert sorted(dict(engine.query_batch(questions))) == [0, 1, 2]
+    assert sorted(embed_model._queries) == sorted([questions[0], questions[2]])
+
+
+def test_answer_cache_with_its_own_embedding_model(nodes, embed_model):
+    cache = SemanticAnswerCache(HashingEmbedding(dimensions=32))
+    engine = make_engine(nodes, embed_model, answer_cache=cache)
+    questions = ["Who directed Parasite?", "Who directed Alien?"]
+    engine.custom_query(questions[0])
+    list(engine.query_batch(questions))
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_answer_cache_keys_include_extracted_filters(nodes, embed_model):
+    cache = SemanticAnswerCache(embed_model, similarity_threshold=0.8)
+    engine = make_engine(nodes, embed_model, answer_cache=cache, metadata_index=MovieMetadataIndex.from_nodes(nodes))
+    engine.custom_query("Which movie did Ridley Scott direct in 1982?")
+    response = engine.custom_query("Which movie did Ridley Scott direct in 1979?")
+    assert (cache.hits, cache.misses) == (0, 2)
+    assert {node.node.metadata["title"] for node in response.source_nodes} == {"Alien"}
+    engine.custom_query("Which movie did Ridley Scott direct in 1979 ?")
+    assert cache.hits == 1
+
+
+def test_aquery_uses_the_base_query_bundle_hook(nodes, embed_model):
+    engine = make_engine(nodes, embed_model)
+    response = asyncio.run(engine.aquery(QueryBundle("Who directed Heat?")))
+    assert response.response == StubLLM().answer
+    assert len(response.source_nodes) == 3
+
+
+def test_answer_cache_records_and_replays_async_streams(nodes, embed_model):
+    cache = SemanticAnswerCache(embed_model)
+    engine = make_engine(nodes, embed_model, answer_cache=cache, streaming=True)
+
+    async def ask():
+        response = await engine.acustom_query("Who directed Heat?")
+        assert isinstance(response, AsyncStreamingResponse)
+        return "".join([token async for token in response.async_response_gen()])
+
+    assert asyncio.run(ask()) == StubLLM().answer
+    assert asyncio.run(ask()) == StubLLM().answer
+    assert cache.stats()["entries"] == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_async_streaming_with_metrics_enabled(nodes, embed_model):
+    engine = make_engine(nodes, embed_model, streaming=True)
+    metrics.enable()
+
+    async def ask():
+        response = await engine.acustom_query("Who directed Heat?")
+        return "".join([token async for token in response.async_response_gen()])
+
+    assert asyncio.run(ask()) == StubLLM().answer
+    stages = {(row["metric"], row["stage"]) for row in metrics.snapshot()}
+    assert ("time_to_first_token", "synthesis.stream") in stages
@@ -0,0 +1,15 @@
+from src.embedding_cache import CachedEmbedding
+from src.offline_models import HashingEmbedding
+from src.startup import StartupProfile, warm_up
+
+
+def test_warm_up_bypasses_the_embedding_cache(tmp_path):
+    model = HashingEmbedding(dimensions=8)
+    embed_model = CachedEmbedding(embed_model=model, cache_dir=str(tmp_path), autosave=False)
+    embed_model.get_query_embedding("warm up")
+    assert model.calls == 1
+
+    profile = StartupProfile()
+    warm_up(embed_model=embed_model, background=False, profile=profile)
+    assert model.calls == 2
+    assert "warmup.embedding" in [phase["phase"] for phase in profile.report()]